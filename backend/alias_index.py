@@ -0,0 +1,219 @@
+import os
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+ALIAS_DB_PATH = os.environ.get("ALIAS_DB_PATH", "cache/aliases.sqlite")
+# An alias resolves once its best SKU has at least this much net weight and beats the
+# runner-up; each correcting appointment adds 1 and each overruled SKU loses 1, so the
+# default needs two appointments to agree before one edit changes every later match.
+ALIAS_MIN_WEIGHT = float(os.environ.get("ALIAS_MIN_WEIGHT", "2"))
+ALIAS_REFRESH_SECONDS = 1.0
+DATA_FILE = "prescriptions.csv"
+
+# Investigation lines are keyed by the pipeline group used in match_single_entry.
+LINE_KINDS = [("medicines", "medicine"), ("labtests", "lab"), ("radiology", "radiology"), ("procedures", "procedure")]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS corrections (
+    appointment_id TEXT NOT NULL, kind TEXT NOT NULL, alias TEXT NOT NULL, sku_code TEXT NOT NULL,
+    label TEXT NOT NULL, weight REAL NOT NULL, source TEXT NOT NULL, updated REAL NOT NULL,
+    PRIMARY KEY (appointment_id, kind, alias, sku_code)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# === Correction Mining ===
+def line_label(kind, line):
+    return line.get("medicine_name", "") if kind == "medicine" else line.get("matched", "")
+
+def line_name(kind, line):
+    """The extracted name a line was matched from; SKU, dosage and type edits leave it alone."""
+    if kind == "medicine":
+        name = line.get("raw_medicine_name") or line.get("medicine_name")
+    else:
+        name = line.get("test_name") or line.get("procedure_name") or line.get("name")
+    return " ".join(str(name or "").lower().split())
+
+def pair_lines(kind, old_lines, new_lines):
+    """(old, new) pairs of the same line in two versions: by extracted name in order of
+    appearance, then lines left over on both sides by position."""
+    old_lines = [line if isinstance(line, dict) else None for line in old_lines or []]
+    new_lines = [line if isinstance(line, dict) else None for line in new_lines or []]
+    by_name = {}
+    for i, line in enumerate(old_lines):
+        if line is not None and line_name(kind, line):
+            by_name.setdefault(line_name(kind, line), []).append(i)
+    paired_old, pairs = set(), {}
+    for j, line in enumerate(new_lines):
+        candidates = by_name.get(line_name(kind, line)) if line is not None else None
+        if candidates:
+            pairs[j] = candidates.pop(0)
+            paired_old.add(pairs[j])
+    for j, line in enumerate(new_lines):
+        if line is not None and j not in pairs and j < len(old_lines) and j not in paired_old and old_lines[j] is not None:
+            pairs[j] = j
+    return [(old_lines[i], new_lines[j]) for j, i in sorted(pairs.items())]
+
+def diff_corrections(old, new, alias_key):
+    """(kind, alias, sku_code, label, weight) for every line whose SKU changed between versions.
+
+    alias_key(kind, line) returns the key the matcher would look the line up under; it is
+    taken from the new line, so an edit that fixes the dosage and the SKU together teaches
+    the corrected line's key.
+    """
+    corrections = []
+    for section, kind in LINE_KINDS:
+        for old_line, new_line in pair_lines(kind, (old or {}).get(section), (new or {}).get(section)):
+            key = alias_key(kind, new_line)
+            old_sku = str(old_line.get("sku_code") or "")
+            new_sku = str(new_line.get("sku_code") or "")
+            if key and new_sku and new_sku != old_sku:
+                corrections.append((kind, key, new_sku, line_label(kind, new_line), 1.0))
+                if old_sku:
+                    corrections.append((kind, key, old_sku, "", -1.0))
+    return corrections
+
+# === Weighted Alias Index ===
+# Corrections live in SQLite (one row per appointment, alias and SKU, so re-saving the
+# same edit does not add weight). Lookups hit an in-memory map of resolved aliases,
+# reloaded when another process commits new corrections. Alias keys are normalized text,
+# so the table records the normalizer version that built them: a table built under other
+# rules is stale, answers no lookups and is re-keyed by `python alias_index.py --backfill`.
+class AliasIndex:
+    def __init__(self, path=ALIAS_DB_PATH, normalizer_version=None):
+        self.path = path
+        self.normalizer_version = normalizer_version
+        self.enabled = True
+        self.stale = False
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        if normalizer_version:
+            self._conn.execute("INSERT OR IGNORE INTO meta VALUES ('normalizer_version', ?)", (normalizer_version,))
+        self._conn.commit()
+        self._aliases = {}
+        self._data_version = None
+        self._checked = 0.0
+        self._reload()
+
+    def _reload(self):
+        rows = self._conn.execute(
+            "SELECT kind, alias, sku_code, MAX(label), SUM(weight) FROM corrections GROUP BY kind, alias, sku_code"
+        ).fetchall()
+        ranked = {}
+        for kind, alias, sku_code, label, weight in rows:
+            ranked.setdefault((kind, alias), []).append((weight, sku_code, label))
+        aliases = {}
+        for key, options in ranked.items():
+            options.sort(reverse=True)
+            weight, sku_code, label = options[0]
+            runner_up = options[1][0] if len(options) > 1 else 0.0
+            if weight >= ALIAS_MIN_WEIGHT and weight > runner_up:
+                aliases[key] = (sku_code, label, weight)
+        stored = self._conn.execute("SELECT value FROM meta WHERE key = 'normalizer_version'").fetchone()
+        stale = bool(self.normalizer_version) and stored is not None and stored[0] != self.normalizer_version
+        if stale and not self.stale:
+            logger.warning(f"Alias table {self.path} was built by normalizer {stored[0]}, not "
+                           f"{self.normalizer_version}; learned aliases are off until it is re-keyed with --backfill")
+        self.stale = stale
+        self._aliases = {} if stale else aliases
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self._checked = time.monotonic()
+
+    def lookup(self, kind, alias):
+        """(sku_code, label, weight) for a confirmed alias, else None."""
+        if not self.enabled or not alias:
+            return None
+        if time.monotonic() - self._checked > ALIAS_REFRESH_SECONDS:
+            with self._lock:
+                if self._conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                    self._reload()
+                self._checked = time.monotonic()
+        return self._aliases.get((kind, alias))
+
+    def record(self, appointment_id, corrections, source="pharmacist"):
+        if not corrections:
+            return 0
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO corrections VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(appointment_id, kind, alias, sku_code, label, weight, source, now)
+                 for kind, alias, sku_code, label, weight in corrections]
+            )
+        with self._lock:
+            self._reload()
+        return len(corrections)
+
+    def clear(self, source):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM corrections WHERE source = ?", (source,))
+        with self._lock:
+            self._reload()
+
+    def reset(self):
+        """Drop every correction and stamp the table with this index's normalizer version."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM corrections")
+            if self.normalizer_version:
+                self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('normalizer_version', ?)",
+                                   (self.normalizer_version,))
+        with self._lock:
+            self._reload()
+
+    def __len__(self):
+        return len(self._aliases)
+
+# === Backfill ===
+# Only human edits teach aliases: each saved revision of a prescription (see
+# prescription_revisions.py) is diffed against the one before it. Re-running today's
+# matcher over history would instead pin every change in the cascade as a correction.
+def backfill(data_file=DATA_FILE):
+    import pandas as pd
+    import matcher_v2
+    from prescription_revisions import PrescriptionRevisions
+
+    index = matcher_v2.alias_index
+    revisions = PrescriptionRevisions()
+    # A stale table's live corrections are keyed under old rules too; the revisions hold
+    # them all, so everything is rebuilt under the current normalizer.
+    if index.stale:
+        index.reset()
+    else:
+        index.clear("backfill")
+    recorded = 0
+    appointment_ids = pd.read_csv(data_file, usecols=["appointment_id"])["appointment_id"].unique()
+    for appointment_id in appointment_ids:
+        previous = None
+        for entry in revisions.history(appointment_id):
+            current = revisions.document(appointment_id, entry["revision"])
+            if current is None:
+                continue
+            if previous is not None:
+                corrections = diff_corrections(previous["extracted"], current["extracted"], matcher_v2.alias_key)
+                recorded += index.record(appointment_id, corrections, "backfill")
+            previous = current
+    return recorded
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Learned alias table from pharmacist corrections")
+    parser.add_argument("--backfill", action="store_true", help="mine corrections from the revision history")
+    parser.add_argument("--data-file", default=DATA_FILE)
+    args = parser.parse_args()
+
+    if args.backfill:
+        count = backfill(args.data_file)
+        print(f"Recorded {count} backfilled corrections into {ALIAS_DB_PATH}")
+    index = AliasIndex()
+    print(f"{len(index)} confirmed aliases in {ALIAS_DB_PATH}")
@@ -0,0 +1,238 @@
+import os
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: concurrent first starts may rebuild twice
+    fcntl = None
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+ANALYTICS_DB_PATH = os.environ.get("ANALYTICS_DB_PATH", "cache/analytics.sqlite")
+DATA_FILE = "prescriptions.csv"
+GROUPS = ("medicines", "labtests", "radiology", "procedures")
+REBUILD_CHUNK_ROWS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    appointment_id TEXT PRIMARY KEY, day TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS facts (
+    appointment_id TEXT NOT NULL, grp TEXT NOT NULL, sku_code TEXT NOT NULL,
+    match_reason TEXT NOT NULL, name TEXT NOT NULL, n INTEGER NOT NULL,
+    PRIMARY KEY (appointment_id, grp, sku_code, match_reason)
+);
+CREATE TABLE IF NOT EXISTS daily_counts (
+    day TEXT NOT NULL, grp TEXT NOT NULL, sku_code TEXT NOT NULL,
+    match_reason TEXT NOT NULL, n INTEGER NOT NULL,
+    PRIMARY KEY (grp, day, sku_code, match_reason)
+);
+CREATE TABLE IF NOT EXISTS daily_prescriptions (
+    day TEXT PRIMARY KEY, n INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sku_names (
+    grp TEXT NOT NULL, sku_code TEXT NOT NULL, name TEXT NOT NULL,
+    PRIMARY KEY (grp, sku_code)
+);
+"""
+
+# === Fact Extraction ===
+# One fact per (group, sku_code, match_reason) with its line count. Unmatched lines keep
+# an empty sku_code so they still show up in volume and reason mix.
+def item_name(group, item):
+    if group == "medicines":
+        return item.get("medicine_name", "")
+    return item.get("matched") or item.get("test_name") or item.get("procedure_name") or item.get("name", "")
+
+def prescription_facts(data):
+    counts = Counter()
+    names = {}
+    for group in GROUPS:
+        for item in data.get(group) or []:
+            if not isinstance(item, dict):
+                continue
+            key = (group, str(item.get("sku_code") or ""), item.get("match_reason") or "unmatched")
+            counts[key] += 1
+            names.setdefault(key, str(item_name(group, item) or ""))
+    return [(group, sku_code, reason, names[(group, sku_code, reason)], n)
+            for (group, sku_code, reason), n in counts.items()]
+
+def timestamp_day(timestamp):
+    try:
+        return datetime.fromisoformat(str(timestamp)).date().isoformat()
+    except ValueError:
+        return date.today().isoformat()
+
+# === Materialized Aggregates ===
+# Each prescription's facts are stored next to the rolled-up daily counts, so re-recording
+# an appointment (an edit) subtracts its old facts before adding the new ones. /stats
+# reads only the daily tables: its cost depends on the window, not on history length.
+class PrescriptionAnalytics:
+    def __init__(self, path=ANALYTICS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def record(self, appointment_id, timestamp, data):
+        """Fold one prescription into the aggregates, replacing any earlier version of it.
+
+        timestamp may be None for edits; the appointment keeps the day it was first recorded.
+        """
+        facts = prescription_facts(data)
+        with self._lock, self._conn:
+            cur = self._conn.cursor()
+            existing = cur.execute(
+                "SELECT day FROM appointments WHERE appointment_id = ?", (appointment_id,)
+            ).fetchone()
+            if existing:
+                day = existing[0]
+                old = cur.execute(
+                    "SELECT grp, sku_code, match_reason, n FROM facts WHERE appointment_id = ?", (appointment_id,)
+                ).fetchall()
+                cur.executemany(
+                    "UPDATE daily_counts SET n = n - ? WHERE grp = ? AND day = ? AND sku_code = ? AND match_reason = ?",
+                    [(n, grp, day, sku_code, reason) for grp, sku_code, reason, n in old]
+                )
+                cur.execute("DELETE FROM daily_counts WHERE day = ? AND n <= 0", (day,))
+                cur.execute("DELETE FROM facts WHERE appointment_id = ?", (appointment_id,))
+            else:
+                day = timestamp_day(timestamp) if timestamp else date.today().isoformat()
+                cur.execute("INSERT INTO appointments VALUES (?, ?)", (appointment_id, day))
+                cur.execute(
+                    "INSERT INTO daily_prescriptions VALUES (?, 1) ON CONFLICT(day) DO UPDATE SET n = n + 1", (day,)
+                )
+
+            cur.executemany("INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?)",
+                            [(appointment_id, *fact) for fact in facts])
+            cur.executemany(
+                "INSERT INTO daily_counts VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(grp, day, sku_code, match_reason) DO UPDATE SET n = n + excluded.n",
+                [(day, grp, sku_code, reason, n) for grp, sku_code, reason, _, n in facts]
+            )
+            cur.executemany(
+                "INSERT INTO sku_names VALUES (?, ?, ?) "
+                "ON CONFLICT(grp, sku_code) DO UPDATE SET name = excluded.name",
+                [(grp, sku_code, name) for grp, sku_code, _, name, _ in facts if sku_code and name]
+            )
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM appointments LIMIT 1").fetchone() is None
+
+    def rebuild_if_empty(self, data_file=DATA_FILE):
+        """Rebuild from history if nothing is stored yet; returns the count, or None if skipped.
+
+        Concurrent callers (several workers or deploy steps) serialize on a lock file next
+        to the database, so only the first one rebuilds.
+        """
+        with open(f"{self.path}.lock", "w") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            return self.rebuild(data_file) if self.is_empty() else None
+
+    def rebuild(self, data_file=DATA_FILE):
+        """Replay prescriptions.csv in bulk: facts are loaded in chunks, aggregates rolled up in SQL."""
+        appointments = 0
+        with self._lock, self._conn:
+            cur = self._conn.cursor()
+            for table in ("appointments", "facts", "daily_counts", "daily_prescriptions", "sku_names"):
+                cur.execute(f"DELETE FROM {table}")
+
+            if os.path.isfile(data_file) and os.path.getsize(data_file) > 0:
+                columns = ["appointment_id", "prescription_json", "timestamp"]
+                for chunk in pd.read_csv(data_file, usecols=columns, chunksize=REBUILD_CHUNK_ROWS):
+                    days, facts = {}, {}
+                    for appointment_id, payload, timestamp in chunk.itertuples(index=False):
+                        try:
+                            data = json.loads(payload)
+                        except (TypeError, ValueError):
+                            continue
+                        # A later row for the same appointment replaces the earlier one.
+                        days.setdefault(appointment_id, timestamp_day(timestamp))
+                        facts[appointment_id] = prescription_facts(data or {})
+                    cur.executemany("INSERT OR IGNORE INTO appointments VALUES (?, ?)", days.items())
+                    cur.executemany("DELETE FROM facts WHERE appointment_id = ?", [(a,) for a in facts])
+                    cur.executemany("INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?)",
+                                    [(a, *fact) for a, rows in facts.items() for fact in rows])
+
+            cur.execute(
+                "INSERT INTO daily_counts "
+                "SELECT a.day, f.grp, f.sku_code, f.match_reason, SUM(f.n) FROM facts f "
+                "JOIN appointments a USING (appointment_id) GROUP BY a.day, f.grp, f.sku_code, f.match_reason"
+            )
+            cur.execute("INSERT INTO daily_prescriptions SELECT day, COUNT(*) FROM appointments GROUP BY day")
+            cur.execute(
+                "INSERT INTO sku_names SELECT grp, sku_code, MAX(name) FROM facts "
+                "WHERE sku_code != '' AND name != '' GROUP BY grp, sku_code"
+            )
+            appointments = cur.execute("SELECT COUNT(*) FROM appointments").fetchone()[0]
+        return appointments
+
+    # === Queries ===
+    def stats(self, group="medicines", days=7, limit=10, today=None):
+        end = today or date.today()
+        start = (end - timedelta(days=days - 1)).isoformat()
+        end = end.isoformat()
+        with self._lock:
+            cur = self._conn.cursor()
+            top = cur.execute(
+                "SELECT c.sku_code, COALESCE(s.name, ''), SUM(c.n) AS total FROM daily_counts c "
+                "LEFT JOIN sku_names s ON s.grp = c.grp AND s.sku_code = c.sku_code "
+                "WHERE c.grp = ? AND c.day BETWEEN ? AND ? AND c.sku_code != '' "
+                "GROUP BY c.sku_code ORDER BY total DESC, c.sku_code LIMIT ?",
+                (group, start, end, limit)
+            ).fetchall()
+            volume = cur.execute(
+                "SELECT day, SUM(n) FROM daily_counts WHERE grp = ? AND day BETWEEN ? AND ? GROUP BY day ORDER BY day",
+                (group, start, end)
+            ).fetchall()
+            prescriptions = cur.execute(
+                "SELECT day, n FROM daily_prescriptions WHERE day BETWEEN ? AND ? ORDER BY day", (start, end)
+            ).fetchall()
+            reasons = cur.execute(
+                "SELECT day, match_reason, SUM(n) FROM daily_counts WHERE grp = ? AND day BETWEEN ? AND ? "
+                "GROUP BY day, match_reason ORDER BY day, match_reason",
+                (group, start, end)
+            ).fetchall()
+
+        return {
+            "group": group,
+            "from": start,
+            "to": end,
+            "prescriptions_per_day": [{"day": day, "count": n} for day, n in prescriptions],
+            "top_skus": [{"sku_code": code, "name": name, "count": n} for code, name, n in top],
+            "volume_per_day": [{"day": day, "count": n} for day, n in volume],
+            "match_reasons_per_day": [{"day": day, "match_reason": reason, "count": n} for day, reason, n in reasons],
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prescribing analytics aggregates")
+    parser.add_argument("--rebuild", action="store_true", help="replay the prescriptions CSV into the aggregates")
+    parser.add_argument("--if-empty", action="store_true", help="with --rebuild, only if no aggregates exist (deploy step)")
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--db", default=ANALYTICS_DB_PATH)
+    args = parser.parse_args()
+
+    analytics = PrescriptionAnalytics(args.db)
+    if args.rebuild and args.if_empty:
+        count = analytics.rebuild_if_empty(args.data_file)
+        print("Analytics already built in" if count is None else f"Rebuilt analytics from {count} prescriptions into", args.db)
+    elif args.rebuild:
+        print(f"Rebuilt analytics from {analytics.rebuild(args.data_file)} prescriptions into", args.db)
+    else:
+        print(json.dumps(analytics.stats(), indent=2))
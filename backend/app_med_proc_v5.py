@@ -2,23 +2,54 @@ import os
 import json
 import logging
 import pandas as pd
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
 from dotenv import load_dotenv
 from datetime import datetime
 import uuid
-import groq
+import copy
 import pickle
-from matcher_v2 import validate_medicine_names, validate_group_terms
+from llm_cache import LLMCache, make_key, normalize_text
+from smart_advice import get_smart_advice, prewarm_once
+from metrics import render_prometheus, PROMETHEUS_CONTENT_TYPE
+from upstream import groq_chat, init_deadlines
+from tracing import init_tracing, span
+from singleflight import SingleFlight
+from match_budget import request_budget, use_budget
+from catalog_sync import VersionedCatalog
+from analytics import PrescriptionAnalytics, GROUPS as ANALYTICS_GROUPS
+from search_index import PrescriptionSearch
+from prescription_export import SCHEMAS as EXPORT_TABLES, stream_table
+from response_cache import ResponseCache, dumps, negotiate, encoding_etag, JSON_CONTENT_TYPE
+from prescription_revisions import edit_lock, PrescriptionRevisions, apply_ops
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: CSV writes serialize within one process only
+    fcntl = None
+
+# === Matcher ===
+# With MATCHER_SOCKET set, matching runs in the shared matcher_service.py process and this
+# worker stays thin; otherwise the matcher is loaded in-process.
+MATCHER_SOCKET = os.environ.get("MATCHER_SOCKET")
+if MATCHER_SOCKET:
+    from matcher_client import MatcherClient
+    matcher = MatcherClient(MATCHER_SOCKET)
+else:
+    import matcher_v2 as matcher
 
 # === Setup ===
 app = Flask(__name__)
-CORS(app, origins="*")
+CORS(app, origins="*", expose_headers=["X-Trace-Id", "Server-Timing", "ETag", "X-Catalog-Version", "X-Match-Tier"])
+init_tracing(app)
+init_deadlines(app)
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
@@ -34,7 +65,36 @@ with open("faiss_cache/sku_list.pkl", "rb") as f:
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("Missing GROQ_API_KEY")
-groq_client = groq.Groq(api_key=GROQ_API_KEY)
+
+# === Extraction Cache ===
+# Bump EXTRACTION_PROMPT_VERSION whenever the extraction prompt changes.
+EXTRACTION_MODEL = "llama-3.3-70b-versatile"
+EXTRACTION_TEMPERATURE = 0.2
+EXTRACTION_PROMPT_VERSION = "v5"
+CACHE_BYPASS_HEADER = "X-Cache-Bypass"
+
+extraction_cache = LLMCache(
+    os.environ.get("EXTRACT_CACHE_PATH", "cache/extraction_cache.sqlite"),
+    max_entries=int(os.environ.get("EXTRACT_CACHE_MAX_ENTRIES", "20000")),
+    ttl_seconds=int(os.environ.get("EXTRACT_CACHE_TTL", str(30 * 24 * 3600))),
+    name="extraction"
+)
+
+# Identical prescriptions in flight at once share one extraction call; each caller gets
+# its own copy because matching mutates the result.
+extraction_flight = SingleFlight("extraction", clone=copy.deepcopy)
+
+def cache_bypassed(headers=None):
+    headers = request.headers if headers is None else headers
+    return headers.get(CACHE_BYPASS_HEADER, "").lower() in ("1", "true", "yes")
+
+def extraction_cache_key(prescription_text):
+    return make_key(
+        normalize_text(prescription_text),
+        EXTRACTION_PROMPT_VERSION,
+        EXTRACTION_MODEL,
+        EXTRACTION_TEMPERATURE
+    )
 
 # === Smart Precaution & Follow-up Route ===
 @app.route("/smart_advice", methods=["POST"])
@@ -47,26 +107,11 @@ def smart_advice():
         if not medicines:
             return jsonify({"precaution": "", "followup": ""})
 
-        med_list = ", ".join([med.get("medicine_name", "") for med in medicines])
-        prompt = f"""
-You are a clinical assistant.
-Given the diagnosis: {diagnosis} and the medicines: {med_list},
-Suggest:
-1. Precautions the patient should follow (separate into medical and non-medical).
-2. Follow-up advice (when the patient should return or retest, give medical test recommendation if relevant to diagnosis).
-3. Alert if any of the prescribed medicines are commonly associated with allergic reactions, and mention what symptoms to watch for.
-Respond in plain English.
-"""
-
-        completion = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=1024
-        )
-        response = completion.choices[0].message.content.strip()
+        advice, cached = get_smart_advice(diagnosis, medicines, bypass_cache=cache_bypassed())
 
-        return jsonify({"advice": response})
+        response = jsonify({"advice": advice})
+        response.headers["X-Advice-Cache"] = "hit" if cached else "miss"
+        return response
 
     except Exception as e:
         logger.error(f"Smart advice error: {e}")
@@ -74,22 +119,23 @@ Respond in plain English.
 
 DATA_FILE = "prescriptions.csv"
 
+# === Optional Smart Advice Pre-generation ===
+# Every worker starts the thread, but only the one holding the prewarm lock calls Groq.
+ADVICE_PREWARM_TOP = int(os.environ.get("ADVICE_PREWARM_TOP", "0"))
+if ADVICE_PREWARM_TOP > 0:
+    threading.Thread(
+        target=prewarm_once,
+        args=(DATA_FILE, ADVICE_PREWARM_TOP),
+        daemon=True
+    ).start()
+
 def generate_appointment_id():
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     short_uuid = str(uuid.uuid4())[:6]
     return f"APT-{timestamp}-{short_uuid}"
 
-@app.route("/extract", methods=["POST"])
-def extract_medicine():
-    try:
-        prescription_text = request.json.get("prescription", "")
-        if not prescription_text:
-            return jsonify({"error": "Prescription text is required"}), 400
-
-        appointment_id = generate_appointment_id()
-        timestamp = datetime.now().isoformat()
-
-        prompt = f"""Extract patient details, medicine information, and diagnostic tests, procedures from this prescription text:
+def extraction_request(prescription_text):
+    prompt = f"""Extract patient details, medicine information, and diagnostic tests, procedures from this prescription text:
 {prescription_text}
 
 Return the result as a valid JSON object only, without explanations, markdown formatting, or any additional text.
@@ -155,69 +201,191 @@ Rules:
 
 Return **only the JSON** object — no markdown, text, or explanations.
 """
-        print("[DEBUG] Prompt Sent to LLM:")
-        print(prompt)
+    print("[DEBUG] Prompt Sent to LLM:")
+    print(prompt)
 
-        completion = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.2,
-            max_tokens=3000
-        )
+    return {
+        "model": EXTRACTION_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": EXTRACTION_TEMPERATURE,
+        "max_tokens": 3000
+    }
 
-        response = completion.choices[0].message.content.strip()
+def parse_extraction_response(completion):
+    response = completion.choices[0].message.content.strip()
 
-        print("[DEBUG] LLM Response:")
-        print(response)
+    print("[DEBUG] LLM Response:")
+    print(response)
 
+    with span("llm.parse"):
         json_start = response.find("{")
         json_end = response.rfind("}")
         json_content = response[json_start:json_end + 1]
-        data = json.loads(json_content)
+        return json.loads(json_content)
+
+def run_extraction_llm(prescription_text):
+    completion = groq_chat("extraction", **extraction_request(prescription_text))
+    return parse_extraction_response(completion)
+
+def extract_coalesced(prescription_text, cache_key, bypass=False):
+    def extract():
+        data = run_extraction_llm(prescription_text)
+        extraction_cache.set(cache_key, data)
+        return data
+
+    recheck = None if bypass else (lambda: extraction_cache.get(cache_key))
+    return extraction_flight.do(cache_key, extract, recheck=recheck)
+
+# section -> (matcher group, stored name field, stored type field)
+SECTION_GROUPS = {
+    "labtests": ("lab", "test_name", "test_type"),
+    "radiology": ("radiology", "test_name", "test_type"),
+    "procedures": ("procedure", "procedure_name", "procedure_type"),
+}
+
+def match_section(section, items):
+    """Match one section's raw lines and return them in the stored shape."""
+    with span(f"match.{section}", count=len(items)):
+        if section == "medicines":
+            return matcher.validate_medicine_names(items)
+        group, name_key, type_key = SECTION_GROUPS[section]
+        matched = matcher.validate_group_terms(items, group)
+
+    for item in matched:
+        item[name_key] = item.pop("name", "")
+        item[type_key] = item.pop("type", "")
+    return matched
+
+def match_extraction(data):
+    for section in ("medicines", "labtests", "radiology", "procedures"):
+        data[section] = match_section(section, data.get(section, []))
+    return data
+
+def prescription_row(appointment_id, timestamp, data, prescription_text):
+    return {
+        "appointment_id": appointment_id,
+        "patient_name": data.get("patient", {}).get("name", ""),
+        "age": data.get("patient", {}).get("age", ""),
+        "gender": data.get("patient", {}).get("gender", ""),
+        "prescription_json": json.dumps(data),
+        "timestamp": timestamp,
+        "raw_text": prescription_text
+    }
+
+# Every write of the CSV (append or rewrite) holds this lock: a thread lock within the
+# process and a lock file between worker processes, so no write is lost to another's
+# read-modify-write.
+_persist_thread_lock = threading.Lock()
+
+@contextmanager
+def persist_lock():
+    with _persist_thread_lock, open(f"{DATA_FILE}.lock", "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def rewrite_data_file(df):
+    # Readers never see a half-written file: the new CSV replaces the old one in one rename.
+    df.to_csv(f"{DATA_FILE}.tmp", index=False)
+    os.replace(f"{DATA_FILE}.tmp", DATA_FILE)
+
+def append_prescription(row):
+    with span("persist.csv"), persist_lock():
+        if not os.path.isfile(DATA_FILE) or os.path.getsize(DATA_FILE) == 0:
+            rewrite_data_file(pd.DataFrame([row]))
+            return
 
-        data["medicines"] = validate_medicine_names(data.get("medicines", []))
-        data["labtests"] = validate_group_terms(data.get("labtests", []), "lab")
-        data["radiology"] = validate_group_terms(data.get("radiology", []), "radiology")
-        data["procedures"] = validate_group_terms(data.get("procedures", []), "procedure")
+        # Append in place when the header already has every column; rewrite only to add columns.
+        columns = pd.read_csv(DATA_FILE, nrows=0).columns
+        if set(row) <= set(columns):
+            pd.DataFrame([row]).reindex(columns=columns).to_csv(DATA_FILE, mode="a", header=False, index=False)
+        else:
+            df = pd.read_csv(DATA_FILE)
+            df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+            rewrite_data_file(df)
+
+# === Derived Stores ===
+# Analytics aggregates and the search index are side tables: a failed update is logged
+# and never fails the request. `python analytics.py --rebuild` and
+# `python search_index.py --rebuild` replay prescriptions.csv if they drift.
+prescription_analytics = PrescriptionAnalytics()
+prescription_search = PrescriptionSearch()
+
+# A fresh deployment (or a wiped cache/ directory) is built from the existing history once,
+# by the deploy step (`--rebuild --if-empty`, see the Procfile) or the dev server below, never
+# by each worker at import.
+def build_derived_stores():
+    for store in (prescription_analytics, prescription_search):
+        count = store.rebuild_if_empty(DATA_FILE)
+        if count is not None:
+            logger.info(f"Built {type(store).__name__} from {DATA_FILE}: {count} prescriptions")
+
+for store in (prescription_analytics, prescription_search):
+    if store.is_empty():
+        logger.warning(f"{type(store).__name__} at {store.path} is empty; run its --rebuild --if-empty step")
+
+def record_derived(appointment_id, timestamp, data, raw_text):
+    try:
+        with span("persist.analytics"):
+            prescription_analytics.record(appointment_id, timestamp, data)
+    except Exception as e:
+        logger.warning(f"Analytics update failed for {appointment_id}: {e}")
+    try:
+        with span("persist.search"):
+            prescription_search.index(appointment_id, timestamp, data, raw_text)
+    except Exception as e:
+        logger.warning(f"Search index update failed for {appointment_id}: {e}")
 
-        for item in data["labtests"]:
-            item["test_name"] = item.pop("name", "")
-            item["test_type"] = item.pop("type", "")
+# Each SKU a pharmacist changes on save teaches the matcher that raw name (see alias_index.py).
+def record_corrections(appointment_id, previous_json, extracted):
+    try:
+        previous = json.loads(previous_json) if isinstance(previous_json, str) else {}
+        count = matcher.record_corrections(appointment_id, previous, extracted)
+        if count:
+            logger.info(f"Learned {count} alias corrections from {appointment_id}")
+    except Exception as e:
+        logger.warning(f"Alias update failed for {appointment_id}: {e}")
 
-        for item in data["radiology"]:
-            item["test_name"] = item.pop("name", "")
-            item["test_type"] = item.pop("type", "")
+@app.route("/extract", methods=["POST"])
+def extract_medicine():
+    try:
+        prescription_text = request.json.get("prescription", "")
+        if not prescription_text:
+            return jsonify({"error": "Prescription text is required"}), 400
+        try:
+            budget = request_budget(request.headers, request.json)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-        for item in data["procedures"]:
-            item["procedure_name"] = item.pop("name", "")
-            item["procedure_type"] = item.pop("type", "")
+        appointment_id = generate_appointment_id()
+        timestamp = datetime.now().isoformat()
 
-        row = {
-            "appointment_id": appointment_id,
-            "patient_name": data.get("patient", {}).get("name", ""),
-            "age": data.get("patient", {}).get("age", ""),
-            "gender": data.get("patient", {}).get("gender", ""),
-            "prescription_json": json.dumps(data),
-            "timestamp": timestamp,
-            "raw_text": prescription_text
-        }
+        cache_key = extraction_cache_key(prescription_text)
+        bypass = cache_bypassed()
+        with span("cache.extraction"):
+            data = None if bypass else extraction_cache.get(cache_key)
+        cache_status = "hit" if data is not None else "miss"
+        if data is None:
+            data = extract_coalesced(prescription_text, cache_key, bypass)
+
+        with use_budget(budget):
+            data = match_extraction(data)
+        row = prescription_row(appointment_id, timestamp, data, prescription_text)
 
         print("[DEBUG] Final data sent to frontend:")
         print(json.dumps(data, indent=2))
 
+        append_prescription(row)
+        record_derived(appointment_id, timestamp, data, prescription_text)
 
-        if not os.path.isfile(DATA_FILE) or os.path.getsize(DATA_FILE) == 0:
-            df = pd.DataFrame([row])
-            df.to_csv(DATA_FILE, index=False)
-        else:
-            df = pd.read_csv(DATA_FILE)
-            df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
-            df.to_csv(DATA_FILE, index=False)
-
-        return jsonify({
+        response = jsonify({
             "appointment_id": appointment_id,
-            "result": data
+            "result": data,
+            "match_tier": budget.report()
         })
+        response.headers["X-Extraction-Cache"] = cache_status
+        response.headers["X-Match-Tier"] = budget.achieved
+        return response
     
     except Exception as e:
         logger.error(f"Extraction error: {e}")
@@ -227,20 +395,66 @@ Return **only the JSON** object — no markdown, text, or explanations.
 
 # Your /extract route is here
 
+# === Encoded Responses ===
+# Read-heavy GETs serve JSON bytes serialized and compressed once per resource version,
+# negotiated by Accept-Encoding. Prescription data is versioned by the data file's mtime
+# and size, so any write (including from another worker) invalidates it.
+response_cache = ResponseCache()
+_prescription_rows = (None, {})
+_prescription_rows_lock = threading.Lock()
+
+def encoded_response(body, etag=None, headers=None):
+    headers = dict(headers or {}, Vary="Accept-Encoding")
+    encoding, data = body.get(negotiate(request.accept_encodings))
+    if etag:
+        # Each encoding is its own representation, so a cache never swaps one for another.
+        etag = encoding_etag(etag, encoding)
+        headers.setdefault("Cache-Control", "no-cache")
+        headers["ETag"] = etag
+        if request.if_none_match.contains(etag.strip('"')):
+            return Response(status=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(data, mimetype=JSON_CONTENT_TYPE, headers=headers)
+
+def data_file_version():
+    if not os.path.isfile(DATA_FILE):
+        return "empty"
+    stat = os.stat(DATA_FILE)
+    return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+def prescription_rows(version):
+    """appointment_id -> (prescription_json, raw_text), parsed once per data file version."""
+    global _prescription_rows
+    if _prescription_rows[0] == version:
+        return _prescription_rows[1]
+    with _prescription_rows_lock:
+        if _prescription_rows[0] != version:
+            rows = {}
+            if version != "empty" and os.path.getsize(DATA_FILE) > 0:
+                df = pd.read_csv(DATA_FILE, usecols=["appointment_id", "prescription_json", "raw_text"])
+                rows = {aid: (payload, raw_text) for aid, payload, raw_text in df.itertuples(index=False)}
+            _prescription_rows = (version, rows)
+        return _prescription_rows[1]
+
+def build_appointments():
+    if not os.path.isfile(DATA_FILE) or os.path.getsize(DATA_FILE) == 0:
+        return dumps([])
+
+    df = pd.read_csv(DATA_FILE, usecols=["appointment_id", "patient_name", "age", "gender", "timestamp"])
+
+    # Replace missing values with "Unknown"
+    df[["patient_name", "gender"]] = df[["patient_name", "gender"]].fillna("Unknown")
+    df["age"] = df["age"].fillna(0)
+
+    return dumps(df[["appointment_id", "patient_name", "age", "gender", "timestamp"]].to_dict(orient="records"))
+
 @app.route("/appointments", methods=["GET"])
 def get_all_appointments():
     try:
-        if not os.path.isfile(DATA_FILE) or os.path.getsize(DATA_FILE) == 0:
-            return jsonify([])
-
-        df = pd.read_csv(DATA_FILE)
-
-        # Replace missing values with "Unknown"
-        df[["patient_name", "gender"]] = df[["patient_name", "gender"]].fillna("Unknown")
-        df["age"] = df["age"].fillna(0)
-
-        records = df[["appointment_id", "patient_name", "age", "gender", "timestamp"]].to_dict(orient="records")
-        return jsonify(records)
+        version = data_file_version()
+        body = response_cache.get("appointments", version, build_appointments)
+        return encoded_response(body, f'"{version}"')
 
     except Exception as e:
         logger.error(f"Error fetching appointments: {e}")
@@ -250,31 +464,47 @@ def get_all_appointments():
 @app.route("/prescription/<appointment_id>", methods=["GET"])
 def get_prescription_by_id(appointment_id):
     try:
-        df = pd.read_csv(DATA_FILE)
-        row = df[df["appointment_id"] == appointment_id]
+        version = data_file_version()
+        row = prescription_rows(version).get(appointment_id)
 
-        if row.empty:
+        if row is None:
             return jsonify({"error": "Not found"}), 404
 
-        prescription_json = json.loads(row.iloc[0]["prescription_json"])
-        raw_text = row.iloc[0].get("raw_text", "")
+        def build():
+            prescription_json, raw_text = row
+            return dumps({
+                "extracted": json.loads(prescription_json),
+                "raw_text": raw_text
+            })
 
-        return jsonify({
-            "extracted": prescription_json,
-            "raw_text": raw_text
-        })
+        body = response_cache.get(("prescription", appointment_id), version, build)
+        return encoded_response(body, f'"{version}"')
 
     except Exception as e:
         logger.error(f"Error loading prescription: {e}")
         return jsonify({"error": "Failed to load"}), 500
 
 
+# === Catalog Sync ===
+# Both lists carry their catalog version as an ETag, so unchanged catalogs cost a 304.
+# `?since=<version>` returns only the SKUs added, changed or removed since that version.
+sku_catalog = VersionedCatalog("faiss_cache/sku_list.pkl", "sku_code")  # [{"medicine_name": ..., "sku_code": ...}]
+procedure_catalog = VersionedCatalog("faiss_cache_lab/procedure_sku_list.pkl", "code")  # [{"name": ..., "code": ...}]
+
+def catalog_response(catalog):
+    catalog.refresh()
+    since = request.args.get("since")
+    version, etag, body = catalog.current() if since is None else catalog.delta(since)
+    # One cached body per catalog view: the full list, each known `since`, and the shared
+    # reset delta, so unknown `since` values cannot grow the cache.
+    view = "full" if since is None else ("reset" if etag.startswith('"reset-') else since)
+    encoded = response_cache.get((catalog.path, view), etag, lambda: body)
+    return encoded_response(encoded, etag, {"X-Catalog-Version": version})
+
 @app.route("/sku-list", methods=["GET"])
 def get_sku_list():
     try:
-        with open("faiss_cache/sku_list.pkl", "rb") as f:
-            sku_data = pickle.load(f)  # expects list of {"medicine_name": ..., "sku_code": ...}
-        return jsonify(sku_data)
+        return catalog_response(sku_catalog)
     except Exception as e:
         logger.error(f"SKU list error: {e}")
         return jsonify([]), 500
@@ -282,34 +512,187 @@ def get_sku_list():
 @app.route("/procedure-sku-list", methods=["GET"])
 def get_procedure_sku_list():
     try:
-        with open("faiss_cache_lab/procedure_sku_list.pkl", "rb") as f:
-            sku_data = pickle.load(f)  # [{ "name": ..., "code": ... }, ...]
-        return jsonify(sku_data)
+        return catalog_response(procedure_catalog)
     except Exception as e:
         logger.error(f"Procedure SKU list error: {e}")
         return jsonify([]), 500
 
+def write_prescription(appointment_id, extracted, raw_text):
+    """Replace (or add) one appointment's row; returns its previous (prescription_json, raw_text), if any.
+
+    Edits stamp updated_at, which incremental exports use as their watermark.
+    """
+    previous = None
+    updated_at = datetime.now().isoformat()
+    with span("persist.csv"), persist_lock():
+        df = pd.read_csv(DATA_FILE)
+
+        if appointment_id in df["appointment_id"].values:
+            row = df.loc[df["appointment_id"] == appointment_id].iloc[0]
+            previous = (row["prescription_json"], row["raw_text"] if isinstance(row["raw_text"], str) else "")
+            df.loc[df["appointment_id"] == appointment_id, "prescription_json"] = json.dumps(extracted)
+            df.loc[df["appointment_id"] == appointment_id, "raw_text"] = raw_text
+            df.loc[df["appointment_id"] == appointment_id, "updated_at"] = updated_at
+        else:
+            new_row = {
+                "appointment_id": appointment_id,
+                "prescription_json": json.dumps(extracted),
+                "raw_text": raw_text,
+                "updated_at": updated_at
+            }
+            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+
+        rewrite_data_file(df)
+    return previous
+
 @app.route("/update-prescription/<appointment_id>", methods=["POST"])
 def update_prescription(appointment_id):
     data = request.json
     extracted = data.get("extracted", {})
     raw_text = data.get("raw_text", "")
 
-    df = pd.read_csv(DATA_FILE)
+    with edit_lock(appointment_id):
+        previous = write_prescription(appointment_id, extracted, raw_text)
+        try:
+            # The first save of a prescription also records what it replaced.
+            base = (json.loads(previous[0]), previous[1]) if previous is not None else None
+            prescription_revisions.append(appointment_id, extracted, raw_text, base=base)
+        except Exception as e:
+            logger.warning(f"Revision not recorded for {appointment_id}: {e}")
+    if previous is not None:
+        record_corrections(appointment_id, previous[0], extracted)
+    record_derived(appointment_id, None, extracted, raw_text)
+    return jsonify({"message": "Updated successfully"})
+
+# === Line-Level Edits ===
+# PATCH /prescription/<id> with {"ops": [...], "raw_text": optional, "base_revision":
+# optional} applies add / remove / replace ops to single lines (see prescription_revisions.py),
+# re-matches only the lines whose matcher inputs changed and stores the result as a new
+# revision. A stale base_revision gets a 409 instead of overwriting a concurrent edit.
+prescription_revisions = PrescriptionRevisions()
 
-    if appointment_id in df["appointment_id"].values:
-        df.loc[df["appointment_id"] == appointment_id, "prescription_json"] = json.dumps(extracted)
-        df.loc[df["appointment_id"] == appointment_id, "raw_text"] = raw_text
-    else:
-        new_row = {
+@app.route("/prescription/<appointment_id>", methods=["PATCH"])
+def patch_prescription(appointment_id):
+    try:
+        body = request.get_json(silent=True) or {}
+        try:
+            budget = request_budget(request.headers, body)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # The row is read, edited and written back under the appointment's edit lock, and
+        # the revision it was read at is the one the new revision must follow.
+        with edit_lock(appointment_id):
+            head = prescription_revisions.head(appointment_id)
+            expected = body.get("base_revision", head)
+            if expected != head:
+                return jsonify({"error": f"revision {expected} is stale; current revision is {head}"}), 409
+            row = prescription_rows(data_file_version()).get(appointment_id)
+            if row is None:
+                return jsonify({"error": "Not found"}), 404
+            previous_json, raw_text = row
+            previous = json.loads(previous_json)
+            raw_text = raw_text if isinstance(raw_text, str) else ""
+
+            try:
+                with use_budget(budget):
+                    extracted, changes = apply_ops(previous, body.get("ops"), match_section)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            new_raw_text = body.get("raw_text", raw_text)
+
+            # CSV first: a failed write leaves no revision the stored row does not match.
+            write_prescription(appointment_id, extracted, new_raw_text)
+            try:
+                revision = prescription_revisions.append(
+                    appointment_id, extracted, new_raw_text, changes,
+                    base=(previous, raw_text), expected=head
+                )
+            except Exception as e:
+                revision = None
+                logger.warning(f"Revision not recorded for {appointment_id}: {e}")
+
+        record_corrections(appointment_id, previous_json, extracted)
+        record_derived(appointment_id, None, extracted, new_raw_text)
+        response = jsonify({
             "appointment_id": appointment_id,
-            "prescription_json": json.dumps(extracted),
-            "raw_text": raw_text
-        }
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+            "revision": revision,
+            "changes": changes,
+            "match_tier": budget.report()
+        })
+        response.headers["X-Match-Tier"] = budget.achieved
+        return response
 
-    df.to_csv(DATA_FILE, index=False)
-    return jsonify({"message": "Updated successfully"})
+    except Exception as e:
+        logger.error(f"Prescription patch error: {e}")
+        return jsonify({"error": "Failed to update"}), 500
+
+@app.route("/prescription/<appointment_id>/revisions", methods=["GET"])
+def get_prescription_revisions(appointment_id):
+    return jsonify({"appointment_id": appointment_id, "revisions": prescription_revisions.history(appointment_id)})
+
+@app.route("/prescription/<appointment_id>/revisions/<int:revision>", methods=["GET"])
+def get_prescription_revision(appointment_id, revision):
+    document = prescription_revisions.document(appointment_id, revision)
+    if document is None:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify(dict(document, appointment_id=appointment_id, revision=revision))
+
+@app.route("/search", methods=["GET"])
+def search_prescriptions():
+    try:
+        return jsonify(prescription_search.search(
+            query=request.args.get("q", ""),
+            date_from=request.args.get("from"),
+            date_to=request.args.get("to"),
+            gender=request.args.get("gender"),
+            sku_code=request.args.get("sku_code"),
+            page=int(request.args.get("page", 1)),
+            per_page=int(request.args.get("per_page", 20))
+        ))
+    except ValueError:
+        return jsonify({"error": "page and per_page must be integers"}), 400
+    except Exception as e:
+        logger.error(f"Search error: {e}")
+        return jsonify({"error": "Search failed"}), 500
+
+@app.route("/stats", methods=["GET"])
+def get_stats():
+    try:
+        group = request.args.get("group", "medicines")
+        if group not in ANALYTICS_GROUPS:
+            return jsonify({"error": f"group must be one of {', '.join(ANALYTICS_GROUPS)}"}), 400
+        days = min(max(int(request.args.get("days", 7)), 1), 366)
+        limit = min(max(int(request.args.get("limit", 10)), 1), 100)
+        return jsonify(prescription_analytics.stats(group=group, days=days, limit=limit))
+    except ValueError:
+        return jsonify({"error": "days and limit must be integers"}), 400
+    except Exception as e:
+        logger.error(f"Stats error: {e}")
+        return jsonify({"error": "Failed to load stats"}), 500
+
+# === Export ===
+EXPORT_CONTENT_TYPES = {
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+@app.route("/export/<table>", methods=["GET"])
+def export_table(table):
+    fmt = request.args.get("format", "parquet")
+    if table not in EXPORT_TABLES or fmt not in EXPORT_CONTENT_TYPES:
+        return jsonify({"error": f"table must be one of {', '.join(EXPORT_TABLES)}; format parquet or arrow"}), 400
+    since = request.args.get("since")
+    extension = "parquet" if fmt == "parquet" else "arrows"
+    return Response(
+        stream_table(table, fmt, DATA_FILE, since),
+        mimetype=EXPORT_CONTENT_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{extension}"'}
+    )
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(render_prometheus(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.route("/", methods=["GET"])
 @app.route("/health", methods=["GET"])
@@ -317,5 +700,6 @@ def health_check():
     return jsonify({"status": "ok"}), 200
 
 if __name__ == "__main__":
+    build_derived_stores()
     print("✅ RxSage backend is running...")
     app.run(host="0.0.0.0", port=5000, debug=True)
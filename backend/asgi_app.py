@@ -0,0 +1,136 @@
+import os
+import asyncio
+import logging
+import functools
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route, Mount
+from a2wsgi import WSGIMiddleware
+import app_med_proc_v5 as sync_app
+from smart_advice import get_smart_advice_async
+from upstream import groq_chat_async, request_deadline, deadline_budget
+from tracing import trace_endpoint, span
+from match_budget import request_budget, use_budget
+
+# Async serving mode: `uvicorn asgi_app:app`. /extract and /smart_advice wait on Groq
+# without holding a thread; CPU-bound matching runs in a bounded pool. Every other route
+# is the unchanged Flask app, served through a WSGI adapter.
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+# Matching still makes short sync upstream calls (embeddings, rerank), so the pool is
+# sized for waiting threads rather than cores.
+MATCH_WORKERS = int(os.environ.get("MATCH_WORKERS", "32"))
+WSGI_WORKERS = int(os.environ.get("WSGI_WORKERS", "16"))
+
+match_pool = ThreadPoolExecutor(max_workers=MATCH_WORKERS, thread_name_prefix="rxsage-match")
+
+async def run_matching(fn, *args):
+    # The copied context carries the active trace and request deadline into the pool thread.
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(match_pool, functools.partial(context.run, fn, *args))
+
+async def extract_coalesced(prescription_text, cache_key, bypass=False):
+    async def extract():
+        completion = await groq_chat_async("extraction", **sync_app.extraction_request(prescription_text))
+        data = sync_app.parse_extraction_response(completion)
+        await asyncio.to_thread(sync_app.extraction_cache.set, cache_key, data)
+        return data
+
+    async def recheck():
+        return await asyncio.to_thread(sync_app.extraction_cache.get, cache_key)
+
+    return await sync_app.extraction_flight.do_async(cache_key, extract, recheck=None if bypass else recheck)
+
+# === Async Routes ===
+@trace_endpoint
+async def extract_medicine(request):
+    with request_deadline(deadline_budget(request.headers)):
+        try:
+            body = await request.json()
+            prescription_text = body.get("prescription", "")
+            if not prescription_text:
+                return JSONResponse({"error": "Prescription text is required"}, status_code=400)
+            try:
+                budget = request_budget(request.headers, body)
+            except ValueError as e:
+                return JSONResponse({"error": str(e)}, status_code=400)
+
+            appointment_id = sync_app.generate_appointment_id()
+            timestamp = datetime.now().isoformat()
+
+            cache_key = sync_app.extraction_cache_key(prescription_text)
+            with span("cache.extraction"):
+                bypass = sync_app.cache_bypassed(request.headers)
+                data = None if bypass else await asyncio.to_thread(sync_app.extraction_cache.get, cache_key)
+            cache_status = "hit" if data is not None else "miss"
+            if data is None:
+                data = await extract_coalesced(prescription_text, cache_key, bypass)
+
+            with use_budget(budget):
+                data = await run_matching(sync_app.match_extraction, data)
+            row = sync_app.prescription_row(appointment_id, timestamp, data, prescription_text)
+            await asyncio.to_thread(sync_app.append_prescription, row)
+            await asyncio.to_thread(sync_app.record_derived, appointment_id, timestamp, data, prescription_text)
+
+            response = JSONResponse({
+                "appointment_id": appointment_id,
+                "result": data,
+                "match_tier": budget.report()
+            })
+            response.headers["X-Extraction-Cache"] = cache_status
+            response.headers["X-Match-Tier"] = budget.achieved
+            return response
+
+        except Exception as e:
+            logger.error(f"Extraction error: {e}")
+            return JSONResponse({"error": f"Extraction failed: {str(e)}"}, status_code=500)
+
+@trace_endpoint
+async def smart_advice(request):
+    with request_deadline(deadline_budget(request.headers)):
+        try:
+            data = await request.json()
+            diagnosis = data.get("diagnosis", "")
+            medicines = data.get("medicines", [])
+
+            if not medicines:
+                return JSONResponse({"precaution": "", "followup": ""})
+
+            advice, cached = await get_smart_advice_async(
+                diagnosis, medicines, bypass_cache=sync_app.cache_bypassed(request.headers)
+            )
+
+            response = JSONResponse({"advice": advice})
+            response.headers["X-Advice-Cache"] = "hit" if cached else "miss"
+            return response
+
+        except Exception as e:
+            logger.error(f"Smart advice error: {e}")
+            return JSONResponse({"error": "Failed to generate smart advice."}, status_code=500)
+
+# === App ===
+# The async routes get their own CORS layer; Flask-CORS keeps handling the mounted app.
+async_routes = CORSMiddleware(
+    Starlette(routes=[
+        Route("/extract", extract_medicine, methods=["POST"]),
+        Route("/smart_advice", smart_advice, methods=["POST"]),
+    ]),
+    allow_origins=["*"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Server-Timing", "X-Match-Tier"]
+)
+
+app = Starlette(routes=[
+    Route("/extract", async_routes),
+    Route("/smart_advice", async_routes),
+    Mount("/", app=WSGIMiddleware(sync_app.app, workers=WSGI_WORKERS)),
+])
@@ -0,0 +1,84 @@
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+
+# === Config ===
+NGRAM_SIZE = 3
+
+# === Structured Attribute Index ===
+# Posting lists over normalized type and dosage values plus a character-trigram index over
+# names. A query field matches a row when it is a substring of that row's field, exactly as
+# the old row-by-row scan scored it; an empty query field matches every row.
+class AttributeIndex:
+    def __init__(self, names, types, dosages):
+        self.names = [str(name) for name in names]
+        self.size = len(self.names)
+        self.all_rows = np.arange(self.size, dtype=np.int64)
+        self.type_postings = self._postings(types)
+        self.dosage_postings = self._postings(dosages)
+
+        self.ngram_vectorizer = CountVectorizer(
+            analyzer="char", ngram_range=(NGRAM_SIZE, NGRAM_SIZE), lowercase=False, binary=True, dtype=np.int8
+        )
+        self.ngram_postings = self.ngram_vectorizer.fit_transform(self.names).T.tocsr()
+        self.ngram_vocab = self.ngram_vectorizer.vocabulary_
+
+    @staticmethod
+    def _postings(values):
+        postings = {}
+        for row, value in enumerate(values):
+            postings.setdefault(str(value), []).append(row)
+        return {value: np.array(rows, dtype=np.int64) for value, rows in postings.items()}
+
+    def _value_rows(self, postings, query):
+        if not query:
+            return self.all_rows
+        # Few distinct values (types, strengths), so substring tests run per value, not per row.
+        matched = [rows for value, rows in postings.items() if query in value]
+        if not matched:
+            return self.all_rows[:0]
+        return np.sort(np.concatenate(matched))
+
+    def _name_rows(self, query):
+        if not query:
+            return self.all_rows
+        if len(query) < NGRAM_SIZE:
+            return np.array([row for row, name in enumerate(self.names) if query in name], dtype=np.int64)
+
+        postings = []
+        for gram in {query[i:i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1)}:
+            term_id = self.ngram_vocab.get(gram)
+            if term_id is None:
+                return self.all_rows[:0]
+            postings.append(self.ngram_postings.indices[
+                self.ngram_postings.indptr[term_id]:self.ngram_postings.indptr[term_id + 1]
+            ])
+
+        # Intersect shortest lists first, then confirm the trigram hits really contain the query.
+        postings.sort(key=len)
+        candidates = postings[0]
+        for rows in postings[1:]:
+            candidates = np.intersect1d(candidates, rows, assume_unique=True)
+            if not len(candidates):
+                break
+        return np.array([row for row in candidates if query in self.names[row]], dtype=np.int64)
+
+    def candidates(self, name, mtype, dosage):
+        return self._name_rows(name), self._value_rows(self.type_postings, mtype), self._value_rows(
+            self.dosage_postings, dosage
+        )
+
+    def best_match(self, name, mtype, dosage):
+        """Return (row, score) for the first row with the most matching fields, or (None, 0)."""
+        if not self.size:
+            return None, 0
+        name_rows, type_rows, dosage_rows = self.candidates(name, mtype, dosage)
+
+        full = np.intersect1d(np.intersect1d(name_rows, type_rows, assume_unique=True), dosage_rows, assume_unique=True)
+        if len(full):
+            return int(full[0]), 3
+
+        scores = np.zeros(self.size, dtype=np.int8)
+        for rows in (name_rows, type_rows, dosage_rows):
+            scores[rows] += 1
+        row = int(np.argmax(scores))
+        return row, int(scores[row])
@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+import copy
+import hashlib
+import argparse
+import platform
+import resource
+import tracemalloc
+from collections import Counter, defaultdict
+import numpy as np
+import pandas as pd
+
+# matcher_v2 builds its clients at import time; a placeholder key lets it import offline.
+os.environ.setdefault("GROQ_API_KEY", "benchmark-offline")
+
+import matcher_v2
+import upstream
+from metrics import MATCH_STAGE_SECONDS
+
+# === Config ===
+DATA_FILE = "prescriptions.csv"
+EMBED_DIM = 384
+GROUPS = [("labtests", "lab"), ("radiology", "radiology"), ("procedures", "procedure")]
+
+STAGE_BY_REASON = [
+    ("learned-alias", "alias"),
+    ("normalized-concat-exact", "exact"),
+    ("normalized-exact", "exact"),
+    ("strength-based-name-match", "strength"),
+    ("attribute-index-match", "attribute"),
+    ("name-prefix-match", "prefix"),
+    ("token-subset", "token"),
+    ("normalized-multistage-fuzzy", "fuzzy"),
+    ("jaccard-fuzzy", "fuzzy"),
+    ("semantic-faiss", "faiss"),
+    ("hybrid-faiss-rrf", "faiss"),
+    ("llm-reranked", "faiss"),
+    ("sparse-local", "sparse"),
+    ("sparse-reranked", "sparse"),
+    ("budget-truncated", "budget"),
+    ("tier-limited", "tier"),
+]
+
+# === Deterministic Stubs ===
+# Hashes character trigrams into a fixed-size vector so similar strings stay close.
+class StubEmbeddingClient:
+    def __init__(self):
+        self.calls = 0
+
+    def feature_extraction(self, text, model=None, timeout=None):
+        self.calls += 1
+        if isinstance(text, list):
+            return [self.embed(t) for t in text]
+        return self.embed(text)
+
+    def embed(self, text):
+        vec = np.zeros(EMBED_DIM, dtype="float32")
+        padded = f"  {text.lower()} "
+        for i in range(len(padded) - 2):
+            digest = hashlib.md5(padded[i:i + 3].encode("utf-8")).digest()
+            vec[int.from_bytes(digest[:4], "little") % EMBED_DIM] += 1.0
+        return vec.tolist()
+
+class _StubMessage:
+    def __init__(self, content):
+        self.message = type("Message", (), {"content": content})()
+
+class _StubCompletions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model=None, messages=None, **kwargs):
+        self.owner.calls += 1
+        return type("Completion", (), {"choices": [_StubMessage("1")]})()
+
+# Always picks the first rerank option, mirroring the matcher's own fallback.
+class StubLLMClient:
+    def __init__(self):
+        self.calls = 0
+        self.chat = type("Chat", (), {"completions": _StubCompletions(self)})()
+
+def install_stubs():
+    embed_client = StubEmbeddingClient()
+    llm_client = StubLLMClient()
+    upstream.hf_client = embed_client
+    upstream.groq_client = llm_client
+    return embed_client, llm_client
+
+# === Workload ===
+def load_workload(data_file):
+    workload = []
+    df = pd.read_csv(data_file, usecols=["appointment_id", "prescription_json"])
+    for appointment_id, raw in zip(df["appointment_id"], df["prescription_json"]):
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+
+        for med in data.get("medicines") or []:
+            name = med.get("raw_medicine_name") or med.get("medicine_name", "")
+            if not name:
+                continue
+            workload.append({
+                "appointment_id": appointment_id,
+                "kind": "medicine",
+                "input": {
+                    "medicine_name": name,
+                    "medicine_type": med.get("medicine_type", "") or "",
+                    "medicine_dosage": str(med.get("medicine_dosage", "") or ""),
+                },
+                "expected_sku": str(med.get("sku_code", "") or ""),
+            })
+
+        for key, group in GROUPS:
+            for term in data.get(key) or []:
+                name = term.get("test_name") or term.get("procedure_name") or term.get("name", "")
+                if not name:
+                    continue
+                name_key = "procedure_name" if group == "procedure" else "test_name"
+                workload.append({
+                    "appointment_id": appointment_id,
+                    "kind": group,
+                    "input": {name_key: name},
+                    "expected_sku": str(term.get("sku_code", "") or ""),
+                })
+    return workload
+
+def stage_for_reason(reason):
+    for prefix, stage in STAGE_BY_REASON:
+        if reason and reason.startswith(prefix):
+            return stage
+    return "unmatched"
+
+def run_item(item):
+    payload = copy.deepcopy(item["input"])
+    if item["kind"] == "medicine":
+        result = matcher_v2.validate_medicine_names([payload])[0]
+    else:
+        results = matcher_v2.validate_group_terms([payload], item["kind"])
+        result = results[0] if results else {}
+    return result.get("match_reason", ""), str(result.get("sku_code", "") or "")
+
+# === Reporting ===
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {"count": 0}
+    arr = np.asarray(samples_ms)
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p90_ms": round(float(np.percentile(arr, 90)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+        "max_ms": round(float(arr.max()), 3),
+    }
+
+# Per-stage cost from the matcher's own instrumentation (every stage an item passed through);
+# percentiles are interpolated from the histogram buckets.
+def stage_timings():
+    timings = {}
+    for (pipeline, stage), (_, total, count) in sorted(MATCH_STAGE_SECONDS.snapshot().items()):
+        p50, p95 = (MATCH_STAGE_SECONDS.quantile(q, pipeline=pipeline, stage=stage) for q in (0.5, 0.95))
+        timings[f"{pipeline}.{stage}"] = {
+            "count": count,
+            "total_ms": round(total * 1000, 3),
+            "mean_ms": round(total * 1000 / count, 4) if count else 0.0,
+            "p50_ms": round(p50 * 1000, 4) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 4) if p95 is not None else None,
+        }
+    return timings
+
+def run_benchmark(data_file, repeat=1, trace_memory=False, limit=None, use_aliases=False):
+    embed_client, llm_client = install_stubs()
+    # Aliases learned from this same history would answer their own lines; off by default.
+    matcher_v2.alias_index.enabled = use_aliases
+    workload = load_workload(data_file)
+    if limit:
+        workload = workload[:limit]
+
+    outcome_latency = defaultdict(list)
+    kind_latency = defaultdict(list)
+    reasons = Counter()
+    outputs = []
+    agree = comparable = 0
+
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    for round_idx in range(repeat):
+        for item in workload:
+            t0 = time.perf_counter()
+            reason, sku_code = run_item(item)
+            elapsed_ms = (time.perf_counter() - t0) * 1000
+
+            outcome_latency[stage_for_reason(reason)].append(elapsed_ms)
+            kind_latency[item["kind"]].append(elapsed_ms)
+            if round_idx == 0:
+                reasons[reason or "none"] += 1
+                outputs.append(sku_code)
+                if item["expected_sku"]:
+                    comparable += 1
+                    agree += int(item["expected_sku"] == sku_code)
+    wall = time.perf_counter() - start
+
+    peak_traced = None
+    if trace_memory:
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        maxrss *= 1024
+
+    total_items = len(workload) * repeat
+    return {
+        "meta": {
+            "data_file": data_file,
+            "items": len(workload),
+            "repeat": repeat,
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "throughput_items_per_s": round(total_items / wall, 2) if wall else 0.0,
+        "wall_time_s": round(wall, 3),
+        # Whole-item latency grouped by the stage that produced the match (not time inside it).
+        "latency_by_outcome": {stage: percentiles(v) for stage, v in sorted(outcome_latency.items())},
+        "latency_by_kind": {kind: percentiles(v) for kind, v in sorted(kind_latency.items())},
+        "stage_timings": stage_timings(),
+        "match_reasons": dict(reasons.most_common()),
+        "historical_agreement": round(agree / comparable, 4) if comparable else None,
+        "stub_calls": {"embedding": embed_client.calls, "llm": llm_client.calls},
+        "peak_rss_bytes": maxrss,
+        "peak_traced_bytes": peak_traced,
+        "outputs": outputs,
+    }
+
+def compare(report, baseline):
+    print("\n=== Comparison against baseline ===")
+    # Older reports called the per-outcome latencies "latency_by_stage".
+    base_outcomes = baseline.get("latency_by_outcome") or baseline.get("latency_by_stage", {})
+    for stage, stats in report["latency_by_outcome"].items():
+        base = base_outcomes.get(stage)
+        if not base or not base.get("count") or not stats.get("count"):
+            continue
+        delta = (stats["p50_ms"] - base["p50_ms"]) / base["p50_ms"] * 100 if base["p50_ms"] else 0.0
+        print(f"{stage:>10}: p50 {base['p50_ms']:.3f} → {stats['p50_ms']:.3f} ms ({delta:+.1f}%)")
+    for stage, stats in report["stage_timings"].items():
+        base = baseline.get("stage_timings", {}).get(stage)
+        if not base or not base.get("p95_ms") or stats.get("p95_ms") is None:
+            continue
+        print(f"{stage:>22}: p95 {base['p95_ms']:.4f} → {stats['p95_ms']:.4f} ms")
+
+    base_tp = baseline.get("throughput_items_per_s") or 0
+    print(f"throughput: {base_tp} → {report['throughput_items_per_s']} items/s")
+
+    base_out = baseline.get("outputs", [])
+    if len(base_out) == len(report["outputs"]) and base_out:
+        same = sum(a == b for a, b in zip(base_out, report["outputs"]))
+        print(f"sku agreement with baseline: {same}/{len(base_out)} ({same / len(base_out):.2%})")
+    else:
+        print("sku agreement with baseline: workloads differ, skipped")
+
+def print_summary(report):
+    print(f"Items: {report['meta']['items']} x {report['meta']['repeat']}  "
+          f"Wall: {report['wall_time_s']}s  Throughput: {report['throughput_items_per_s']} items/s")
+    print(f"Peak RSS: {report['peak_rss_bytes'] / 2**20:.1f} MiB")
+    print("\nItem latency by the stage that matched it (ms):")
+    for stage, stats in report["latency_by_outcome"].items():
+        print(f"  {stage:>10}: n={stats['count']:<5} p50={stats['p50_ms']:<9} p90={stats['p90_ms']:<9} p99={stats['p99_ms']}")
+    print("\nTime inside each stage (ms):")
+    for stage, stats in report["stage_timings"].items():
+        print(f"  {stage:>22}: n={stats['count']:<5} p50={stats['p50_ms']:<9} p95={stats['p95_ms']:<9} "
+              f"mean={stats['mean_ms']:<9} total={stats['total_ms']}")
+    print("\nMatch reasons:")
+    for reason, count in report["match_reasons"].items():
+        print(f"  {count:>5}  {reason}")
+    print(f"\nHistorical sku agreement: {report['historical_agreement']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark for the SKU matching pipeline")
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--trace-memory", action="store_true", help="track Python peak allocations (slower)")
+    parser.add_argument("--use-aliases", action="store_true", help="let learned aliases short-circuit matching")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="compare against a previous JSON report")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.data_file, args.repeat, args.trace_memory, args.limit, args.use_aliases)
+    print_summary(report)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            compare(report, json.load(f))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {args.output}")
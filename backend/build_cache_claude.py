@@ -5,7 +5,8 @@ import pandas as pd
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
-import re
+from attribute_index import AttributeIndex
+from normalizer import Normalizer, RULE_MAPS
 
 # === Setup ===
 load_dotenv()
@@ -14,30 +15,17 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# === Constants ===
-ABBREVIATION_MAP = {
-    "syp": "syrup",
-    "tab": "tablet",
-    "cap": "capsule",
-    "inj": "injection",
-    "oint": "ointment",
-    "drop": "drops"
-}
-
 # === Utility ===
-def normalize_string(text):
-    text = text.lower()
-    for abbr, full in ABBREVIATION_MAP.items():
-        text = re.sub(rf"\b{abbr}\b", full, text)
-    text = re.sub(r"[^a-z0-9]+", " ", text)
-    return text.strip()
+# Same rules as matcher_v2, so both services normalize a name to the same string.
+normalize_string = Normalizer(*RULE_MAPS)
 
 # === Load SKU Enriched Data ===
 sku_df = pd.read_csv("medicine_sku_enriched_mapped.csv")
 sku_df = sku_df.fillna("")
-sku_df["normalized_name"] = sku_df["medicine_name"].apply(normalize_string)
-sku_df["normalized_type"] = sku_df["medicine_type"].apply(normalize_string)
-sku_df["normalized_dosage"] = sku_df["medicine_dosage"].apply(normalize_string)
+sku_df["normalized_name"] = sku_df["medicine_name"].apply(normalize_string.normalize)
+sku_df["normalized_type"] = sku_df["medicine_type"].apply(normalize_string.normalize)
+sku_df["normalized_dosage"] = sku_df["medicine_dosage"].apply(normalize_string.normalize)
+attribute_index = AttributeIndex(sku_df["normalized_name"], sku_df["normalized_type"], sku_df["normalized_dosage"])
 
 # === Matching Function ===
 def match_medicine(extracted_name, extracted_type, extracted_dosage):
@@ -45,18 +33,8 @@ def match_medicine(extracted_name, extracted_type, extracted_dosage):
     extracted_type = normalize_string(extracted_type)
     extracted_dosage = normalize_string(extracted_dosage)
 
-    best_match = None
-    max_score = -1
-
-    for _, row in sku_df.iterrows():
-        name_score = int(extracted_name in row["normalized_name"])
-        type_score = int(extracted_type in row["normalized_type"])
-        dosage_score = int(extracted_dosage in row["normalized_dosage"])
-        total_score = name_score + type_score + dosage_score
-
-        if total_score > max_score:
-            max_score = total_score
-            best_match = row["medicine_desc"]
+    row, _ = attribute_index.best_match(extracted_name, extracted_type, extracted_dosage)
+    best_match = sku_df["medicine_desc"].iat[row] if row is not None else None
 
     return best_match if best_match else ""
 
@@ -1,10 +1,12 @@
 import os
+import argparse
 import numpy as np
 import pandas as pd
 import faiss
 import pickle
 from sklearn.preprocessing import normalize
 from sentence_transformers import SentenceTransformer
+from vector_index import INDEX_TYPES, build_index, index_filename, index_size_bytes, write_meta
 
 # === Configuration ===
 CSV_PATH = "medicine_sku_comp.csv"
@@ -13,6 +15,17 @@ CODE_COL = "sku_code"
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
 CACHE_DIR = "faiss_cache"
 
+parser = argparse.ArgumentParser(description="Build the medicine SKU vector index")
+parser.add_argument("--index-type", choices=INDEX_TYPES, default="hnsw_flat")
+parser.add_argument("--hnsw-m", type=int, default=32)
+parser.add_argument("--ef-construction", type=int, default=200)
+parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default: 4*sqrt(n))")
+parser.add_argument("--pq-m", type=int, default=48, help="PQ sub-quantizers (must divide the embedding dim)")
+parser.add_argument("--pq-bits", type=int, default=8)
+parser.add_argument("--vectors-dtype", choices=["float32", "float16", "none"], default="float16",
+                    help="dtype of sku_vectors.npy (used only by the sweep tool); 'none' skips it")
+args = parser.parse_args()
+
 # === Load Data ===
 print("Loading SKU data from CSV...")
 df = pd.read_csv(CSV_PATH)
@@ -32,19 +45,27 @@ embeddings = model.encode([row["medicine_name"] for row in sku_metadata], conver
 
 # === Normalize Embeddings ===
 print("Normalizing embeddings...")
-normalized_embeddings = normalize(embeddings, norm='l2')
+normalized_embeddings = normalize(embeddings, norm='l2').astype("float32")
 
-# === Build FAISS Index (HNSW for speed) ===
-d = normalized_embeddings.shape[1]
-index = faiss.IndexHNSWFlat(d, 32)
-index.hnsw.efConstruction = 200
-index.add(normalized_embeddings)
+# === Build FAISS Index ===
+print(f"Building {args.index_type} index...")
+params = {
+    "hnsw_m": args.hnsw_m,
+    "ef_construction": args.ef_construction,
+    "nlist": args.nlist,
+    "pq_m": args.pq_m,
+    "pq_bits": args.pq_bits,
+}
+index = build_index(normalized_embeddings, args.index_type, **params)
+index_file = index_filename(args.index_type)
 
 # === Save Index and Metadata ===
 os.makedirs(CACHE_DIR, exist_ok=True)
-faiss.write_index(index, os.path.join(CACHE_DIR, "hnsw_index.faiss"))
-np.save(os.path.join(CACHE_DIR, "sku_vectors.npy"), normalized_embeddings)
+faiss.write_index(index, os.path.join(CACHE_DIR, index_file))
+write_meta(CACHE_DIR, index_file, args.index_type, index.ntotal, index.d, params)
+if args.vectors_dtype != "none":
+    np.save(os.path.join(CACHE_DIR, "sku_vectors.npy"), normalized_embeddings.astype(args.vectors_dtype))
 with open(os.path.join(CACHE_DIR, "sku_list.pkl"), "wb") as f:
     pickle.dump(sku_metadata, f)
 
-print("FAISS index and SKU metadata saved in", CACHE_DIR)
+print(f"{args.index_type} index ({index_size_bytes(index) / 2**20:.1f} MiB) and SKU metadata saved in", CACHE_DIR)
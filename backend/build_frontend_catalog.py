@@ -0,0 +1,121 @@
+import os
+import re
+import json
+import gzip
+import shutil
+import hashlib
+import argparse
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:  # only needed for --precompress
+    brotli = None
+
+# === Configuration ===
+MEDICINE_CSV = "medicine_sku_comp.csv"
+PROCEDURE_CSV = "procedure_comb_sku.csv"
+OUTPUT_DIR = os.path.join("..", "frontend", "public", "catalog")
+GRAM_SIZE = 3
+GRAM_BUCKETS = 128
+CHUNK_SIZE = 2048
+
+# === Trigram Index ===
+# Medicines ship as a trigram index plus the labels in fixed-size chunks by id. The editor
+# fetches the posting buckets for the trigrams of the word being typed, ranks label ids by
+# how many of those trigrams they contain, and fetches only the chunks holding the best
+# candidates, so a word typed from the middle of a description or with a typo still finds
+# it. Each label is stored once. Procedures are small enough to ship as a single shard.
+# grams() and gram_bucket() must match the editor (frontend/src/components/PrescriptionEditor.jsx).
+def grams(text):
+    found = set()
+    for token in re.sub(r"[^a-z0-9]+", " ", text.lower()).split():
+        for start in range(len(token) - GRAM_SIZE + 1):
+            found.add(token[start:start + GRAM_SIZE])
+    return found
+
+def gram_bucket(gram):
+    # 32-bit FNV-1a, reproducible in JavaScript with Math.imul.
+    h = 2166136261
+    for byte in gram.encode("utf-8"):
+        h = ((h ^ byte) * 16777619) & 0xFFFFFFFF
+    return h % GRAM_BUCKETS
+
+def load_labels(csv_path, column):
+    labels = pd.read_csv(csv_path)[column].astype(str).str.strip()
+    return list(dict.fromkeys(label for label in labels if label))
+
+def build_gram_buckets(labels):
+    """Bucket -> {gram: ids}, ids delta-encoded (first id, then gaps) to keep the JSON small."""
+    postings = {}
+    for label_id, label in enumerate(labels):
+        for gram in grams(label):
+            postings.setdefault(gram, []).append(label_id)
+    buckets = {}
+    for gram, ids in sorted(postings.items()):
+        buckets.setdefault(gram_bucket(gram), {})[gram] = [ids[0]] + [b - a for a, b in zip(ids, ids[1:])]
+    return buckets
+
+# === Writing ===
+def write_artifact(output_dir, stem, payload, precompress=False):
+    """Write minified JSON as <stem>.<hash>.json (plus .gz/.br siblings if precompress); return (hash, size)."""
+    data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    name = f"{stem}.{digest}.json"
+    path = os.path.join(output_dir, name)
+    with open(path, "wb") as f:
+        f.write(data)
+    if precompress:
+        with open(path + ".gz", "wb") as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+    return digest, len(data)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emit a trigram-indexed, content-hashed catalog for the frontend editor")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--precompress", action="store_true",
+                        help="also write .gz and .br files, for servers that send precompressed static files")
+    args = parser.parse_args()
+    if args.precompress and brotli is None:
+        parser.error("--precompress needs the brotli package")
+
+    medicines = load_labels(MEDICINE_CSV, "medicine_desc")
+    procedures = load_labels(PROCEDURE_CSV, "description")
+
+    # Hashed names change with content, so a rebuild starts from an empty directory.
+    shutil.rmtree(args.output_dir, ignore_errors=True)
+    os.makedirs(args.output_dir)
+
+    # Columnar payloads: one array per field (only "label" is needed today). The manifest
+    # maps each file to its content hash; clients build "<stem>.<hash>.json" from it.
+    total_bytes = 0
+
+    def write(stem, payload):
+        global total_bytes
+        digest, size = write_artifact(args.output_dir, stem, payload, args.precompress)
+        total_bytes += size
+        return digest
+
+    gram_buckets = build_gram_buckets(medicines)
+    gram_files = [write(f"medicine-grams-{bucket}", gram_buckets.get(bucket, {})) for bucket in range(GRAM_BUCKETS)]
+    label_files = [
+        write(f"medicine-labels-{chunk}", {"label": medicines[start:start + CHUNK_SIZE]})
+        for chunk, start in enumerate(range(0, len(medicines), CHUNK_SIZE))
+    ]
+    procedure_hash = write("procedure", {"label": procedures})
+
+    manifest = {
+        "gram_size": GRAM_SIZE,
+        "gram_buckets": GRAM_BUCKETS,
+        "chunk_size": CHUNK_SIZE,
+        "counts": {"medicine": len(medicines), "procedure": len(procedures)},
+        "medicine": {"grams": gram_files, "labels": label_files},
+        "procedure": procedure_hash,
+    }
+    manifest["version"] = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+    with open(os.path.join(args.output_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+
+    print(f"{len(gram_files) + len(label_files) + 1} files ({total_bytes / 2**20:.1f} MiB uncompressed) and manifest written to", args.output_dir)
@@ -0,0 +1,138 @@
+import os
+import json
+import gzip
+import pickle
+import hashlib
+import logging
+import threading
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+# Past snapshots are kept next to the catalog pickle so `?since=` deltas survive restarts.
+CATALOG_HISTORY = int(os.environ.get("CATALOG_HISTORY", "10"))
+CATALOG_CONTENT_TYPE = "application/json"
+
+def _dumps(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+# === Versioned Catalog ===
+# Serves a pickled SKU list as a versioned document. The version is a digest of the list,
+# so every catalog build gets its own identifier; the pickle is reloaded when its mtime
+# changes. Response bodies are serialized once per version (and once per `since` for
+# deltas), and requests only pick up the precomputed bytes.
+#
+# Deltas group items by SKU code, since a code can carry several names. A client applies
+# one by dropping its items whose code is in `removed` or among the `changed` items, then
+# appending `added` and `changed`. An unknown or expired `since` returns a reset delta: every
+# item in `added`, with `reset` set.
+class VersionedCatalog:
+    def __init__(self, path, code_field):
+        self.path = path
+        self.code_field = code_field
+        self.history_dir = os.path.join(os.path.dirname(path), "versions", os.path.splitext(os.path.basename(path))[0])
+        self._lock = threading.Lock()
+        self._mtime = None
+        # (version, groups, body, deltas), swapped as one so readers never mix versions.
+        self._state = (None, {}, b"[]", {})
+
+    def _group(self, items):
+        groups = {}
+        for item in items:
+            groups.setdefault(str(item[self.code_field]), []).append(item)
+        return groups
+
+    @property
+    def version(self):
+        return self._state[0]
+
+    def current(self):
+        """(version, ETag, precomputed JSON bytes) of the full list."""
+        version, _, body, _ = self._state
+        return version, f'"{version}"', body
+
+    def refresh(self):
+        """Reload the pickle if it changed on disk; return the current version."""
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return self.version
+        with self._lock:
+            if mtime != self._mtime:
+                with open(self.path, "rb") as f:
+                    items = pickle.load(f)
+                body = _dumps(items)
+                version = hashlib.sha256(body).hexdigest()[:16]
+                if version != self.version:
+                    self._state = (version, self._group(items), body, {})
+                    self._archive(version, body)
+                    logger.info(f"Catalog {self.path} at version {version} ({len(items)} items)")
+                self._mtime = mtime
+        return self.version
+
+    # === Snapshot History ===
+    def _snapshot_path(self, version):
+        return os.path.join(self.history_dir, f"{version}.json.gz")
+
+    def _archive(self, version, body):
+        try:
+            os.makedirs(self.history_dir, exist_ok=True)
+            path = self._snapshot_path(version)
+            if not os.path.exists(path):
+                with open(path + ".tmp", "wb") as f:
+                    f.write(gzip.compress(body, mtime=0))
+                os.replace(path + ".tmp", path)
+            snapshots = sorted(
+                (entry for entry in os.scandir(self.history_dir) if entry.name.endswith(".json.gz")),
+                key=lambda entry: entry.stat().st_mtime
+            )
+            for entry in snapshots[:-CATALOG_HISTORY]:
+                os.remove(entry.path)
+        except OSError as e:
+            logger.warning(f"Catalog snapshot not archived: {e}")
+
+    def _load_snapshot(self, version):
+        if len(version) != 16 or not all(c in "0123456789abcdef" for c in version):
+            return None
+        try:
+            with open(self._snapshot_path(version), "rb") as f:
+                return json.loads(gzip.decompress(f.read()))
+        except (OSError, ValueError):
+            return None
+
+    # === Deltas ===
+    def delta(self, since):
+        """(version, ETag, precomputed JSON bytes) of the changes from `since` to the current version."""
+        version, current, _, deltas = self._state
+        body = deltas.get(since)
+        if body is not None:
+            return version, f'"{since}-{version}"', body
+
+        if since == version:
+            previous = current
+        else:
+            snapshot = self._load_snapshot(since)
+            previous = self._group(snapshot) if snapshot is not None else None
+
+        if previous is None:
+            # Unknown versions all share one cached reset body, so arbitrary `since`
+            # values cannot grow the cache.
+            body = deltas.get(None)
+            if body is None:
+                body = deltas[None] = _dumps({
+                    "version": version, "since": None, "reset": True,
+                    "added": [item for items in current.values() for item in items],
+                    "changed": [], "removed": [],
+                })
+            return version, f'"reset-{version}"', body
+
+        body = deltas[since] = _dumps({
+            "version": version,
+            "since": since,
+            "reset": False,
+            "added": [item for code, items in current.items() if code not in previous for item in items],
+            "changed": [item for code, items in current.items()
+                        if code in previous and previous[code] != items for item in items],
+            "removed": [code for code in previous if code not in current],
+        })
+        return version, f'"{since}-{version}"', body
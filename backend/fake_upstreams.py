@@ -0,0 +1,179 @@
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+import numpy as np
+import pandas as pd
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Stand-ins for Groq chat completions and HF feature extraction, for load tests only.
+# Point the backend at them with GROQ_BASE_URL and HF_INFERENCE_URL (see load_test.py).
+
+# === Config ===
+DATA_FILE = "prescriptions.csv"
+EMBED_DIM = 384
+EXTRACTION_MARKER = "from this prescription text:\n"
+EXTRACTION_END = "\n\nReturn the result as a valid JSON object"
+CANNED_ADVICE = (
+    "Precautions: take medicines as prescribed, stay hydrated and avoid self-medication. "
+    "Follow-up: review in 7 days or earlier if symptoms worsen. "
+    "Allergy alert: watch for rash, itching or breathlessness and stop the medicine if they appear."
+)
+
+def normalize_text(text):
+    return " ".join(str(text or "").split())
+
+# === Latency / Error Profiles ===
+# "fixed:800", "uniform:300:1500" or "lognormal:800:0.5" (median ms, sigma).
+class Profile:
+    def __init__(self, latency, error_rate=0.0, error_statuses=(500,)):
+        kind, *params = latency.split(":")
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution {latency!r}")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+
+    def delay_seconds(self):
+        if self.kind == "fixed":
+            return self.params[0] / 1000
+        if self.kind == "uniform":
+            return random.uniform(*self.params) / 1000
+        median, sigma = self.params
+        return random.lognormvariate(np.log(median), sigma) / 1000
+
+    async def respond(self, build):
+        await asyncio.sleep(self.delay_seconds())
+        if random.random() < self.error_rate:
+            status = random.choice(self.error_statuses)
+            return JSONResponse({"error": {"message": "injected failure", "type": "fake_upstream"}}, status_code=status)
+        return JSONResponse(build())
+
+# === Canned Responses ===
+# Extractions are the stored prescriptions turned back into unmatched LLM output: raw
+# medicine names, test/procedure names, no sku codes or match fields.
+MATCH_FIELDS = ("sku_code", "match_confidence", "match_reason", "raw_medicine_name")
+
+def unmatched_extraction(data):
+    def item(entry, name_key, type_key):
+        return {
+            name_key: entry.get(name_key) or entry.get("name", ""),
+            type_key: entry.get(type_key) or entry.get("type", ""),
+        }
+
+    medicines = []
+    for med in data.get("medicines") or []:
+        raw = {k: v for k, v in med.items() if k not in MATCH_FIELDS}
+        raw["medicine_name"] = med.get("raw_medicine_name") or med.get("medicine_name", "")
+        medicines.append(raw)
+
+    return {
+        "patient": data.get("patient") or {"name": "", "age": 0, "gender": "", "diagnosis": ""},
+        "medicines": medicines,
+        "labtests": [item(t, "test_name", "test_type") for t in data.get("labtests") or []],
+        "radiology": [item(t, "test_name", "test_type") for t in data.get("radiology") or []],
+        "procedures": [item(p, "procedure_name", "procedure_type") for p in data.get("procedures") or []],
+        "precaution": data.get("precaution") or {"medical": "", "non-medical": ""},
+        "followup": data.get("followup") or {"next_followup": ""},
+    }
+
+def load_extractions(data_file=DATA_FILE):
+    df = pd.read_csv(data_file, usecols=["prescription_json", "raw_text"]).dropna()
+    extractions = {}
+    for payload, raw_text in zip(df["prescription_json"], df["raw_text"]):
+        try:
+            extractions[normalize_text(raw_text)] = unmatched_extraction(json.loads(payload) or {})
+        except (TypeError, ValueError):
+            continue
+    return extractions
+
+# Same trigram hashing as benchmark_matcher's stub, so similar strings get close vectors.
+def trigram_embedding(text):
+    vec = np.zeros(EMBED_DIM, dtype="float32")
+    padded = f"  {str(text).lower()} "
+    for i in range(len(padded) - 2):
+        digest = hashlib.md5(padded[i:i + 3].encode("utf-8")).digest()
+        vec[int.from_bytes(digest[:4], "little") % EMBED_DIM] += 1.0
+    return vec.tolist()
+
+def completion(model, content):
+    return {
+        "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+# === App ===
+def create_app(groq, hf, extractions):
+    calls = Counter()
+    canned = list(extractions.values()) or [unmatched_extraction({})]
+
+    def chat_content(prompt):
+        if EXTRACTION_MARKER in prompt:
+            calls["extraction"] += 1
+            text = prompt.split(EXTRACTION_MARKER, 1)[1].split(EXTRACTION_END, 1)[0]
+            data = extractions.get(normalize_text(text))
+            if data is None:
+                # Unknown text still gets a realistic prescription, stable per input.
+                data = canned[int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % len(canned)]
+            return json.dumps(data)
+        if "best option number" in prompt:
+            calls["rerank"] += 1
+            return "1"
+        calls["advice"] += 1
+        return CANNED_ADVICE
+
+    async def chat_completions(request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        return await groq.respond(lambda: completion(body.get("model", ""), chat_content(prompt)))
+
+    async def feature_extraction(request):
+        body = await request.json()
+        calls["embedding"] += 1
+        inputs = body.get("inputs", "")
+        if isinstance(inputs, list):
+            return await hf.respond(lambda: [trigram_embedding(text) for text in inputs])
+        return await hf.respond(lambda: trigram_embedding(inputs))
+
+    async def stats(request):
+        return JSONResponse(dict(calls))
+
+    return Starlette(routes=[
+        Route("/openai/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/models/{model:path}/pipeline/feature-extraction", feature_extraction, methods=["POST"]),
+        Route("/__stats", stats, methods=["GET"]),
+    ])
+
+def statuses(value):
+    return [int(s) for s in value.split(",") if s]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Groq and HF inference servers for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--groq-latency", default="lognormal:1200:0.4")
+    parser.add_argument("--groq-error-rate", type=float, default=0.0)
+    parser.add_argument("--groq-error-statuses", type=statuses, default=[429, 500, 503])
+    parser.add_argument("--hf-latency", default="lognormal:60:0.3")
+    parser.add_argument("--hf-error-rate", type=float, default=0.0)
+    parser.add_argument("--hf-error-statuses", type=statuses, default=[500, 503])
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    app = create_app(
+        Profile(args.groq_latency, args.groq_error_rate, args.groq_error_statuses),
+        Profile(args.hf_latency, args.hf_error_rate, args.hf_error_statuses),
+        load_extractions(args.data_file),
+    )
+    print(f"Fake upstreams on http://{args.host}:{args.port} "
+          f"(GROQ_BASE_URL and HF_INFERENCE_URL both point here)")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,89 @@
+import os
+import json
+import hashlib
+import logging
+import faiss
+import numpy as np
+import pandas as pd
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+CSV_PATH = "procedure_comb_sku.csv"
+INDEX_DIR = "sku_index"
+INDEX_FILE = "investigations.faiss"
+META_FILE = "investigations_meta.json"
+GROUPS = ["Lab", "Radiology", "Procedure"]
+
+# === Catalog ===
+# Entries are laid out group by group (CSV order within each group), so every group owns a
+# contiguous id range in the unified index. Builder and server share this ordering.
+def load_catalog(csv_path=CSV_PATH):
+    df = pd.read_csv(csv_path)
+    entries = []
+    ranges = {}
+    for group in GROUPS:
+        group_df = df[df["group"] == group]
+        start = len(entries)
+        for code, description in zip(group_df["code"], group_df["description"]):
+            entries.append({
+                "id": len(entries),
+                "code": str(code),
+                "description": str(description),
+                "group": group
+            })
+        ranges[group] = (start, len(entries))
+    return entries, ranges
+
+def catalog_fingerprint(entries):
+    digest = hashlib.sha256()
+    for entry in entries:
+        digest.update(f"{entry['group']}\t{entry['code']}\t{entry['description']}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+# === Unified Cosine Index ===
+class InvestigationIndex:
+    def __init__(self, index_dir=INDEX_DIR, csv_path=CSV_PATH):
+        self.entries, self.ranges = load_catalog(csv_path)
+        self.index = None
+        self.vectors = None
+
+        index_path = os.path.join(index_dir, INDEX_FILE)
+        meta_path = os.path.join(index_dir, META_FILE)
+        if not os.path.isfile(index_path) or not os.path.isfile(meta_path):
+            logger.warning(f"[Investigation Index] {index_path} not built; semantic search disabled")
+            return
+
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") != catalog_fingerprint(self.entries):
+            logger.warning("[Investigation Index] Index is stale for the current CSV; semantic search disabled")
+            return
+
+        self.index = faiss.read_index(index_path)
+        # Zero-copy view over the flat index storage for a single matrix-vector pass.
+        self.vectors = faiss.rev_swig_ptr(self.index.get_xb(), self.index.ntotal * self.index.d).reshape(
+            self.index.ntotal, self.index.d
+        )
+
+    @property
+    def available(self):
+        return self.vectors is not None
+
+    def search(self, query_vec, groups, k=5):
+        if not self.available:
+            raise RuntimeError("investigation index not available")
+        query = np.asarray(query_vec, dtype="float32").reshape(-1)
+        results = {}
+        for group in groups:
+            start, end = self.ranges[group]
+            if end <= start:
+                results[group] = []
+                continue
+            scores = self.vectors[start:end] @ query
+            top_k = min(k, end - start)
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+            results[group] = [(self.entries[start + i], float(scores[i])) for i in top]
+        return results
@@ -1,44 +1,64 @@
-import pandas as pd
 import faiss
 import json
-from sentence_transformers import SentenceTransformer
+import argparse
+import numpy as np
+from sklearn.preprocessing import normalize
 import os
+from investigation_index import CSV_PATH, INDEX_DIR, INDEX_FILE, META_FILE, load_catalog, catalog_fingerprint
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # deploys embed through the same HF endpoint the server queries
+    SentenceTransformer = None
 
 # === CONFIG ===
-CSV_PATH = "procedure_comb_sku.csv"
 MODEL_NAME = "all-MiniLM-L6-v2"  # Light, fast, decent accuracy
-GROUPS = ["Lab", "Radiology", "Procedure"]
-OUTPUT_DIR = "sku_index"
-
-# === Ensure Output Dir Exists ===
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+REMOTE_BATCH = 64
 
-# === Load Data ===
-df = pd.read_csv(CSV_PATH)
-assert {"code", "description", "group"}.issubset(df.columns), "CSV must have code, description, group columns"
+parser = argparse.ArgumentParser(description="Build the unified Lab/Radiology/Procedure cosine index")
+parser.add_argument("--if-missing", action="store_true",
+                    help="do nothing if an index built from the current CSV already exists (deploy step)")
+args = parser.parse_args()
 
-# === Load Sentence Embedding Model ===
-model = SentenceTransformer(MODEL_NAME)
+# === Load Data (Lab, Radiology, Procedure in contiguous id ranges) ===
+entries, ranges = load_catalog(CSV_PATH)
+fingerprint = catalog_fingerprint(entries)
+meta_path = os.path.join(INDEX_DIR, META_FILE)
+if args.if_missing and os.path.isfile(os.path.join(INDEX_DIR, INDEX_FILE)) and os.path.isfile(meta_path):
+    with open(meta_path, "r") as f:
+        if json.load(f).get("fingerprint") == fingerprint:
+            print("✅ Unified investigation index is current:", INDEX_DIR)
+            raise SystemExit(0)
+for group, (start, end) in ranges.items():
+    print(f"Group {group}: ids {start}-{end - 1} ({end - start} entries)")
 
-# === Process Each Group ===
-for group in GROUPS:
-    group_df = df[df["group"] == group].reset_index(drop=True)
-    print(f"Processing group: {group} with {len(group_df)} entries")
-    
-    descriptions = group_df["description"].tolist()
+# === Embed Descriptions (local model if installed, else the HF feature-extraction endpoint) ===
+descriptions = [entry["description"] for entry in entries]
+if SentenceTransformer is not None:
+    model = SentenceTransformer(MODEL_NAME)
     embeddings = model.encode(descriptions, show_progress_bar=True)
+else:
+    from upstream import hf_feature_extraction
+    embeddings = []
+    for start in range(0, len(descriptions), REMOTE_BATCH):
+        embeddings.extend(hf_feature_extraction(descriptions[start:start + REMOTE_BATCH], model=f"sentence-transformers/{MODEL_NAME}"))
+        print(f"Embedded {min(start + REMOTE_BATCH, len(descriptions))}/{len(descriptions)}")
+    embeddings = np.array(embeddings, dtype="float32")
+
+# === Build Cosine Index (inner product over L2-normalized vectors) ===
+embeddings = normalize(embeddings, norm="l2").astype("float32")
+index = faiss.IndexFlatIP(embeddings.shape[1])
+index.add(embeddings)
+
+# === Save Index + Metadata ===
+os.makedirs(INDEX_DIR, exist_ok=True)
+faiss.write_index(index, os.path.join(INDEX_DIR, INDEX_FILE))
+with open(meta_path, "w") as f:
+    json.dump({
+        "model": MODEL_NAME,
+        "count": len(entries),
+        "groups": ranges,
+        "fingerprint": fingerprint
+    }, f, indent=2)
 
-    # === Build FAISS Index ===
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
-    
-    # === Save FAISS Index ===
-    faiss.write_index(index, f"{OUTPUT_DIR}/{group}.faiss")
-    
-    # === Save Mapping JSON ===
-    mapping = [{"id": i, "code": group_df.loc[i, "code"], "description": group_df.loc[i, "description"]} for i in range(len(group_df))]
-    with open(f"{OUTPUT_DIR}/{group}_map.json", "w") as f:
-        json.dump(mapping, f, indent=2)
-
-print("✅ FAISS indexes and mapping caches saved to:", OUTPUT_DIR)
\ No newline at end of file
+print("✅ Unified investigation index saved to:", INDEX_DIR)
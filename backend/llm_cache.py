@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from metrics import CACHE_REQUESTS
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Key Helpers ===
+def normalize_text(text):
+    return " ".join(str(text or "").split())
+
+def make_key(*parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# === LRU + TTL Cache with SQLite Backing File ===
+class LLMCache:
+    PRUNE_EVERY = 100
+
+    def __init__(self, path, max_entries=5000, ttl_seconds=7 * 24 * 3600, memory_entries=1000, name=None):
+        self.path = path
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"[Cache] Persistent store disabled for {path}: {e}")
+            self._conn = None
+
+    def _expired(self, created, now):
+        return self.ttl_seconds and now - created > self.ttl_seconds
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created, now):
+                    self._memory.move_to_end(key)
+                    self._record(True)
+                    return json.loads(value)
+                del self._memory[key]
+
+            row = None
+            if self._conn is not None:
+                try:
+                    row = self._conn.execute(
+                        "SELECT value, created FROM cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row and self._expired(row[1], now):
+                        self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                        self._conn.commit()
+                        row = None
+                    elif row:
+                        self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+                        self._conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"[Cache] Read failed: {e}")
+                    row = None
+
+            if row is None:
+                self._record(False)
+                return None
+
+            self._remember(key, row[0], row[1])
+            self._record(True)
+            return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        serialized = json.dumps(value)
+        with self._lock:
+            self._remember(key, serialized, now)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, serialized, now, now)
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._prune(now)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"[Cache] Write failed: {e}")
+
+    def _record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        CACHE_REQUESTS.inc(cache=self.name, result="hit" if hit else "miss")
+
+    def _remember(self, key, serialized, created):
+        self._memory[key] = (serialized, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self, now):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM cache WHERE created < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM cache WHERE key NOT IN "
+            "(SELECT key FROM cache ORDER BY accessed DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "memory_entries": len(self._memory),
+        }
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+import numpy as np
+import pandas as pd
+import httpx
+
+# Open-loop load generator for /extract: requests start on a fixed (or Poisson) schedule
+# whether or not earlier ones have finished, so an overloaded server shows up as growing
+# latency and errors instead of a quietly lower request rate. Run the backend against
+# fake_upstreams.py, never against the real Groq / HF services.
+
+# === Config ===
+DATA_FILE = "prescriptions.csv"
+MEMORY_SAMPLE_SECONDS = 0.5
+
+def load_prescriptions(data_file=DATA_FILE):
+    texts = pd.read_csv(data_file, usecols=["raw_text"])["raw_text"].dropna().astype(str)
+    return [text for text in texts if text.strip()]
+
+# === Per-Worker Memory ===
+# Reads /proc directly: the server PID plus its children (gunicorn workers).
+def process_tree(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+def rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+async def sample_memory(server_pid, samples, stop):
+    while not stop.is_set():
+        for pid in process_tree(server_pid):
+            rss = rss_bytes(pid)
+            if rss is not None:
+                samples.setdefault(pid, []).append(rss)
+        try:
+            await asyncio.wait_for(stop.wait(), MEMORY_SAMPLE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+# === Load Generation ===
+async def send(client, url, text, bypass_cache, results):
+    headers = {"X-Cache-Bypass": "1"} if bypass_cache else {}
+    start = time.perf_counter()
+    try:
+        response = await client.post(url, json={"prescription": text}, headers=headers)
+        outcome = str(response.status_code)
+        cache = response.headers.get("X-Extraction-Cache", "")
+    except httpx.HTTPError as e:
+        outcome = type(e).__name__
+        cache = ""
+    results.append((start, time.perf_counter() - start, outcome, cache))
+
+async def run_load(base_url, texts, rate, duration, poisson=False, bypass_cache=True,
+                   timeout=120.0, max_in_flight=2000, server_pid=None, seed=None):
+    rng = random.Random(seed)
+    url = f"{base_url.rstrip('/')}/extract"
+    results, tasks, memory = [], [], {}
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_memory(server_pid, memory, stop)) if server_pid else None
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        next_at = started
+        while next_at - started < duration:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            tasks.append(asyncio.create_task(send(client, url, rng.choice(texts), bypass_cache, results)))
+            next_at += rng.expovariate(rate) if poisson else 1.0 / rate
+        offered_s = time.perf_counter() - started
+        await asyncio.gather(*tasks)
+        wall_s = time.perf_counter() - started
+
+    stop.set()
+    if sampler:
+        await sampler
+    return build_report(results, rate, duration, offered_s, wall_s, memory)
+
+# === Report ===
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {"count": 0}
+    arr = np.asarray(samples_ms)
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 1),
+        "p50_ms": round(float(np.percentile(arr, 50)), 1),
+        "p90_ms": round(float(np.percentile(arr, 90)), 1),
+        "p95_ms": round(float(np.percentile(arr, 95)), 1),
+        "p99_ms": round(float(np.percentile(arr, 99)), 1),
+        "max_ms": round(float(arr.max()), 1),
+    }
+
+def build_report(results, rate, duration, offered_s, wall_s, memory):
+    outcomes = Counter(outcome for _, _, outcome, _ in results)
+    ok = [latency * 1000 for _, latency, outcome, _ in results if outcome == "200"]
+    total = len(results)
+    return {
+        "target_rate_rps": rate,
+        "duration_s": duration,
+        "requests": total,
+        "offered_rate_rps": round(total / offered_s, 2) if offered_s else 0.0,
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s else 0.0,
+        "wall_time_s": round(wall_s, 2),
+        "error_rate": round(1 - len(ok) / total, 4) if total else 0.0,
+        "outcomes": dict(outcomes.most_common()),
+        "extraction_cache": dict(Counter(cache for *_, cache in results if cache)),
+        "latency_ok": percentiles(ok),
+        "latency_all": percentiles([latency * 1000 for _, latency, _, _ in results]),
+        "memory_by_pid": {
+            str(pid): {"peak_rss_mib": round(max(s) / 2**20, 1), "end_rss_mib": round(s[-1] / 2**20, 1)}
+            for pid, s in sorted(memory.items())
+        },
+    }
+
+def print_report(report):
+    print(f"Target {report['target_rate_rps']} rps for {report['duration_s']}s: "
+          f"{report['requests']} requests sent at {report['offered_rate_rps']} rps")
+    print(f"Throughput: {report['throughput_rps']} successful rps  Wall: {report['wall_time_s']}s  "
+          f"Error rate: {report['error_rate']:.2%}")
+    print(f"Outcomes: {report['outcomes']}  Extraction cache: {report['extraction_cache']}")
+    stats = report["latency_ok"]
+    if stats["count"]:
+        print(f"Latency (200s, ms): p50={stats['p50_ms']} p90={stats['p90_ms']} p95={stats['p95_ms']} "
+              f"p99={stats['p99_ms']} max={stats['max_ms']}")
+    if report["memory_by_pid"]:
+        print("Memory by process:")
+        for pid, mem in report["memory_by_pid"].items():
+            print(f"  pid {pid:>7}: peak={mem['peak_rss_mib']} MiB end={mem['end_rss_mib']} MiB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay prescriptions against /extract at a target rate")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--rate", type=float, default=5.0, help="requests per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of load")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    parser.add_argument("--use-cache", action="store_true", help="let the extraction cache answer repeats")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max-in-flight", type=int, default=2000)
+    parser.add_argument("--server-pid", type=int, default=None, help="gunicorn master / uvicorn PID to sample RSS from")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_load(
+        args.url, load_prescriptions(args.data_file), args.rate, args.duration,
+        poisson=args.poisson, bypass_cache=not args.use_cache, timeout=args.timeout,
+        max_in_flight=args.max_in_flight, server_pid=args.server_pid, seed=args.seed
+    ))
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport saved to {args.output}")
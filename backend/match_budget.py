@@ -0,0 +1,104 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from upstream import remaining_seconds
+
+# === Tiers ===
+# Each tier names the expensive stages it may run and its default latency budget. The
+# lexical stages (exact, strength, attribute, prefix, sparse) are cheap and always run;
+# fuzzy, embedding and llm_rerank run only if the tier includes them and the remaining
+# budget covers their expected cost.
+TIERS = {
+    "fast": {"stages": {"fuzzy"}, "seconds": float(os.environ.get("MATCH_FAST_BUDGET_MS", "500")) / 1000},
+    "balanced": {"stages": {"fuzzy", "embedding"}, "seconds": float(os.environ.get("MATCH_BALANCED_BUDGET_MS", "3000")) / 1000},
+    "accurate": {"stages": {"fuzzy", "embedding", "llm_rerank"}, "seconds": None},
+}
+TIER_ORDER = ["fast", "balanced", "accurate"]
+DEFAULT_TIER = os.environ.get("MATCH_DEFAULT_TIER", "accurate")
+
+# Skipping a stage caps the achieved tier at the best tier that does without it.
+STAGE_TIER_CAP = {"fuzzy": "fast", "embedding": "fast", "llm_rerank": "balanced"}
+
+# Starting cost estimates (seconds), replaced by a moving average of observed stage times.
+STAGE_COST_SECONDS = {"fuzzy": 0.15, "embedding": 0.3, "llm_rerank": 1.0}
+COST_SMOOTHING = 0.2
+stage_costs = dict(STAGE_COST_SECONDS)
+
+def observe_stage(stage, seconds):
+    if stage in stage_costs:
+        stage_costs[stage] += COST_SMOOTHING * (seconds - stage_costs[stage])
+
+# === Per-Request Budget ===
+class MatchBudget:
+    def __init__(self, tier=DEFAULT_TIER, seconds=None):
+        if tier not in TIERS:
+            raise ValueError(f"tier must be one of {', '.join(TIER_ORDER)}")
+        self.tier = tier
+        self.seconds = seconds if seconds is not None else TIERS[tier]["seconds"]
+        self.deadline = None
+        self.achieved = tier
+        # Set once a stage is refused for lack of time: later (costlier) stages are refused
+        # too, so a result never comes from a stage past the tier reported as achieved.
+        self.truncated = False
+
+    def start(self):
+        """Start the clock; matching time, not extraction time, is what the budget bounds."""
+        if self.deadline is None and self.seconds is not None:
+            self.deadline = time.monotonic() + self.seconds
+
+    def remaining(self):
+        """Seconds left under both this budget and the request deadline (None if unbounded)."""
+        own = self.seconds if self.deadline is None else self.deadline - time.monotonic()
+        limits = [r for r in (remaining_seconds(), own) if r is not None]
+        return min(limits) if limits else None
+
+    def allows(self, stage):
+        """Whether to run an expensive stage; a refusal lowers the achieved tier."""
+        if stage in TIERS[self.tier]["stages"] and not self.truncated:
+            remaining = self.remaining()
+            if remaining is None or remaining >= stage_costs[stage]:
+                return True
+            self.truncated = True
+        cap = STAGE_TIER_CAP[stage]
+        if TIER_ORDER.index(cap) < TIER_ORDER.index(self.achieved):
+            self.achieved = cap
+        return False
+
+    def skip_reason(self, stage):
+        """Match reason for a result returned without `stage`, after allows(stage) refused it."""
+        return "tier-limited" if stage not in TIERS[self.tier]["stages"] else "budget-truncated"
+
+    def report(self):
+        return {
+            "requested": self.tier,
+            "achieved": self.achieved,
+            "budget_ms": None if self.seconds is None else round(self.seconds * 1000),
+        }
+
+_budget = contextvars.ContextVar("rxsage_match_budget", default=None)
+
+@contextmanager
+def use_budget(budget):
+    budget.start()
+    token = _budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _budget.reset(token)
+
+def current_budget():
+    # Outside a request (benchmarks, batch scripts) each lookup gets a fresh default-tier budget.
+    budget = _budget.get()
+    return budget if budget is not None else MatchBudget(DEFAULT_TIER, None)
+
+def request_budget(headers, body=None):
+    """Budget from X-Match-Tier / X-Match-Budget-Ms headers or "tier" / "budget_ms" body fields.
+
+    Its clock starts at use_budget(), when matching begins; extraction is bounded only by
+    the request deadline.
+    """
+    body = body or {}
+    tier = headers.get("X-Match-Tier") or body.get("tier") or DEFAULT_TIER
+    budget_ms = headers.get("X-Match-Budget-Ms") or body.get("budget_ms")
+    return MatchBudget(tier, float(budget_ms) / 1000 if budget_ms else None)
@@ -0,0 +1,108 @@
+import os
+import json
+import socket
+import struct
+import threading
+from match_budget import current_budget, TIER_ORDER
+from upstream import remaining_seconds, REQUEST_DEADLINE_SECONDS
+from response_cache import dumps
+
+# Thin-worker side of matcher_service.py: the same matching calls as matcher_v2, sent over
+# a Unix socket, so web workers never load the catalogs, indexes or embeddings.
+
+# === Config ===
+MATCHER_SOCKET = os.environ.get("MATCHER_SOCKET", "/tmp/rxsage-matcher.sock")
+# Extra time allowed past the request deadline for the reply to arrive.
+REPLY_GRACE_SECONDS = 1.0
+
+# === Wire Format ===
+# Each message is a 4-byte big-endian length followed by that many bytes of JSON.
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+def encode_message(payload):
+    body = dumps(payload)
+    return HEADER.pack(len(body)) + body
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("matcher service closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def recv_message(sock):
+    (size,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    if size > MAX_MESSAGE_BYTES:
+        raise ConnectionError(f"matcher message of {size} bytes exceeds the limit")
+    return json.loads(_recv_exactly(sock, size))
+
+# === Errors ===
+class MatcherServiceError(Exception):
+    pass
+
+# === Client ===
+# One connection per thread, opened on first use and reopened once if it went stale.
+# The request's tier, remaining budget and deadline travel with every call, and the tier
+# the service achieved (and whether it truncated) is folded back into the caller's budget.
+class MatcherClient:
+    def __init__(self, path=MATCHER_SOCKET):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def call(self, op, **fields):
+        budget = current_budget()
+        deadline = remaining_seconds()
+        request = encode_message(dict(
+            fields, op=op, tier=budget.tier, budget_seconds=budget.remaining(), deadline_seconds=deadline,
+            truncated=budget.truncated
+        ))
+        timeout = (deadline if deadline is not None else REQUEST_DEADLINE_SECONDS) + REPLY_GRACE_SECONDS
+
+        for attempt in range(2):
+            try:
+                sock = getattr(self._local, "sock", None) or self._connect()
+                sock.settimeout(max(timeout, REPLY_GRACE_SECONDS))
+                sock.sendall(request)
+                response = recv_message(sock)
+                break
+            except socket.timeout as e:
+                self._close()
+                raise MatcherServiceError(f"matcher service timed out after {timeout:.1f}s") from e
+            except OSError as e:
+                self._close()
+                if attempt:
+                    raise MatcherServiceError(f"matcher service unavailable at {self.path}: {e}") from e
+
+        if "error" in response:
+            raise MatcherServiceError(response["error"])
+        achieved = response.get("achieved")
+        if achieved in TIER_ORDER and TIER_ORDER.index(achieved) < TIER_ORDER.index(budget.achieved):
+            budget.achieved = achieved
+        budget.truncated = budget.truncated or bool(response.get("truncated"))
+        return response
+
+    # Same signatures as matcher_v2, so the app can use either.
+    def validate_medicine_names(self, extracted_meds):
+        return self.call("medicines", items=extracted_meds)["items"]
+
+    def validate_group_terms(self, terms, group):
+        return self.call(group, items=terms)["items"]
+
+    def record_corrections(self, appointment_id, previous, current):
+        return self.call("corrections", appointment_id=appointment_id, previous=previous, current=current)["recorded"]
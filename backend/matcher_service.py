@@ -0,0 +1,143 @@
+import os
+
+# Batching defaults for the shared process; set before matcher_v2 reads them at import.
+os.environ.setdefault("MATCH_BATCH_WINDOW_MS", "3")
+os.environ.setdefault("MATCH_FUZZY_WORKERS", "-1")
+
+import json
+import socket
+import signal
+import asyncio
+import logging
+import argparse
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import matcher_v2
+from match_budget import MatchBudget, use_budget, DEFAULT_TIER
+from alias_index import AliasIndex
+from metrics import render_prometheus
+from upstream import request_deadline, REQUEST_DEADLINE_SECONDS
+from matcher_client import HEADER, MAX_MESSAGE_BYTES, MATCHER_SOCKET, encode_message
+
+# Shared matcher process: `python matcher_service.py`, then start the web workers with
+# MATCHER_SOCKET pointing at the same path. The catalogs, indexes and caches are loaded
+# once here instead of in every worker. Each request runs on a pool thread, so lookups
+# from concurrent requests meet in matcher_v2's micro-batchers. With --processes N the
+# loaded matcher is forked into N processes sharing one listening socket (and, copy-on-
+# write, the catalog memory), for more than one core of lexical matching.
+
+# === Logger ===
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# === Config ===
+# Threads mostly wait on embeddings, batches and reranks, so the pool is sized for
+# concurrent requests rather than cores.
+MATCHER_SERVICE_WORKERS = int(os.environ.get("MATCHER_SERVICE_WORKERS", "64"))
+GROUP_OPS = ("lab", "radiology", "procedure")
+
+# === Requests ===
+def handle(request):
+    op = request.get("op")
+    budget = MatchBudget(request.get("tier") or DEFAULT_TIER, request.get("budget_seconds"))
+    budget.truncated = bool(request.get("truncated"))
+    deadline = request.get("deadline_seconds")
+    with request_deadline(REQUEST_DEADLINE_SECONDS if deadline is None else deadline), use_budget(budget):
+        if op == "medicines":
+            items = matcher_v2.validate_medicine_names(request.get("items") or [])
+        elif op in GROUP_OPS:
+            items = matcher_v2.validate_group_terms(request.get("items") or [], op)
+        elif op == "corrections":
+            return {"recorded": matcher_v2.record_corrections(
+                request["appointment_id"], request.get("previous"), request.get("current")
+            )}
+        elif op == "metrics":
+            return {"prometheus": render_prometheus()}
+        elif op == "ping":
+            return {"ok": True}
+        else:
+            raise ValueError(f"unknown op {op!r}")
+    return {"items": items, "achieved": budget.achieved, "truncated": budget.truncated}
+
+def respond(request):
+    try:
+        return handle(request)
+    except Exception as e:
+        logger.warning(f"Matcher request {request.get('op')!r} failed: {e}")
+        return {"error": f"{type(e).__name__}: {e}"}
+
+# === Server ===
+async def serve_connection(pool, reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            try:
+                (size,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+            except asyncio.IncompleteReadError:
+                break
+            if size > MAX_MESSAGE_BYTES:
+                logger.warning(f"Dropping connection after a {size}-byte message")
+                break
+            request = json.loads(await reader.readexactly(size))
+            response = await loop.run_in_executor(pool, functools.partial(respond, request))
+            writer.write(encode_message(response))
+            await writer.drain()
+    except (ConnectionError, ValueError) as e:
+        logger.warning(f"Matcher connection closed: {e}")
+    finally:
+        writer.close()
+
+def listen(path):
+    if os.path.exists(path):
+        os.remove(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(1024)
+    return sock
+
+async def serve(sock):
+    pool = ThreadPoolExecutor(max_workers=MATCHER_SERVICE_WORKERS, thread_name_prefix="rxsage-matcher")
+    server = await asyncio.start_unix_server(functools.partial(serve_connection, pool), sock=sock)
+    async with server:
+        await server.serve_forever()
+
+def serve_forked(sock, processes):
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # SQLite connections must not cross a fork; each process opens its own.
+            matcher_v2.alias_index = AliasIndex(matcher_v2.alias_index.path, matcher_v2.normalize_string.version)
+            asyncio.run(serve(sock))
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    pid, status = os.wait()
+    logger.error(f"Matcher process {pid} exited with status {status}; stopping the service")
+    stop(None, None)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared matcher process for thin web workers")
+    parser.add_argument("--socket", default=MATCHER_SOCKET)
+    parser.add_argument("--processes", type=int, default=1, help="forked matcher processes sharing the socket")
+    args = parser.parse_args()
+
+    sock = listen(args.socket)
+    logger.info(f"Matcher service on {args.socket} ({args.processes} processes x {MATCHER_SERVICE_WORKERS} threads, "
+                f"batch window {matcher_v2.MATCH_BATCH_WINDOW_MS} ms)")
+    if args.processes > 1:
+        serve_forked(sock, args.processes)
+    else:
+        asyncio.run(serve(sock))
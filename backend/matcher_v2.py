@@ -1,7 +1,5 @@
 import os
-import json
 import re
-import faiss
 import pickle
 import numpy as np
 import pandas as pd
@@ -9,10 +7,19 @@ from sklearn.preprocessing import normalize
 # from sentence_transformers import SentenceTransformer
 from difflib import get_close_matches
 import logging
-from rapidfuzz import fuzz
-import groq
-import requests
-from huggingface_hub import InferenceClient
+from rapidfuzz import fuzz, process
+from metrics import StageTimer, MATCH_RESULTS
+from upstream import groq_chat, hf_feature_extraction
+from vector_index import load_index
+from investigation_index import InvestigationIndex
+from sparse_retrieval import SparseRetriever, reciprocal_rank_fusion
+from attribute_index import AttributeIndex
+from normalizer import Normalizer, RULE_MAPS
+from strength_index import StrengthIndex, parse_strengths
+from singleflight import SingleFlight
+from match_budget import current_budget, observe_stage
+from alias_index import AliasIndex, diff_corrections
+from micro_batch import MicroBatcher
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -20,101 +27,120 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# === Groq Client for Reranking ===
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("Missing GROQ_API_KEY")
-groq_client = groq.Groq(api_key=GROQ_API_KEY)
+# === Micro-Batching ===
+# With a window set (matcher_service.py sets one), concurrent lookups share one batched
+# embedding call, one FAISS search and one fuzzy pass; at 0 each runs on its own.
+MATCH_BATCH_WINDOW_MS = float(os.environ.get("MATCH_BATCH_WINDOW_MS", "0"))
+MATCH_BATCH_MAX = int(os.environ.get("MATCH_BATCH_MAX", "64"))
+# rapidfuzz threads for the fuzzy prefilter (-1 = all cores)
+MATCH_FUZZY_WORKERS = int(os.environ.get("MATCH_FUZZY_WORKERS", "1"))
 
-# === Hugging Face Client for Embeddings ===
-hf_client = InferenceClient()
+# === Embeddings via the shared upstream client (pooled, retried, circuit-broken) ===
+# Identical concurrent embedding / rerank requests share one upstream call.
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+embedding_flight = SingleFlight("embedding")
+rerank_flight = SingleFlight("rerank")
+
+def embed_batch(texts):
+    # The feature-extraction endpoint takes a list of inputs and returns one vector each.
+    if len(texts) == 1:
+        return [hf_feature_extraction(texts[0], model=EMBEDDING_MODEL)]
+    return hf_feature_extraction(list(texts), model=EMBEDDING_MODEL)
+
+embedding_batcher = MicroBatcher("embedding", embed_batch, MATCH_BATCH_WINDOW_MS, MATCH_BATCH_MAX)
 
 def get_embedding(text):
     try:
-        embedding = hf_client.feature_extraction(
-            text,
-            model="sentence-transformers/all-MiniLM-L6-v2"
-        )
+        embedding = embedding_flight.do(text, lambda: embedding_batcher.submit(text))
         return np.array(embedding, dtype="float32").reshape(1, -1)
     except Exception as e:
         logger.warning(f"[HF Embedding Error] {e}")
         raise
 
 
-# === Abbreviation and Synonym Maps ===
-ABBREVIATION_MAP = {
-    "syp": "syrup",
-    "tab": "tablet",
-    "cap": "capsule",
-    "inj": "injection",
-    "oint": "ointment",
-    "drop": "drops"
-}
-
-ABBREVIATION_EXPANSION = {
-    "b/l": "bilateral",
-    "ul": "upper limb",
-    "ll": "lower limb",
-    "r": "right",
-    "l": "left",
-    "ncv": "nerve conduction velocity",
-    "kft": "kidney function test",
-    "lft": "liver function test",
-    "cbc": "complete blood count",
-    "tft": "thyroid function test",
-    "renal": "renal function test",
-    "nct": "nerve conduction test",
-    "ncs": "nerve conduction study",
-    "nerve conduction": "nerve conduction study",
-    "nerve conduction velocity": "nerve conduction study",  
-    "emg": "electromyography",
-    "mri": "magnetic resonance imaging",
-    "ct": "computed tomography",
-    "vit": "vitamin"
-}
-
-SYNONYM_MAP = {
-    "both": "bilateral",
-    "arms": "upper limb",
-    "legs": "lower limb",
-    "brain": "head",
-    "abdomen": "stomach"
-}
-
 # === Normalize ===
-def expand_abbreviations(text):
-    text = text.lower()
-    for abbr, full in ABBREVIATION_EXPANSION.items():
-        text = re.sub(rf'\b{re.escape(abbr)}\b', full, text)
-    for syn, full in SYNONYM_MAP.items():
-        text = re.sub(rf'\b{re.escape(syn)}\b', full, text)
-    return text
-
-def normalize_string(text):
-    text = expand_abbreviations(text)
-    for abbr, full in ABBREVIATION_MAP.items():
-        text = re.sub(rf"\b{abbr}\b", full, text)
-    text = re.sub(r"[^a-z0-9]+", " ", text)
-    return text.strip()
+# One engine for medicines and investigations, catalog and query side alike. Catalog
+# columns use the uncached pass so they do not crowd query strings out of the LRU.
+normalize_string = Normalizer(*RULE_MAPS)
+logger.info(f"Normalizer {normalize_string.version}")
 
 # === Load Medicine SKU ===
 sku_df = pd.read_csv("medicine_sku_comp.csv")
 sku_df["medicine_desc"] = sku_df["medicine_desc"].astype(str)
-sku_df["normalized"] = sku_df["medicine_desc"].apply(normalize_string)
-sku_df["strength"] = sku_df["medicine_desc"].apply(
-    lambda x: re.search(r"\b(\d{1,4})\s*(mg|mcg|ug|g|ml)\b", x.lower()).group(0)
-    if re.search(r"\b(\d{1,4})\s*(mg|mcg|ug|g|ml)\b", x.lower()) else ""
-)
+sku_df["normalized"] = sku_df["medicine_desc"].apply(normalize_string.normalize)
+strength_index = StrengthIndex(sku_df["medicine_desc"])
 
 sku_df["sku_code"] = sku_df["sku_code"].astype(str)
 
 sku_code_lookup = dict(zip(sku_df["medicine_desc"], sku_df["sku_code"]))
 
+# Enriched catalog split into name / type / dosage for the structured attribute stage.
+enriched_df = pd.read_csv("medicine_sku_enriched_mapped.csv").fillna("")
+enriched_df["medicine_desc"] = enriched_df["medicine_desc"].astype(str)
+attribute_index = AttributeIndex(
+    enriched_df["medicine_name"].astype(str).apply(normalize_string.normalize),
+    enriched_df["medicine_type"].astype(str).apply(normalize_string.normalize),
+    enriched_df["medicine_dosage"].astype(str).apply(normalize_string.normalize)
+)
+
 with open("faiss_cache/sku_list.pkl", "rb") as f:
     sku_list = pickle.load(f)
 
-sku_vectors = np.load("faiss_cache/sku_vectors.npy")
-faiss_index = faiss.read_index("faiss_cache/hnsw_index.faiss")
+# Index type and search effort come from config; sku_vectors.npy is not needed to serve.
+faiss_index, faiss_index_meta = load_index(
+    "faiss_cache",
+    index_type=os.environ.get("MEDICINE_INDEX_TYPE"),
+    ef_search=os.environ.get("FAISS_EF_SEARCH", "64"),
+    nprobe=os.environ.get("FAISS_NPROBE", "16")
+)
+logger.info(f"Loaded {faiss_index_meta['index_type']} medicine index with {faiss_index.ntotal} vectors")
+
+# === Learned Aliases ===
+# Pharmacist corrections, keyed exactly as the cascades see their input (see alias_key).
+alias_index = AliasIndex(normalizer_version=normalize_string.version)
+sku_desc_by_code = dict(zip(sku_df["sku_code"], sku_df["medicine_desc"]))
+
+def alias_key(kind, line):
+    if kind == "medicine":
+        name = str(line.get("raw_medicine_name") or line.get("medicine_name") or "").strip()
+        if not name:
+            return ""
+        raw_type = str(line.get("medicine_type") or "").strip()
+        raw_dosage = str(line.get("medicine_dosage") or "").strip()
+        return normalize_string(f"{name} {raw_type} {raw_dosage}".strip())
+    return normalize_string(line.get("test_name") or line.get("procedure_name") or line.get("name") or "")
+
+def record_corrections(appointment_id, previous, current):
+    """Learn from the SKUs changed between two saved versions of a prescription."""
+    return alias_index.record(appointment_id, diff_corrections(previous, current, alias_key))
+
+# Local BM25 + character-trigram retrieval; rows line up with sku_list and the FAISS ids.
+medicine_retriever = SparseRetriever(sku_df["normalized"])
+HYBRID_CANDIDATES = 20
+
+def faiss_search_batch(query_vecs):
+    distances, indices = faiss_index.search(np.vstack(query_vecs), HYBRID_CANDIDATES)
+    return list(zip(distances, indices))
+
+faiss_batcher = MicroBatcher("faiss", faiss_search_batch, MATCH_BATCH_WINDOW_MS, MATCH_BATCH_MAX)
+
+# difflib's ratio never exceeds the Indel ratio rapidfuzz computes (its matching blocks
+# form a common subsequence), so one rapidfuzz pass over the catalog keeps every string
+# get_close_matches could return; difflib then ranks only those, with unchanged results.
+FUZZY_CUTOFF = 0.65
+sku_normalized = sku_df["normalized"].tolist()
+
+def fuzzy_batch(queries):
+    scores = process.cdist(
+        queries, sku_normalized, scorer=fuzz.ratio, score_cutoff=FUZZY_CUTOFF * 100 - 0.01,
+        dtype=np.float32, workers=MATCH_FUZZY_WORKERS
+    )
+    return [
+        get_close_matches(query, [sku_normalized[i] for i in np.flatnonzero(row)], n=5, cutoff=FUZZY_CUTOFF)
+        for query, row in zip(queries, scores)
+    ]
+
+fuzzy_batcher = MicroBatcher("fuzzy", fuzzy_batch, MATCH_BATCH_WINDOW_MS, MATCH_BATCH_MAX)
 
 # === Validate Medicine Names ===
 def validate_medicine_names(extracted_meds):
@@ -136,9 +162,25 @@ def validate_medicine_names(extracted_meds):
         norm_base_name = normalize_string(raw_name)
         strength_match = re.search(r"\b(\d{1,4})\s*(mg|mcg|ug|g|ml)\b", raw_dosage.lower())
         strength = strength_match.group(0) if strength_match else ""
+        timer = StageTimer("medicine")
+        budget = current_budget()
 
         try:
-            if norm_input in sku_df["normalized"].values:
+            # Stage zero: a raw name pharmacists have already corrected resolves directly.
+            alias = alias_index.lookup("medicine", norm_input)
+            timer.lap("alias")
+            if alias:
+                sku_code, label, _ = alias
+                med["medicine_name"] = sku_desc_by_code.get(sku_code, label)
+                med["match_confidence"] = 1.0
+                med["match_reason"] = "learned-alias"
+                med["sku_code"] = sku_code
+                validated.append(med)
+                continue
+
+            exact_hit = norm_input in sku_df["normalized"].values
+            timer.lap("exact")
+            if exact_hit:
                 row = sku_df[sku_df["normalized"] == norm_input].iloc[0]
                 med["medicine_name"] = row["medicine_desc"]
                 med["match_confidence"] = 1.0
@@ -147,10 +189,13 @@ def validate_medicine_names(extracted_meds):
                 validated.append(med)
                 continue
 
-            strength_matches = sku_df[sku_df["strength"] == strength]
-            strength_matches = strength_matches[strength_matches["normalized"].str.contains(norm_base_name)]
-            if not strength_matches.empty:
-                row = strength_matches.iloc[0]
+            # Numeric lookup narrows to the rows with this strength before any name comparison.
+            strength_rows = strength_index.candidates(parse_strengths(raw_dosage))
+            normalized_names = sku_df["normalized"].values
+            strength_row = next((row for row in strength_rows if norm_base_name in normalized_names[row]), None)
+            timer.lap("strength")
+            if strength_row is not None:
+                row = sku_df.iloc[strength_row]
                 med["medicine_name"] = row["medicine_desc"]
                 med["match_confidence"] = 0.95
                 med["match_reason"] = "strength-based-name-match"
@@ -158,7 +203,22 @@ def validate_medicine_names(extracted_meds):
                 validated.append(med)
                 continue
 
+            # Name, type and strength must all agree; a lone name hit is left to the prefix stage.
+            norm_type = normalize_string(raw_type)
+            norm_strength = f"{strength_match.group(1)} {strength_match.group(2)}" if strength_match else ""
+            attr_row, attr_score = attribute_index.best_match(norm_base_name, norm_type, norm_strength)
+            timer.lap("attribute")
+            if attr_row is not None and attr_score == 3 and (norm_type or norm_strength):
+                desc = enriched_df["medicine_desc"].iat[attr_row]
+                med["medicine_name"] = desc
+                med["match_confidence"] = 0.94
+                med["match_reason"] = "attribute-index-match"
+                med["sku_code"] = sku_code_lookup.get(desc, "")
+                validated.append(med)
+                continue
+
             starts_with_matches = sku_df[sku_df["normalized"].str.startswith(norm_base_name)]
+            timer.lap("prefix")
             if not starts_with_matches.empty:
                 row = starts_with_matches.iloc[0]
                 med["medicine_name"] = row["medicine_desc"]
@@ -168,7 +228,11 @@ def validate_medicine_names(extracted_meds):
                 validated.append(med)
                 continue
 
-            candidates = get_close_matches(norm_input, sku_df["normalized"].tolist(), n=5, cutoff=0.65)
+            # difflib over the whole catalog is the slowest lexical stage; a short budget skips it.
+            candidates = []
+            if budget.allows("fuzzy"):
+                candidates = fuzzy_batcher.submit(norm_input)
+                observe_stage("fuzzy", timer.lap("fuzzy"))
             if candidates:
                 for candidate in candidates:
                     row = sku_df[sku_df["normalized"] == candidate]
@@ -182,54 +246,84 @@ def validate_medicine_names(extracted_meds):
                 validated.append(med)
                 continue
 
-            query_vec = get_embedding(norm_input)
-            query_vec = normalize(query_vec, norm='l2')
-            distances, indices = faiss_index.search(query_vec, 5)
+            # Local sparse candidates always; FAISS joins via reciprocal-rank fusion when embeddings work.
+            ranked_lists = medicine_retriever.ranked_lists(norm_input, k=HYBRID_CANDIDATES)
+            similarity = dict(ranked_lists[1])
+            timer.lap("sparse")
+            reason = "sparse-local"
+            if not budget.allows("embedding"):
+                reason = budget.skip_reason("embedding")
+            else:
+                try:
+                    query_vec = get_embedding(norm_input)
+                    query_vec = normalize(query_vec, norm='l2')
+                    observe_stage("embedding", timer.lap("embedding"))
+                    distances, indices = faiss_batcher.submit(query_vec)
+                    timer.lap("faiss")
+                    faiss_ranked = [(int(i), float(dist)) for i, dist in zip(indices, distances) if i >= 0]
+                    ranked_lists.append(faiss_ranked)
+                    similarity.update({i: 1 / (1 + dist) for i, dist in faiss_ranked})
+                    reason = "hybrid-faiss-rrf"
+                except Exception as e:
+                    logger.warning(f"[Embedding Unavailable] {raw_name} → local retrieval only: {e}")
 
             candidates = []
-            for i, dist in zip(indices[0], distances[0]):
-                sku = sku_list[i]
-                score = round(1 / (1 + dist), 4)
+            for i, fused_score in reciprocal_rank_fusion(ranked_lists)[:5]:
+                sku = sku_list[i]["medicine_name"]
+                boosts = 0
                 if strength and strength in sku.lower():
-                    score += 0.05
+                    boosts += 1
                 if raw_name.lower() in sku.lower():
-                    score += 0.05
-                candidates.append((sku, score))
+                    boosts += 1
+                score = round(similarity.get(i, 0.0), 4) + 0.05 * boosts
+                candidates.append((i, score, boosts, fused_score))
 
-            candidates.sort(key=lambda x: x[1], reverse=True)
-            best_match, final_score = candidates[0]
+            if candidates:
+                candidates.sort(key=lambda x: (x[2], x[3]), reverse=True)
+                best_row, final_score, _, _ = candidates[0]
 
-            med["medicine_name"] = best_match
-            med["match_confidence"] = float(final_score)
-            med["match_reason"] = "semantic-faiss-reranked"
-            med["sku_code"] = sku_code_lookup.get(best_match, "")
+                med["medicine_name"] = sku_list[best_row]["medicine_name"]
+                med["match_confidence"] = float(final_score)
+                med["match_reason"] = reason
+                med["sku_code"] = sku_list[best_row]["sku_code"]
 
         except Exception as e:
             logger.warning(f"[Validation Error] {raw_name} → {e}")
 
         validated.append(med)
+
+    for med in validated:
+        MATCH_RESULTS.inc(pipeline="medicine", reason=med.get("match_reason", "no-match"))
     return validated
 
-# === Normalization ===
-def expand_abbreviations(text):
-    text = text.lower()
-    for abbr, full in ABBREVIATION_EXPANSION.items():
-        text = re.sub(rf'\b{re.escape(abbr)}\b', full, text)
-    for syn, full in SYNONYM_MAP.items():
-        text = re.sub(rf'\b{re.escape(syn)}\b', full, text)
-    return text
-
-def normalize_string(text):
-    text = expand_abbreviations(text)
-    text = re.sub(r"[^a-z0-9]+", " ", text)
-    return text.strip()
-
-# === FAISS & Mappings ===
-def load_faiss_and_mapping(group):
-    index = faiss.read_index(f"sku_index/{group}.faiss")
-    with open(f"sku_index/{group}_map.json", "r") as f:
-        mapping = json.load(f)
-    return index, mapping
+# === Unified Investigation Index (Lab / Radiology / Procedure) ===
+investigation_index = InvestigationIndex()
+
+# Descriptions are normalized once at load instead of on every query.
+investigation_lexicon = []
+investigation_exact = {}
+for entry in investigation_index.entries:
+    desc = normalize_string.normalize(entry["description"])
+    investigation_lexicon.append((entry, desc, set(desc.split())))
+    investigation_exact.setdefault((entry["group"], desc), entry)
+investigation_retriever = SparseRetriever([desc for _, desc, _ in investigation_lexicon])
+investigation_by_code = {}
+for entry in investigation_index.entries:
+    investigation_by_code.setdefault((entry["group"], entry["code"]), entry)
+
+# Radiology falls back to Procedure within the same single pass.
+GROUP_SEARCH_ORDER = {
+    "lab": ["Lab"],
+    "radiology": ["Radiology", "Procedure"],
+    "procedure": ["Procedure"]
+}
+
+def lexicon_for_groups(groups):
+    pool = []
+    for group in groups:
+        start, end = investigation_index.ranges[group]
+        pool.extend(investigation_lexicon[start:end])
+    return pool
 
 # === LLM Reranker ===
 def rerank_with_llm(query, candidates):
@@ -240,13 +334,13 @@ Given the extracted test name: \"{query}\", and the following options:
 Which of these best matches the test in a medical context? Reply with only the best option number.
 """
     try:
-        completion = groq_client.chat.completions.create(
+        answer = rerank_flight.do(prompt, lambda: groq_chat(
+            "rerank",
             model="llama-3.1-8b-instant",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
             max_tokens=10
-        )
-        answer = completion.choices[0].message.content.strip()
+        ).choices[0].message.content.strip())
         idx = int(answer.split(".")[0]) - 1
         return candidates[idx]
     except Exception as e:
@@ -262,28 +356,33 @@ def match_single_entry(term, group):
     if not norm_name:
         return term
 
-    def get_best_match(norm_term, group_name):
-        index, mapping = load_faiss_and_mapping(group_name)
+    def build_match(entry, confidence, reason):
+        return {
+            "name": term_name,
+            "type": term.get("test_type") or term.get("procedure_type", ""),
+            "matched": entry["description"],
+            "sku_code": entry["code"],
+            "match_confidence": confidence,
+            "match_reason": f"{reason}-{entry['group']}"
+        }
+
+    def get_best_match(norm_term, groups):
+        timer = StageTimer(group)
+        budget = current_budget()
         tokens = set(norm_term.split())
 
         # Step 1: Exact Match
-        for entry in mapping:
-            desc = normalize_string(entry["description"])
-            if norm_term == desc:
-                return {
-                    "name": term_name,
-                    "type": term.get("test_type") or term.get("procedure_type", ""),
-                    "matched": entry["description"],
-                    "sku_code": entry["code"],
-                    "match_confidence": 1.0,
-                    "match_reason": f"normalized-exact-{group_name}"
-                }
+        for group_name in groups:
+            entry = investigation_exact.get((group_name, norm_term))
+            if entry:
+                timer.lap("exact")
+                return build_match(entry, 1.0, "normalized-exact")
+
+        timer.lap("exact")
 
         # Step 2: Token + Fuzzy Score + Heuristic Boosts
         candidates = []
-        for entry in mapping:
-            desc = normalize_string(entry["description"])
-            desc_tokens = set(desc.split())
+        for entry, desc, desc_tokens in lexicon_for_groups(groups):
             jaccard = len(tokens & desc_tokens) / len(tokens | desc_tokens) if tokens else 0
             fuzzy = fuzz.partial_ratio(norm_term, desc) / 100
             score = 0.5 * jaccard + 0.5 * fuzzy
@@ -293,57 +392,67 @@ def match_single_entry(term, group):
             if any(core in desc for core in CORE_TERMS if core in norm_term):
                 score += 0.1
 
-            candidates.append((entry, score))
+            candidates.append((entry, score, desc_tokens))
 
-        candidates.sort(key=lambda x: (-x[1], len(x[0]["description"].split())))
-        top_entry, top_score = candidates[0]
+        if not candidates:
+            return None
+        candidates.sort(key=lambda x: (-x[1], groups.index(x[0]["group"]), len(x[0]["description"].split())))
+        top_entry, top_score, _ = candidates[0]
 
         # Step 3: FAISS + Rerank fallback only if no token subset match
-        top_subset_match = next((c[0] for c in candidates[:5]
-                                 if set(normalize_string(c[0]["description"]).split()).issubset(tokens)), None)
+        top_subset_match = next((c[0] for c in candidates[:5] if c[2].issubset(tokens)), None)
+        timer.lap("token")
 
         if top_subset_match:
-            return {
-                "name": term_name,
-                "type": term.get("test_type") or term.get("procedure_type", ""),
-                "matched": top_subset_match["description"],
-                "sku_code": top_subset_match["code"],
-                "match_confidence": 0.88,
-                "match_reason": f"token-subset-{group_name}"
-            }
+            return build_match(top_subset_match, 0.88, "token-subset")
 
-        try:
-            query_vec = get_embedding(norm_term)
-            query_vec = normalize(query_vec, norm='l2')
-            distances, indices = index.search(query_vec, 5)
-            faiss_candidates = [mapping[i] for i in indices[0]]
-            selected = rerank_with_llm(norm_term, faiss_candidates)
-            return {
-                "name": term_name,
-                "type": term.get("test_type") or term.get("procedure_type", ""),
-                "matched": selected["description"],
-                "sku_code": selected["code"],
-                "match_confidence": round(top_score, 4),
-                "match_reason": f"llm-reranked-{group_name}"
-            }
-        except Exception as e:
-            logger.warning(f"[Groq Embedding Error] {e}")
-
-        return {
-            "name": term_name,
-            "type": term.get("test_type") or term.get("procedure_type", ""),
-            "matched": top_entry["description"],
-            "sku_code": top_entry["code"],
-            "match_confidence": round(top_score, 4),
-            "match_reason": f"jaccard-fuzzy-{group_name}"
+        sparse_ranked = {
+            group_name: investigation_retriever.ranked_lists(norm_term, 10, *investigation_index.ranges[group_name])
+            for group_name in groups
         }
-
-    if group == "radiology":
-        match = get_best_match(norm_name, "Radiology") or get_best_match(norm_name, "Procedure")
-    else:
-        match = get_best_match(norm_name, group.capitalize())
-
-    return match or {
+        timer.lap("sparse")
+        reason = "sparse-reranked"
+        per_group = {}
+        if budget.allows("embedding"):
+            try:
+                query_vec = get_embedding(norm_term)
+                query_vec = normalize(query_vec, norm='l2')
+                observe_stage("embedding", timer.lap("embedding"))
+                per_group = investigation_index.search(query_vec, groups, k=10)
+                timer.lap("faiss")
+                reason = "llm-reranked"
+            except Exception as e:
+                logger.warning(f"[Groq Embedding Error] {e}")
+
+        # Fuse sparse and FAISS rankings per group; primary group candidates come first.
+        rerank_candidates = []
+        for group_name in groups:
+            ranked = list(sparse_ranked[group_name])
+            if group_name in per_group:
+                ranked.append([(entry["id"], score) for entry, score in per_group[group_name]])
+            fused = reciprocal_rank_fusion(ranked)[:5]
+            rerank_candidates.extend(investigation_index.entries[i] for i, _ in fused)
+
+        if rerank_candidates:
+            # Without the rerank (no time, or not in the tier), the best fused candidate of the primary group stands.
+            if not budget.allows("llm_rerank"):
+                return build_match(rerank_candidates[0], round(top_score, 4), budget.skip_reason("llm_rerank"))
+            selected = rerank_with_llm(norm_term, rerank_candidates)
+            observe_stage("llm_rerank", timer.lap("llm_rerank"))
+            return build_match(selected, round(top_score, 4), reason)
+
+        return build_match(top_entry, round(top_score, 4), "jaccard-fuzzy")
+
+    groups = GROUP_SEARCH_ORDER.get(group, [group.capitalize()])
+    match = None
+    alias = alias_index.lookup(group, norm_name)
+    if alias:
+        entry = next((investigation_by_code[(g, alias[0])] for g in groups if (g, alias[0]) in investigation_by_code), None)
+        if entry:
+            match = build_match(entry, 1.0, "learned-alias")
+    match = match or get_best_match(norm_name, groups)
+
+    match = match or {
         "name": term_name,
         "type": term.get("test_type") or term.get("procedure_type", ""),
         "matched": "",
@@ -351,6 +460,8 @@ def match_single_entry(term, group):
         "match_confidence": 0.0,
         "match_reason": "no-match"
     }
+    MATCH_RESULTS.inc(pipeline=group, reason=match["match_reason"])
+    return match
 
 # === Batch Wrapper ===
 def validate_group_terms(terms, group):
@@ -0,0 +1,163 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from tracing import span
+
+# === Prometheus-style In-Process Metrics ===
+# Values are per worker process; scrape every worker (or run a single worker) for totals.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_lock = threading.Lock()
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + body + "}"
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        """{labels dict as a tuple of values: (bucket counts, sum, count)}, copied under the lock."""
+        with _lock:
+            return {key: (list(s[0]), s[1], s[2]) for key, s in self._values.items()}
+
+    def quantile(self, q, **labels):
+        """Estimated q-quantile (0..1) for one label set, interpolated within its bucket the way
+        Prometheus' histogram_quantile() does; None without observations."""
+        with _lock:
+            state = self._values.get(_label_key(self.labelnames, labels))
+            if state is None or not state[2]:
+                return None
+            counts, count = list(state[0]), state[2]
+        rank = q * count
+        cumulative = 0
+        for i, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', repr(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+def render_prometheus():
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# === Shared Metrics ===
+# Lexical stages take microseconds, so the stage histogram starts finer than the default.
+MATCH_STAGE_SECONDS = Histogram(
+    "rxsage_match_stage_seconds", "Time spent in each matcher stage", ("pipeline", "stage"),
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025) + DEFAULT_BUCKETS
+)
+MATCH_RESULTS = Counter(
+    "rxsage_match_results_total", "Matched items by match_reason", ("pipeline", "reason")
+)
+CACHE_REQUESTS = Counter(
+    "rxsage_cache_requests_total", "Cache lookups by result", ("cache", "result")
+)
+UPSTREAM_SECONDS = Histogram(
+    "rxsage_upstream_seconds", "Latency of external calls", ("service", "operation")
+)
+UPSTREAM_CALLS = Counter(
+    "rxsage_upstream_calls_total", "External calls by outcome", ("service", "operation", "outcome")
+)
+
+# === Helpers ===
+class StageTimer:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        elapsed = now - self._last
+        MATCH_STAGE_SECONDS.observe(elapsed, pipeline=self.pipeline, stage=stage)
+        self._last = now
+        return elapsed
+
+@contextmanager
+def track_upstream(service, operation):
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        with span(f"{service}.{operation}"):
+            yield
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - start, service=service, operation=operation)
+        UPSTREAM_CALLS.inc(service=service, operation=operation, outcome=outcome)
@@ -0,0 +1,69 @@
+import threading
+from metrics import Histogram
+
+# === Metrics ===
+MICRO_BATCH_SIZE = Histogram(
+    "rxsage_micro_batch_size", "Items per micro-batch", ("batch",), buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.results = None
+        self.error = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+# === Micro-Batcher ===
+# Gathers items submitted from concurrent threads into one run_batch(items) call, which
+# returns one result per item, in order. The first caller into an empty batch leads: it
+# waits up to the window (or until max_batch items have joined), runs the batch under its
+# own context (trace, deadline) and hands every follower its result or the batch's error.
+# A zero window runs each item alone on the caller's thread.
+class MicroBatcher:
+    def __init__(self, name, run_batch, window_ms=0.0, max_batch=64):
+        self.name = name
+        self.run_batch = run_batch
+        self.window_seconds = window_ms / 1000
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._open = None
+
+    def submit(self, item):
+        if self.window_seconds <= 0:
+            MICRO_BATCH_SIZE.observe(1, batch=self.name)
+            return self.run_batch([item])[0]
+
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            index = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_batch:
+                self._open = None
+                batch.full.set()
+
+        if not leader:
+            batch.done.wait()
+        else:
+            batch.full.wait(self.window_seconds)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            MICRO_BATCH_SIZE.observe(len(batch.items), batch=self.name)
+            try:
+                batch.results = self.run_batch(batch.items)
+            except Exception as e:
+                batch.error = e
+            except BaseException as e:
+                # An interrupt belongs to the leader's thread; followers get an ordinary error.
+                batch.error = RuntimeError(f"{self.name} batch interrupted: {e!r}")
+                raise
+            finally:
+                batch.done.set()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[index]
@@ -0,0 +1,92 @@
+import os
+import re
+import json
+import hashlib
+from functools import lru_cache
+
+# === Config ===
+# Bump NORMALIZER_VERSION when the normalization algorithm itself changes; rule edits
+# change the version digest on their own.
+NORMALIZER_VERSION = "n2"
+NORMALIZER_CACHE_SIZE = int(os.environ.get("NORMALIZER_CACHE_SIZE", "50000"))
+NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# === Abbreviation and Synonym Maps ===
+# The one rule set every matcher and builder normalizes with; its digest is part of the
+# version stored with normalized artifacts.
+ABBREVIATION_MAP = {
+    "syp": "syrup",
+    "tab": "tablet",
+    "cap": "capsule",
+    "inj": "injection",
+    "oint": "ointment",
+    "drop": "drops"
+}
+
+ABBREVIATION_EXPANSION = {
+    "b/l": "bilateral",
+    "ul": "upper limb",
+    "ll": "lower limb",
+    "r": "right",
+    "l": "left",
+    "ncv": "nerve conduction velocity",
+    "kft": "kidney function test",
+    "lft": "liver function test",
+    "cbc": "complete blood count",
+    "tft": "thyroid function test",
+    "renal": "renal function test",
+    "nct": "nerve conduction test",
+    "ncs": "nerve conduction study",
+    "nerve conduction": "nerve conduction study",
+    "nerve conduction velocity": "nerve conduction study",  
+    "emg": "electromyography",
+    "mri": "magnetic resonance imaging",
+    "ct": "computed tomography",
+    "vit": "vitamin"
+}
+
+SYNONYM_MAP = {
+    "both": "bilateral",
+    "arms": "upper limb",
+    "legs": "lower limb",
+    "brain": "head",
+    "abdomen": "stomach"
+}
+
+RULE_MAPS = (ABBREVIATION_EXPANSION, SYNONYM_MAP, ABBREVIATION_MAP)
+
+# === Single-Pass Normalizer ===
+# All expansion maps compile into one word-bounded alternation (longest key first), so
+# every abbreviation, synonym and type expansion is applied in a single scan. Replacements
+# are not rescanned. Catalog and query text must go through the same instance.
+class Normalizer:
+    def __init__(self, *rule_maps, cache_size=NORMALIZER_CACHE_SIZE):
+        self.rules = {}
+        for rule_map in rule_maps:
+            for key, value in rule_map.items():
+                self.rules.setdefault(key.lower(), value)
+        # An expansion that is itself a key resolves to that key's canonical form.
+        for key in self.rules:
+            seen = {key}
+            while self.rules[key] in self.rules and self.rules[key] not in seen:
+                seen.add(self.rules[key])
+                self.rules[key] = self.rules[self.rules[key]]
+
+        keys = sorted(self.rules, key=lambda k: (-len(k), k))
+        self.pattern = re.compile(rf"\b(?:{'|'.join(map(re.escape, keys))})\b") if keys else None
+
+        digest = hashlib.sha256(json.dumps([NON_ALNUM.pattern, sorted(self.rules.items())]).encode("utf-8"))
+        self.version = f"{NORMALIZER_VERSION}-{digest.hexdigest()[:12]}"
+        self._cached = lru_cache(maxsize=cache_size)(self.normalize)
+
+    def normalize(self, text):
+        text = str(text).lower()
+        if self.pattern is not None:
+            text = self.pattern.sub(lambda m: self.rules[m.group(0)], text)
+        return NON_ALNUM.sub(" ", text).strip()
+
+    def __call__(self, text):
+        return self._cached(text)
+
+    def cache_info(self):
+        return self._cached.cache_info()
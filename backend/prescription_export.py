@@ -0,0 +1,186 @@
+import os
+import json
+import argparse
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+DATA_FILE = "prescriptions.csv"
+EXPORT_DIR = "exports"
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "2000"))
+WATERMARK_FILE = "_watermark.json"
+FORMATS = {"parquet": "parquet", "arrow": "ipc"}
+
+# === Schemas ===
+# Fixed schemas keep every chunk (and every incremental run) type-compatible. Line items
+# carry appointment_id and their position in the prescription; `day` is the partition key.
+LINE_KEYS = [("appointment_id", pa.string()), ("day", pa.string()), ("line_no", pa.int32())]
+MATCH_FIELDS = [("sku_code", pa.string()), ("match_confidence", pa.float64()), ("match_reason", pa.string())]
+TEST_FIELDS = [("test_name", pa.string()), ("test_type", pa.string()), ("matched", pa.string())] + MATCH_FIELDS
+
+SCHEMAS = {
+    "prescriptions": pa.schema([
+        ("appointment_id", pa.string()), ("day", pa.string()), ("timestamp", pa.string()),
+        ("updated_at", pa.string()), ("patient_name", pa.string()), ("age", pa.float64()), ("gender", pa.string()),
+        ("diagnosis", pa.string()), ("raw_text", pa.string()),
+    ]),
+    "medicines": pa.schema(LINE_KEYS + [
+        ("medicine_name", pa.string()), ("raw_medicine_name", pa.string()), ("medicine_type", pa.string()),
+        ("medicine_dosage", pa.string()), ("medicine_frequency", pa.string()), ("dosage_advice", pa.string()),
+        ("medicine_duration", pa.string()), ("medicine_quantity", pa.float64()),
+    ] + MATCH_FIELDS),
+    "labtests": pa.schema(LINE_KEYS + TEST_FIELDS),
+    "radiology": pa.schema(LINE_KEYS + TEST_FIELDS),
+    "procedures": pa.schema(LINE_KEYS + [
+        ("procedure_name", pa.string()), ("procedure_type", pa.string()), ("matched", pa.string()),
+    ] + MATCH_FIELDS),
+}
+LINE_TABLES = ("medicines", "labtests", "radiology", "procedures")
+
+def _coerce(value, dtype):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    if pa.types.is_floating(dtype):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if pa.types.is_integer(dtype):
+        return int(value)
+    return value if isinstance(value, str) else json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+def _table(name, records):
+    schema = SCHEMAS[name]
+    columns = {field.name: [_coerce(r.get(field.name), field.type) for r in records] for field in schema}
+    return pa.Table.from_pydict(columns, schema=schema)
+
+# === Streaming Reader ===
+def changed_at(chunk):
+    """When each row last changed: its updated_at if it was edited, else its timestamp."""
+    return chunk["updated_at"].where(chunk["updated_at"] > chunk["timestamp"], chunk["timestamp"])
+
+def read_chunks(data_file=DATA_FILE, since=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield {table_name: pa.Table} per CSV chunk; rows not created or edited after `since` are skipped."""
+    if not os.path.isfile(data_file) or os.path.getsize(data_file) == 0:
+        return
+    for chunk in pd.read_csv(data_file, chunksize=chunk_rows, dtype={"timestamp": str, "updated_at": str}):
+        # Rows saved for unknown appointment ids have no timestamp, and rows never edited
+        # (or written before edits were stamped) have no updated_at; pandas reads both as NaN.
+        chunk["timestamp"] = chunk["timestamp"].fillna("")
+        chunk["updated_at"] = chunk["updated_at"].fillna("") if "updated_at" in chunk else ""
+        if since:
+            chunk = chunk[changed_at(chunk) > since]
+        if chunk.empty:
+            continue
+
+        records = {name: [] for name in SCHEMAS}
+        for row in chunk.to_dict(orient="records"):
+            try:
+                data = json.loads(row.get("prescription_json") or "{}") or {}
+            except (TypeError, ValueError):
+                logger.warning(f"Skipping unparseable prescription {row.get('appointment_id')}")
+                continue
+            timestamp = row["timestamp"]
+            keys = {"appointment_id": row.get("appointment_id"), "day": timestamp[:10] or "unknown"}
+            records["prescriptions"].append({
+                **row, **keys, "timestamp": timestamp,
+                "diagnosis": (data.get("patient") or {}).get("diagnosis"),
+            })
+            for name in LINE_TABLES:
+                for line_no, item in enumerate(data.get(name) or []):
+                    if isinstance(item, dict):
+                        records[name].append({**item, **keys, "line_no": line_no})
+
+        yield {name: _table(name, rows) for name, rows in records.items()}
+
+# === Partitioned Files (CLI) ===
+def read_watermark(output_dir):
+    try:
+        with open(os.path.join(output_dir, WATERMARK_FILE)) as f:
+            return json.load(f).get("timestamp")
+    except (OSError, ValueError):
+        return None
+
+def export_dataset(output_dir=EXPORT_DIR, data_file=DATA_FILE, since=None, fmt="parquet"):
+    """Write every table under output_dir/<table>/day=<YYYY-MM-DD>/ and advance the watermark."""
+    watermark = since
+    counts = {name: 0 for name in SCHEMAS}
+    # Each run gets its own file names so incremental exports add files instead of replacing them.
+    run_id = pd.Timestamp.now().strftime("%Y%m%dT%H%M%S%f")
+    for chunk_no, tables in enumerate(read_chunks(data_file, since)):
+        for name, table in tables.items():
+            if not table.num_rows:
+                continue
+            ds.write_dataset(
+                table, os.path.join(output_dir, name), format=FORMATS[fmt],
+                partitioning=ds.partitioning(pa.schema([("day", pa.string())]), flavor="hive"),
+                basename_template=f"part-{run_id}-{chunk_no}-{{i}}.{fmt}",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            counts[name] += table.num_rows
+        prescriptions = tables["prescriptions"]
+        stamps = prescriptions.column("timestamp").to_pylist() + prescriptions.column("updated_at").to_pylist()
+        latest = max(filter(None, stamps), default=None)
+        if latest and (watermark is None or latest > watermark):
+            watermark = latest
+
+    if watermark:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, WATERMARK_FILE), "w") as f:
+            json.dump({"timestamp": watermark}, f)
+    return counts, watermark
+
+# === Streaming Download (HTTP) ===
+class _ByteSink:
+    """Write-only file object whose bytes are drained after each written batch."""
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+def stream_table(name, fmt="parquet", data_file=DATA_FILE, since=None):
+    """Yield one table as a Parquet file (a row group per chunk) or an Arrow IPC stream."""
+    sink = _ByteSink()
+    schema = SCHEMAS[name]
+    writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+    try:
+        for tables in read_chunks(data_file, since):
+            if tables[name].num_rows:
+                writer.write_table(tables[name])
+                yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export prescription history as partitioned Parquet/Arrow tables")
+    parser.add_argument("--output-dir", default=EXPORT_DIR)
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--since", default=None, help="only export prescriptions created or edited after this ISO timestamp")
+    parser.add_argument("--incremental", action="store_true", help="continue from the output dir's watermark")
+    args = parser.parse_args()
+
+    since = args.since or (read_watermark(args.output_dir) if args.incremental else None)
+    counts, watermark = export_dataset(args.output_dir, args.data_file, since, args.format)
+    print(f"Exported {counts} since {since or 'the beginning'} to {args.output_dir}; watermark {watermark}")
@@ -0,0 +1,285 @@
+import os
+import copy
+import json
+import gzip
+import time
+import sqlite3
+import logging
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: edits serialize within one process only
+    fcntl = None
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+REVISIONS_DB_PATH = os.environ.get("REVISIONS_DB_PATH", "cache/revisions.sqlite")
+# A full snapshot is stored every this many revisions, so reading one replays few patches.
+SNAPSHOT_INTERVAL = int(os.environ.get("REVISION_SNAPSHOT_INTERVAL", "20"))
+
+SECTIONS = ("medicines", "labtests", "radiology", "procedures")
+# Fields the matcher reads; changing any of them re-matches the line.
+MATCH_INPUTS = {
+    "medicines": ("medicine_name", "medicine_type", "medicine_dosage"),
+    "labtests": ("test_name", "test_type"),
+    "radiology": ("test_name", "test_type"),
+    "procedures": ("procedure_name", "procedure_type"),
+}
+# Fields the matcher writes; they are cleared before a line is re-matched.
+MATCH_OUTPUTS = ("sku_code", "match_confidence", "match_reason", "raw_medicine_name", "matched")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS revisions (
+    appointment_id TEXT NOT NULL, revision INTEGER NOT NULL, created REAL NOT NULL,
+    ops BLOB, snapshot BLOB, PRIMARY KEY (appointment_id, revision)
+);
+"""
+
+class RevisionConflict(Exception):
+    pass
+
+def _pack(payload):
+    return gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), mtime=0)
+
+def _unpack(blob):
+    return json.loads(gzip.decompress(blob)) if blob is not None else None
+
+# === Line Operations ===
+# {"op": "add", "section": ..., "item": {...}, "index": optional position}
+# {"op": "remove", "section": ..., "index": i}
+# {"op": "replace", "section": ..., "index": i, "item": {fields to change}}
+# Ops apply in order, each to the result of the previous one. A replace merges its fields
+# into the line. Added lines and lines whose matcher inputs changed are re-matched, unless
+# the op sets sku_code itself (a pharmacist's pick, kept as given).
+def match_input(section, item):
+    if section == "medicines":
+        return (item.get("raw_medicine_name") or item.get("medicine_name") or "",
+                item.get("medicine_type") or "", str(item.get("medicine_dosage") or ""))
+    return tuple(str(item.get(field) or "") for field in MATCH_INPUTS[section])
+
+def _index(op, lines, allow_end=False):
+    index = op.get("index", len(lines) if allow_end else None)
+    limit = len(lines) + (1 if allow_end else 0)
+    if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < limit:
+        raise ValueError(f"{op['op']} needs an index in [0, {limit}) for {op['section']}")
+    return index
+
+def apply_ops(doc, ops, match):
+    """(new document, resolved ops) after applying line ops to a stored prescription.
+
+    match(section, items) matches a batch of raw lines and returns them in stored shape;
+    it is called once per section that has lines to re-match. Resolved ops carry each
+    touched line as finally stored, so replay() rebuilds the document without matching.
+    """
+    if not isinstance(ops, list) or not ops:
+        raise ValueError("ops must be a non-empty list")
+    doc = copy.deepcopy(doc)
+    pending = {}
+    touched = []
+    # Lines already replaced since the last add / remove in their section: a second replace
+    # of one of them is folded into its first entry (same position, final contents).
+    replaced = {section: [] for section in SECTIONS}
+
+    for op in ops:
+        if not isinstance(op, dict) or op.get("op") not in ("add", "remove", "replace"):
+            raise ValueError("each op needs an op of add, remove or replace")
+        section = op.get("section")
+        if section not in SECTIONS:
+            raise ValueError(f"section must be one of {', '.join(SECTIONS)}")
+        lines = doc.setdefault(section, [])
+        item = op.get("item")
+        if op["op"] != "remove" and not isinstance(item, dict):
+            raise ValueError(f"{op['op']} needs an item object")
+
+        if op["op"] == "remove":
+            index = _index(op, lines)
+            lines.pop(index)
+            touched.append(("remove", section, index, None))
+            replaced[section] = []
+            continue
+
+        if op["op"] == "add":
+            index = _index(op, lines, allow_end=True)
+            line = dict(item)
+            lines.insert(index, line)
+            replaced[section] = []
+            rematch = "sku_code" not in item
+        else:
+            index = _index(op, lines)
+            line = lines[index]
+            before = match_input(section, line)
+            renamed = item.get("medicine_name", line.get("medicine_name")) != line.get("medicine_name")
+            if section == "medicines" and renamed and "sku_code" not in item:
+                # A retyped medicine name is new raw input, not a catalog entry.
+                line.pop("raw_medicine_name", None)
+            line.update(item)
+            rematch = "sku_code" not in item and match_input(section, line) != before
+        if op["op"] == "add" or not any(line is other for other in replaced[section]):
+            touched.append((op["op"], section, index, line))
+            if op["op"] == "replace":
+                replaced[section].append(line)
+        if rematch:
+            if section == "medicines" and line.get("raw_medicine_name"):
+                # Re-match from the extracted name, not the catalog name it last matched.
+                line["medicine_name"] = line["raw_medicine_name"]
+            for field in MATCH_OUTPUTS:
+                line.pop(field, None)
+            waiting = pending.setdefault(section, [])
+            if match_input(section, line)[0] and not any(line is other for other in waiting):
+                waiting.append(line)
+
+    # One matcher call per section; results replace the pending lines in place.
+    for section, lines in pending.items():
+        live = [line for line in lines if any(line is other for other in doc[section])]
+        if not live:
+            continue
+        matched = match(section, [dict(line) for line in live])
+        for line, result in zip(live, matched):
+            extra = {k: v for k, v in line.items() if k not in result}
+            line.clear()
+            line.update(extra)
+            line.update(result)
+
+    # Matching changes line contents, never positions, so the same op sequence carrying
+    # each line's final contents rebuilds this document.
+    resolved = []
+    for kind, section, index, line in touched:
+        op = {"op": "set" if kind == "replace" else kind, "section": section, "index": index}
+        if line is not None:
+            op["item"] = copy.deepcopy(line)
+        resolved.append(op)
+    return doc, resolved
+
+def replay(doc, resolved):
+    """Apply resolved ops (add / set / remove) to a stored document."""
+    doc = copy.deepcopy(doc)
+    for op in resolved:
+        lines = doc.setdefault(op["section"], [])
+        if op["op"] == "add":
+            lines.insert(op["index"], copy.deepcopy(op["item"]))
+        elif op["op"] == "set":
+            lines[op["index"]] = copy.deepcopy(op["item"])
+        else:
+            lines.pop(op["index"])
+    return doc
+
+# === Edit Locks ===
+# One appointment's read-modify-write (CSV row and revision) runs under a lock file
+# stripe, so concurrent edits from any thread or worker process apply one after another.
+EDIT_LOCK_STRIPES = 64
+_thread_locks = [threading.Lock() for _ in range(EDIT_LOCK_STRIPES)]
+
+@contextmanager
+def edit_lock(appointment_id, path=REVISIONS_DB_PATH):
+    stripe = int(hashlib.sha256(str(appointment_id).encode("utf-8")).hexdigest()[:8], 16) % EDIT_LOCK_STRIPES
+    with _thread_locks[stripe], open(f"{path}.edit-{stripe}.lock", "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+# === Revision Store ===
+# Revision 1 of an appointment is a snapshot of the prescription when it was first edited
+# here, re-taken whenever the stored prescription no longer matches the head revision; each
+# later revision stores its resolved ops and raw text change. Every SNAPSHOT_INTERVAL
+# revisions (and on every full save) the whole document is stored too, so reading a
+# revision replays at most that many patches.
+class PrescriptionRevisions:
+    def __init__(self, path=REVISIONS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def head(self, appointment_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(revision) FROM revisions WHERE appointment_id = ?", (appointment_id,)
+            ).fetchone()
+        return row[0] or 0
+
+    def append(self, appointment_id, doc, raw_text, ops=None, base=None, expected=None):
+        """Store the next revision and return its number.
+
+        doc / raw_text are the document after this revision. base (doc, raw_text) is the
+        stored prescription before it, snapshotted first if it is not the head revision's
+        document (no history yet, or a write whose revision was never recorded), so ops
+        always replay onto what they were applied to. ops=None records a full save, which
+        is stored as a snapshot. Raises RevisionConflict if expected is given and is
+        not the current head, or if another writer takes the revision number first.
+        """
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                cur = self._conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                head = cur.execute(
+                    "SELECT MAX(revision) FROM revisions WHERE appointment_id = ?", (appointment_id,)
+                ).fetchone()[0] or 0
+                if expected is not None and expected != head:
+                    raise RevisionConflict(f"revision {expected} is stale; current revision is {head}")
+                current = self._document(cur, appointment_id, head) if base is not None and head else None
+                if base is not None and (current is None or current["extracted"] != base[0]
+                                         or (current["raw_text"] or "") != (base[1] or "")):
+                    head += 1
+                    cur.execute(
+                        "INSERT INTO revisions VALUES (?, ?, ?, NULL, ?)",
+                        (appointment_id, head, now, _pack({"extracted": base[0], "raw_text": base[1]}))
+                    )
+                revision = head + 1
+                snapshot = ops is None or revision % SNAPSHOT_INTERVAL == 0
+                cur.execute(
+                    "INSERT INTO revisions VALUES (?, ?, ?, ?, ?)",
+                    (appointment_id, revision, now,
+                     None if ops is None else _pack({"ops": ops, "raw_text": raw_text}),
+                     _pack({"extracted": doc, "raw_text": raw_text}) if snapshot else None)
+                )
+                return revision
+        except sqlite3.IntegrityError as e:
+            raise RevisionConflict(f"concurrent edit of {appointment_id}") from e
+
+    def history(self, appointment_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT revision, created, ops FROM revisions WHERE appointment_id = ? ORDER BY revision",
+                (appointment_id,)
+            ).fetchall()
+        history = []
+        for revision, created, ops in rows:
+            patch = _unpack(ops)
+            history.append({
+                "revision": revision,
+                "created": created,
+                "kind": "patch" if patch is not None else "snapshot",
+                "ops": patch["ops"] if patch is not None else None,
+            })
+        return history
+
+    def document(self, appointment_id, revision):
+        """{"extracted": ..., "raw_text": ...} as of a revision, or None if it does not exist."""
+        with self._lock:
+            return self._document(self._conn, appointment_id, revision)
+
+    def _document(self, conn, appointment_id, revision):
+        rows = conn.execute(
+            "SELECT revision, ops, snapshot FROM revisions WHERE appointment_id = ? AND revision <= ? "
+            "AND revision >= (SELECT MAX(revision) FROM revisions WHERE appointment_id = ? "
+            "AND revision <= ? AND snapshot IS NOT NULL) ORDER BY revision",
+            (appointment_id, revision, appointment_id, revision)
+        ).fetchall()
+        if not rows or rows[-1][0] != revision:
+            return None
+        state = _unpack(rows[0][2])
+        for _, ops, _ in rows[1:]:
+            patch = _unpack(ops)
+            state = {"extracted": replay(state["extracted"], patch["ops"]), "raw_text": patch["raw_text"]}
+        return state
@@ -0,0 +1,106 @@
+import os
+import json
+import gzip
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:  # falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only without the brotli package
+    brotli = None
+
+# === Config ===
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("RESPONSE_CACHE_ENTRIES", "512"))
+# Bodies smaller than this are sent as-is; compressing them costs more than it saves.
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+JSON_CONTENT_TYPE = "application/json"
+
+# === Serialization ===
+def _default(value):
+    # numpy / pandas scalars that the stdlib encoder does not know
+    if hasattr(value, "item"):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(payload):
+    """Compact UTF-8 JSON bytes. NaN and infinities become null, as in the orjson encoder."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_finite(payload), default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def _finite(value):
+    if isinstance(value, float):
+        return value if value == value and value not in (float("inf"), float("-inf")) else None
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    return value
+
+# === Encoded Bodies ===
+# One serialized body with its compressed variants, each built on first request and
+# kept for as long as the body is cached.
+class EncodedBody:
+    def __init__(self, identity):
+        self.identity = identity
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def get(self, encoding):
+        if encoding is None or len(self.identity) < MIN_COMPRESS_BYTES:
+            return None, self.identity
+        data = self._encoded.get(encoding)
+        if data is None:
+            with self._lock:
+                data = self._encoded.get(encoding)
+                if data is None:
+                    if encoding == "br":
+                        data = brotli.compress(self.identity, quality=BROTLI_QUALITY)
+                    else:
+                        data = gzip.compress(self.identity, compresslevel=GZIP_LEVEL, mtime=0)
+                    self._encoded[encoding] = data
+        return encoding, data
+
+def negotiate(accept_encodings):
+    """Best of br / gzip from a werkzeug MIMEAccept-style Accept-Encoding, or None for identity."""
+    offers = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return accept_encodings.best_match(offers) if accept_encodings else None
+
+def encoding_etag(etag, encoding):
+    """The ETag of one encoding of a body: '"v"' stays as-is for identity, '"v-gzip"' for gzip."""
+    return etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+# === Versioned Response Cache ===
+# One body per resource, tagged with its version (a catalog ETag, the data file's mtime):
+# a hit costs no serialization or compression, and a new version replaces the old body.
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, resource, version, build):
+        """The EncodedBody for this version of resource, calling build() for its JSON bytes on a miss."""
+        with self._lock:
+            entry = self._entries.get(resource)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(resource)
+                return entry[1]
+        body = EncodedBody(build())
+        with self._lock:
+            self._entries[resource] = (version, body)
+            self._entries.move_to_end(resource)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
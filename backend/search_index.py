@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import date, datetime
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: concurrent first starts may rebuild twice
+    fcntl = None
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+SEARCH_DB_PATH = os.environ.get("SEARCH_DB_PATH", "cache/search.sqlite")
+DATA_FILE = "prescriptions.csv"
+REBUILD_CHUNK_ROWS = 5000
+MAX_PAGE_SIZE = 100
+
+# bm25() weights, in FTS column order: a hit in the patient name or a SKU code outranks
+# one buried in the raw prescription text.
+FTS_COLUMNS = ("patient_name", "diagnosis", "medicines", "investigations", "sku_codes", "raw_text")
+FTS_WEIGHTS = (8.0, 4.0, 4.0, 3.0, 6.0, 1.0)
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY, appointment_id TEXT UNIQUE NOT NULL, day TEXT NOT NULL,
+    timestamp TEXT, patient_name TEXT, age REAL, gender TEXT, diagnosis TEXT
+);
+CREATE INDEX IF NOT EXISTS docs_day ON docs(day);
+CREATE TABLE IF NOT EXISTS doc_skus (
+    id INTEGER NOT NULL, sku_code TEXT NOT NULL, PRIMARY KEY (sku_code, id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    {", ".join(FTS_COLUMNS)}, tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# === Documents ===
+ITEM_GROUPS = ("labtests", "radiology", "procedures")
+
+def _text(values):
+    return " ".join(str(v) for v in values if v not in (None, "") and not (isinstance(v, float) and pd.isna(v)))
+
+def build_document(data, raw_text):
+    patient = data.get("patient") or {}
+    medicines = [m for m in data.get("medicines") or [] if isinstance(m, dict)]
+    items = [i for group in ITEM_GROUPS for i in data.get(group) or [] if isinstance(i, dict)]
+    sku_codes = sorted({str(i["sku_code"]) for i in medicines + items if i.get("sku_code")})
+    return {
+        "patient_name": patient.get("name") or "",
+        "age": patient.get("age"),
+        "gender": patient.get("gender") or "",
+        "diagnosis": patient.get("diagnosis") or "",
+        "medicines": _text(v for m in medicines for v in (m.get("medicine_name"), m.get("raw_medicine_name"))),
+        "investigations": _text(
+            v for i in items
+            for v in (i.get("test_name") or i.get("procedure_name") or i.get("name"), i.get("matched"))
+        ),
+        "sku_codes": sku_codes,
+        "raw_text": raw_text or "",
+    }
+
+def match_expression(query):
+    """Free text to an FTS5 expression: every word must match, the last one as a prefix."""
+    tokens = TOKEN.findall(query.lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+def _day(timestamp):
+    try:
+        return datetime.fromisoformat(str(timestamp)).date().isoformat()
+    except ValueError:
+        return date.today().isoformat()
+
+# === FTS5 Index ===
+# docs holds filterable metadata, docs_fts the searchable text under the same rowid, and
+# doc_skus an exact sku_code filter. Writes replace the appointment's previous document.
+class PrescriptionSearch:
+    def __init__(self, path=SEARCH_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def _write(self, cur, appointment_id, timestamp, data, raw_text):
+        doc = build_document(data, raw_text)
+        existing = cur.execute(
+            "SELECT id, day, timestamp FROM docs WHERE appointment_id = ?", (appointment_id,)
+        ).fetchone()
+        if existing:
+            doc_id, day, previous = existing
+            timestamp = timestamp or previous
+            day = _day(timestamp) if timestamp else day
+            cur.execute("DELETE FROM docs_fts WHERE rowid = ?", (doc_id,))
+            cur.execute("DELETE FROM doc_skus WHERE id = ?", (doc_id,))
+            cur.execute(
+                "UPDATE docs SET day = ?, timestamp = ?, patient_name = ?, age = ?, gender = ?, diagnosis = ? "
+                "WHERE id = ?",
+                (day, timestamp, doc["patient_name"], doc["age"], doc["gender"], doc["diagnosis"], doc_id)
+            )
+        else:
+            day = _day(timestamp) if timestamp else date.today().isoformat()
+            doc_id = cur.execute(
+                "INSERT INTO docs (appointment_id, day, timestamp, patient_name, age, gender, diagnosis) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (appointment_id, day, timestamp, doc["patient_name"], doc["age"], doc["gender"], doc["diagnosis"])
+            ).lastrowid
+
+        cur.execute(
+            f"INSERT INTO docs_fts (rowid, {', '.join(FTS_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (doc_id, doc["patient_name"], doc["diagnosis"], doc["medicines"], doc["investigations"],
+             " ".join(doc["sku_codes"]), doc["raw_text"])
+        )
+        cur.executemany("INSERT OR IGNORE INTO doc_skus VALUES (?, ?)", [(doc_id, code) for code in doc["sku_codes"]])
+
+    def index(self, appointment_id, timestamp, data, raw_text):
+        """Add or replace one prescription; timestamp may be None for edits."""
+        with self._lock, self._conn:
+            self._write(self._conn.cursor(), appointment_id, timestamp, data, raw_text)
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM docs LIMIT 1").fetchone() is None
+
+    def rebuild_if_empty(self, data_file=DATA_FILE):
+        """Rebuild from history if nothing is stored yet; returns the count, or None if skipped.
+
+        Concurrent callers (several workers or deploy steps) serialize on a lock file next
+        to the database, so only the first one rebuilds.
+        """
+        with open(f"{self.path}.lock", "w") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            return self.rebuild(data_file) if self.is_empty() else None
+
+    def rebuild(self, data_file=DATA_FILE):
+        with self._lock, self._conn:
+            cur = self._conn.cursor()
+            for table in ("docs", "doc_skus", "docs_fts"):
+                cur.execute(f"DELETE FROM {table}")
+            if os.path.isfile(data_file) and os.path.getsize(data_file) > 0:
+                columns = ["appointment_id", "prescription_json", "timestamp", "raw_text"]
+                for chunk in pd.read_csv(data_file, usecols=columns, chunksize=REBUILD_CHUNK_ROWS):
+                    for appointment_id, payload, timestamp, raw_text in chunk.itertuples(index=False):
+                        try:
+                            data = json.loads(payload) or {}
+                        except (TypeError, ValueError):
+                            continue
+                        raw_text = "" if isinstance(raw_text, float) else raw_text
+                        self._write(cur, appointment_id, timestamp if isinstance(timestamp, str) else None, data, raw_text)
+            cur.execute("INSERT INTO docs_fts(docs_fts) VALUES ('optimize')")
+            return cur.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    # === Queries ===
+    def search(self, query="", date_from=None, date_to=None, gender=None, sku_code=None, page=1, per_page=20):
+        """Ranked matches with snippets; without a query, the newest prescriptions matching the filters."""
+        per_page = min(max(per_page, 1), MAX_PAGE_SIZE)
+        page = max(page, 1)
+        expression = match_expression(query or "")
+
+        joins, where, params = [], [], []
+        if expression:
+            joins.append("JOIN docs_fts ON docs_fts.rowid = d.id")
+            where.append("docs_fts MATCH ?")
+            params.append(expression)
+        if sku_code:
+            joins.append("JOIN doc_skus s ON s.id = d.id AND s.sku_code = ?")
+            params.insert(0, sku_code)
+        if date_from:
+            where.append("d.day >= ?")
+            params.append(date_from)
+        if date_to:
+            where.append("d.day <= ?")
+            params.append(date_to)
+        if gender:
+            where.append("UPPER(d.gender) = UPPER(?)")
+            params.append(gender)
+
+        source = f"FROM docs d {' '.join(joins)} {'WHERE ' + ' AND '.join(where) if where else ''}"
+        if expression:
+            columns = "d.appointment_id, d.timestamp, d.patient_name, d.age, d.gender, d.diagnosis, " \
+                      "snippet(docs_fts, 5, '[', ']', '…', 12), bm25(docs_fts, " + ", ".join(map(str, FTS_WEIGHTS)) + ")"
+            order = "ORDER BY 8, d.day DESC"
+        else:
+            columns = "d.appointment_id, d.timestamp, d.patient_name, d.age, d.gender, d.diagnosis, '', 0.0"
+            order = "ORDER BY d.day DESC, d.timestamp DESC"
+
+        with self._lock:
+            cur = self._conn.cursor()
+            total = cur.execute(f"SELECT COUNT(*) {source}", params).fetchone()[0]
+            rows = cur.execute(
+                f"SELECT {columns} {source} {order} LIMIT ? OFFSET ?", params + [per_page, (page - 1) * per_page]
+            ).fetchall()
+
+        return {
+            "query": query,
+            "page": page,
+            "per_page": per_page,
+            "total": total,
+            "results": [
+                {
+                    "appointment_id": appointment_id, "timestamp": timestamp, "patient_name": patient_name,
+                    "age": age, "gender": gender, "diagnosis": diagnosis, "snippet": snippet,
+                    "score": round(-rank, 4) if expression else None,
+                }
+                for appointment_id, timestamp, patient_name, age, gender, diagnosis, snippet, rank in rows
+            ],
+        }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-text search index over prescriptions")
+    parser.add_argument("--rebuild", action="store_true", help="re-index the prescriptions CSV")
+    parser.add_argument("--if-empty", action="store_true", help="with --rebuild, only if the index is empty (deploy step)")
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--db", default=SEARCH_DB_PATH)
+    parser.add_argument("query", nargs="?", default="")
+    args = parser.parse_args()
+
+    search = PrescriptionSearch(args.db)
+    if args.rebuild and args.if_empty:
+        count = search.rebuild_if_empty(args.data_file)
+        print("Search index already built in" if count is None else f"Indexed {count} prescriptions into", args.db)
+    elif args.rebuild:
+        print(f"Indexed {search.rebuild(args.data_file)} prescriptions into", args.db)
+    if args.query:
+        print(json.dumps(search.search(args.query), indent=2, ensure_ascii=False))
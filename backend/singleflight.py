@@ -0,0 +1,165 @@
+import os
+import asyncio
+import hashlib
+import functools
+import threading
+from contextlib import contextmanager
+from metrics import Counter
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: in-process coalescing only
+    fcntl = None
+
+# === Config ===
+# Set SINGLEFLIGHT_LOCK_DIR to also coalesce across worker processes. Only calls whose
+# result lands in a shared cache (extraction, advice) can use it: the lock holder fills
+# the cache and waiting workers re-read it instead of calling upstream.
+SINGLEFLIGHT_LOCK_DIR = os.environ.get("SINGLEFLIGHT_LOCK_DIR") or None
+LOCK_STRIPES = 256
+
+# === Metrics ===
+# Coalescing ratio = (follower + remote_follower) / all calls, per group.
+SINGLEFLIGHT_CALLS = Counter(
+    "rxsage_singleflight_calls_total", "Calls through a single-flight group by role", ("group", "role")
+)
+
+class _Call:
+    def __init__(self, done):
+        self.done = done
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+@contextmanager
+def _process_lock(group, key):
+    os.makedirs(SINGLEFLIGHT_LOCK_DIR, exist_ok=True)
+    stripe = int(hashlib.sha256(str(key).encode("utf-8")).hexdigest()[:8], 16) % LOCK_STRIPES
+    with open(os.path.join(SINGLEFLIGHT_LOCK_DIR, f"{group}-{stripe}.lock"), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _release_acquired(lock, acquire):
+    if not acquire.cancelled() and acquire.exception() is None:
+        lock.__exit__(None, None, None)
+
+def cross_process_enabled():
+    return SINGLEFLIGHT_LOCK_DIR is not None and fcntl is not None
+
+# === Single-Flight Group ===
+# Concurrent calls with the same key share one execution; followers block (or await)
+# until the leader finishes and receive its result or exception. Pass clone for results
+# callers mutate, so each caller gets its own copy.
+class SingleFlight:
+    def __init__(self, group, clone=None):
+        self.group = group
+        self.clone = clone
+        self._calls = {}
+        self._async_calls = {}
+        self._lock = threading.Lock()
+
+    def _share(self, result):
+        return self.clone(result) if self.clone and result is not None else result
+
+    def _record(self, role):
+        SINGLEFLIGHT_CALLS.inc(group=self.group, role=role)
+
+    def do(self, key, fn, recheck=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call(threading.Event())
+
+        if not leader:
+            self._record("follower")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return self._share(call.result)
+
+        try:
+            call.result = self._lead(key, fn, recheck)
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException as e:
+            # An interrupt belongs to the leader's thread; followers get an ordinary error.
+            call.error = RuntimeError(f"{self.group} call interrupted: {e!r}")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return self._share(call.result)
+
+    def _lead(self, key, fn, recheck):
+        if recheck is None or not cross_process_enabled():
+            self._record("leader")
+            return fn()
+        with _process_lock(self.group, key):
+            result = recheck()
+            if result is not None:
+                self._record("remote_follower")
+                return result
+            self._record("leader")
+            return fn()
+
+    async def do_async(self, key, fn, recheck=None):
+        """Async variant for one event loop; fn and recheck are coroutine functions.
+
+        A cancelled leader does not cancel its followers: they retry, and one of them leads.
+        """
+        while True:
+            call = self._async_calls.get(key)
+            if call is None:
+                break
+            await call.done.wait()
+            if call.cancelled:
+                continue
+            self._record("follower")
+            if call.error is not None:
+                raise call.error
+            return self._share(call.result)
+
+        call = self._async_calls[key] = _Call(asyncio.Event())
+        try:
+            call.result = await self._lead_async(key, fn, recheck)
+        except asyncio.CancelledError:
+            call.cancelled = True
+            raise
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException as e:
+            call.error = RuntimeError(f"{self.group} call interrupted: {e!r}")
+            raise
+        finally:
+            del self._async_calls[key]
+            call.done.set()
+        return self._share(call.result)
+
+    async def _lead_async(self, key, fn, recheck):
+        if recheck is None or not cross_process_enabled():
+            self._record("leader")
+            return await fn()
+        lock = _process_lock(self.group, key)
+        acquire = asyncio.ensure_future(asyncio.to_thread(lock.__enter__))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # The thread still takes the flock after we stop waiting; release it when it does.
+            acquire.add_done_callback(functools.partial(_release_acquired, lock))
+            raise
+        try:
+            result = await recheck()
+            if result is not None:
+                self._record("remote_follower")
+                return result
+            self._record("leader")
+            return await fn()
+        finally:
+            lock.__exit__(None, None, None)
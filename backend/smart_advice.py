@@ -0,0 +1,178 @@
+import os
+import re
+import asyncio
+import json
+import logging
+from collections import Counter
+import pandas as pd
+from llm_cache import LLMCache, make_key
+from upstream import groq_chat, groq_chat_async
+from singleflight import SingleFlight
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: every process that asks prewarms
+    fcntl = None
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+# Bump ADVICE_PROMPT_VERSION whenever the advice prompt changes.
+ADVICE_MODEL = "llama-3.3-70b-versatile"
+ADVICE_TEMPERATURE = 0.2
+ADVICE_MAX_TOKENS = 1024
+ADVICE_PROMPT_VERSION = "v1"
+
+advice_cache = LLMCache(
+    os.environ.get("ADVICE_CACHE_PATH", "cache/advice_cache.sqlite"),
+    max_entries=int(os.environ.get("ADVICE_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=int(os.environ.get("ADVICE_CACHE_TTL", str(30 * 24 * 3600))),
+    name="advice"
+)
+
+# Identical concurrent advice requests share one LLM call (and one cache write).
+advice_flight = SingleFlight("smart_advice")
+
+# === Cache Key ===
+def normalize_diagnosis(diagnosis):
+    text = re.sub(r"[^a-z0-9]+", " ", str(diagnosis or "").lower())
+    return " ".join(text.split())
+
+def medicine_identity(med):
+    sku_code = str(med.get("sku_code", "") or "").strip()
+    if sku_code:
+        return sku_code
+    return normalize_diagnosis(med.get("medicine_name", ""))
+
+def advice_cache_key(diagnosis, medicines):
+    identities = sorted({medicine_identity(med) for med in medicines} - {""})
+    return make_key(
+        normalize_diagnosis(diagnosis),
+        identities,
+        ADVICE_PROMPT_VERSION,
+        ADVICE_MODEL,
+        ADVICE_TEMPERATURE
+    )
+
+# === Prompt + LLM ===
+def build_advice_prompt(diagnosis, medicines):
+    med_list = ", ".join([med.get("medicine_name", "") for med in medicines])
+    return f"""
+You are a clinical assistant.
+Given the diagnosis: {diagnosis} and the medicines: {med_list},
+Suggest:
+1. Precautions the patient should follow (separate into medical and non-medical).
+2. Follow-up advice (when the patient should return or retest, give medical test recommendation if relevant to diagnosis).
+3. Alert if any of the prescribed medicines are commonly associated with allergic reactions, and mention what symptoms to watch for.
+Respond in plain English.
+"""
+
+def advice_request(diagnosis, medicines):
+    return {
+        "model": ADVICE_MODEL,
+        "messages": [{"role": "user", "content": build_advice_prompt(diagnosis, medicines)}],
+        "temperature": ADVICE_TEMPERATURE,
+        "max_tokens": ADVICE_MAX_TOKENS
+    }
+
+def generate_advice(diagnosis, medicines):
+    completion = groq_chat("smart_advice", **advice_request(diagnosis, medicines))
+    return completion.choices[0].message.content.strip()
+
+def get_smart_advice(diagnosis, medicines, bypass_cache=False):
+    key = advice_cache_key(diagnosis, medicines)
+    if not bypass_cache:
+        cached = advice_cache.get(key)
+        if cached is not None:
+            return cached, True
+
+    def generate():
+        advice = generate_advice(diagnosis, medicines)
+        advice_cache.set(key, advice)
+        return advice
+
+    recheck = None if bypass_cache else (lambda: advice_cache.get(key))
+    return advice_flight.do(key, generate, recheck=recheck), False
+
+async def get_smart_advice_async(diagnosis, medicines, bypass_cache=False):
+    key = advice_cache_key(diagnosis, medicines)
+    if not bypass_cache:
+        cached = await asyncio.to_thread(advice_cache.get, key)
+        if cached is not None:
+            return cached, True
+
+    async def generate():
+        completion = await groq_chat_async("smart_advice", **advice_request(diagnosis, medicines))
+        advice = completion.choices[0].message.content.strip()
+        await asyncio.to_thread(advice_cache.set, key, advice)
+        return advice
+
+    async def recheck():
+        return await asyncio.to_thread(advice_cache.get, key)
+
+    return await advice_flight.do_async(key, generate, recheck=None if bypass_cache else recheck), False
+
+# === Pre-generation from Prescription History ===
+def mine_frequent_combinations(data_file, top_n=50, min_count=2):
+    if not os.path.isfile(data_file) or os.path.getsize(data_file) == 0:
+        return []
+
+    counts = Counter()
+    examples = {}
+    for chunk in pd.read_csv(data_file, usecols=["prescription_json"], chunksize=1000):
+        for raw in chunk["prescription_json"].dropna():
+            try:
+                data = json.loads(raw)
+            except (TypeError, ValueError):
+                continue
+            medicines = [m for m in data.get("medicines", []) if m.get("medicine_name")]
+            if not medicines:
+                continue
+            diagnosis = (data.get("patient") or {}).get("diagnosis", "")
+            key = advice_cache_key(diagnosis, medicines)
+            counts[key] += 1
+            examples.setdefault(key, (diagnosis, medicines))
+
+    return [
+        (examples[key][0], examples[key][1], count)
+        for key, count in counts.most_common(top_n)
+        if count >= min_count
+    ]
+
+def prewarm_advice_cache(data_file, top_n=50, min_count=2):
+    warmed = 0
+    for diagnosis, medicines, count in mine_frequent_combinations(data_file, top_n, min_count):
+        if advice_cache.get(advice_cache_key(diagnosis, medicines)) is not None:
+            continue
+        try:
+            get_smart_advice(diagnosis, medicines, bypass_cache=True)
+            warmed += 1
+        except Exception as e:
+            logger.warning(f"[Advice Prewarm Error] {diagnosis} ({count}x) → {e}")
+    logger.info(f"[Advice Prewarm] Generated {warmed} new advice entries")
+    return warmed
+
+def prewarm_once(data_file, top_n=50, min_count=2):
+    """prewarm_advice_cache in one process only: the first to take the lock file next to the
+    advice cache runs it, and every other worker starting alongside skips (returns None)."""
+    with open(f"{advice_cache.path}.prewarm.lock", "w") as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.info("[Advice Prewarm] Already running in another worker")
+                return None
+        return prewarm_advice_cache(data_file, top_n, min_count)
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Pre-generate smart advice for frequent diagnosis/medicine combinations")
+    parser.add_argument("--data-file", default="prescriptions.csv")
+    parser.add_argument("--top", type=int, default=50)
+    parser.add_argument("--min-count", type=int, default=2)
+    args = parser.parse_args()
+
+    prewarm_advice_cache(args.data_file, args.top, args.min_count)
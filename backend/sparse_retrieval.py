@@ -0,0 +1,93 @@
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+# === Config ===
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+# === Sparse Lexical Retriever ===
+# BM25 over word tokens plus TF-IDF over character trigrams, both kept as term x document
+# CSR matrices so a query only touches the posting rows of its own terms.
+class SparseRetriever:
+    def __init__(self, documents, k1=BM25_K1, b=BM25_B):
+        documents = [str(doc) for doc in documents]
+        self.size = len(documents)
+
+        self.word_vectorizer = CountVectorizer(token_pattern=r"[a-z0-9]+", lowercase=True, dtype=np.float32)
+        counts = self.word_vectorizer.fit_transform(documents).tocsr()
+        doc_len = np.asarray(counts.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if self.size else 0.0
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log(1 + (self.size - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        # Precompute the BM25 weight of every (document, term) pair once.
+        weights = counts.copy()
+        row_len = np.repeat(doc_len, np.diff(counts.indptr))
+        tf = weights.data
+        weights.data = idf[weights.indices] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * row_len / max(avg_len, 1e-9)))
+        self.bm25_postings = weights.T.tocsr()
+
+        self.ngram_vectorizer = TfidfVectorizer(
+            analyzer="char_wb", ngram_range=(3, 3), lowercase=True, sublinear_tf=True, dtype=np.float32
+        )
+        self.ngram_postings = self.ngram_vectorizer.fit_transform(documents).T.tocsr()
+
+        # Query-side lookups bypass the vectorizers' per-call transform overhead.
+        self.word_vocab = self.word_vectorizer.vocabulary_
+        self.word_analyzer = self.word_vectorizer.build_analyzer()
+        self.ngram_vocab = self.ngram_vectorizer.vocabulary_
+        self.ngram_analyzer = self.ngram_vectorizer.build_analyzer()
+        self.ngram_idf = self.ngram_vectorizer.idf_.astype(np.float32)
+
+    def _score(self, postings, term_ids, weights):
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term_id, weight in zip(term_ids, weights):
+            start, end = postings.indptr[term_id], postings.indptr[term_id + 1]
+            scores[postings.indices[start:end]] += weight * postings.data[start:end]
+        return scores
+
+    def bm25_scores(self, query):
+        term_ids = {self.word_vocab[t] for t in self.word_analyzer(query) if t in self.word_vocab}
+        return self._score(self.bm25_postings, term_ids, [1.0] * len(term_ids))
+
+    def ngram_scores(self, query):
+        counts = {}
+        for gram in self.ngram_analyzer(query):
+            term_id = self.ngram_vocab.get(gram)
+            if term_id is not None:
+                counts[term_id] = counts.get(term_id, 0) + 1
+        if not counts:
+            return np.zeros(self.size, dtype=np.float32)
+        term_ids = np.fromiter(counts.keys(), dtype=np.int64)
+        weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float32))) * self.ngram_idf[term_ids]
+        weights /= np.linalg.norm(weights)
+        return self._score(self.ngram_postings, term_ids, weights)
+
+    def ranked_lists(self, query, k=10, start=0, end=None):
+        end = self.size if end is None else end
+        return [
+            top_k(self.bm25_scores(query), k, start, end),
+            top_k(self.ngram_scores(query), k, start, end),
+        ]
+
+    def search(self, query, k=10, start=0, end=None):
+        return reciprocal_rank_fusion(self.ranked_lists(query, k, start, end))[:k]
+
+# === Ranking Helpers ===
+def top_k(scores, k, start=0, end=None):
+    end = len(scores) if end is None else end
+    segment = scores[start:end]
+    k = min(k, len(segment))
+    if k <= 0:
+        return []
+    top = np.argpartition(-segment, k - 1)[:k]
+    top = top[np.argsort(-segment[top])]
+    return [(start + int(i), float(segment[i])) for i in top if segment[i] > 0]
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    fused = {}
+    for ranked in ranked_lists:
+        for rank, (doc_id, _) in enumerate(ranked):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: -x[1])
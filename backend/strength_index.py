@@ -0,0 +1,77 @@
+import re
+import numpy as np
+
+# === Units ===
+# Every unit maps to a canonical unit and a multiplier, so "0.5 g", "500mg" and
+# "500 MG" all become (500.0, "mg"), and mcg / ug / µg share one scale.
+UNIT_SCALE = {
+    "mg": ("mg", 1.0),
+    "g": ("mg", 1000.0),
+    "gm": ("mg", 1000.0),
+    "mcg": ("mg", 0.001),
+    "ug": ("mg", 0.001),
+    "µg": ("mg", 0.001),
+    "ml": ("ml", 1.0),
+    "l": ("ml", 1000.0),
+    "iu": ("iu", 1.0),
+}
+
+# "500 mg", "0.5g", and combination strengths such as "75/1500 mg" (one trailing unit).
+STRENGTH_PATTERN = re.compile(
+    r"(?<![\w.])(\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)*)\s*(" + "|".join(sorted(UNIT_SCALE, key=len, reverse=True)) + r")\b"
+)
+EXACT_TOLERANCE = 1e-9
+
+def parse_strengths(text):
+    """Return every strength in text as (value, canonical unit) pairs, in order of appearance."""
+    strengths = []
+    for numbers, unit in STRENGTH_PATTERN.findall(str(text).lower()):
+        canonical, scale = UNIT_SCALE[unit]
+        for number in numbers.split("/"):
+            strengths.append((round(float(number) * scale, 6), canonical))
+    return strengths
+
+# === Sorted Numeric Index ===
+# Per canonical unit, strengths sit in one sorted array alongside their row ids, so exact
+# and tolerance-band lookups are a pair of binary searches.
+class StrengthIndex:
+    def __init__(self, texts):
+        postings = {}
+        unparsed = []
+        for row, text in enumerate(texts):
+            strengths = parse_strengths(text)
+            if not strengths:
+                unparsed.append(row)
+            for value, unit in set(strengths):
+                postings.setdefault(unit, []).append((value, row))
+
+        self.units = {}
+        for unit, pairs in postings.items():
+            pairs.sort()
+            self.units[unit] = (
+                np.array([value for value, _ in pairs], dtype=np.float64),
+                np.array([row for _, row in pairs], dtype=np.int64),
+            )
+        self.unparsed_rows = np.array(unparsed, dtype=np.int64)
+
+    def lookup(self, value, unit, tolerance=0.0):
+        """Rows (ascending) holding value in unit, within a relative tolerance band."""
+        if unit not in self.units:
+            return np.empty(0, dtype=np.int64)
+        values, rows = self.units[unit]
+        band = abs(value) * max(tolerance, EXACT_TOLERANCE)
+        lo = np.searchsorted(values, value - band, side="left")
+        hi = np.searchsorted(values, value + band, side="right")
+        return np.sort(rows[lo:hi])
+
+    def candidates(self, strengths, tolerance=0.0):
+        """Rows carrying every requested strength; rows without any strength when none is given."""
+        if not strengths:
+            return self.unparsed_rows
+        result = None
+        for value, unit in strengths:
+            rows = self.lookup(value, unit, tolerance)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if not len(result):
+                break
+        return result
@@ -0,0 +1,106 @@
+import os
+import re
+import json
+import time
+import pickle
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import normalize
+from sentence_transformers import SentenceTransformer
+from vector_index import INDEX_TYPES, build_index, configure_search, index_size_bytes
+
+# === Configuration ===
+CACHE_DIR = "faiss_cache"
+DATA_FILE = "prescriptions.csv"
+EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
+EF_SEARCH_VALUES = [16, 32, 64, 128, 256]
+NPROBE_VALUES = [1, 4, 8, 16, 32, 64]
+
+# === Held-out Queries from Prescription History ===
+def mine_queries(data_file, code_to_row):
+    queries = {}
+    df = pd.read_csv(data_file, usecols=["prescription_json"])
+    for raw in df["prescription_json"].dropna():
+        try:
+            data = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+        for med in data.get("medicines") or []:
+            name = med.get("raw_medicine_name") or ""
+            sku_code = str(med.get("sku_code", "") or "")
+            if not name or sku_code not in code_to_row:
+                continue
+            text = f"{name} {med.get('medicine_type', '')} {med.get('medicine_dosage', '')}"
+            text = re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+            queries.setdefault(text, code_to_row[sku_code])
+    return list(queries.keys()), np.array(list(queries.values()), dtype="int64")
+
+# === Measurement ===
+def measure(index, query_vecs, exact_ids, target_rows, k):
+    start = time.perf_counter()
+    latencies = []
+    found = np.empty((len(query_vecs), k), dtype="int64")
+    for i in range(len(query_vecs)):
+        t0 = time.perf_counter()
+        _, ids = index.search(query_vecs[i:i + 1], k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found[i] = ids[0]
+    total = time.perf_counter() - start
+
+    recall = np.mean([len(set(found[i]) & set(exact_ids[i])) / k for i in range(len(found))])
+    sku_hit = np.mean([target_rows[i] in found[i] for i in range(len(found))])
+    return {
+        "recall_at_k": round(float(recall), 4),
+        "sku_hit_at_k": round(float(sku_hit), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 4),
+        "qps": round(len(query_vecs) / total, 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/latency sweep for medicine index types and search parameters")
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=["hnsw_flat", "hnsw_fp16", "hnsw_sq8", "ivf_pq"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    vectors = np.load(os.path.join(CACHE_DIR, "sku_vectors.npy")).astype("float32")
+    with open(os.path.join(CACHE_DIR, "sku_list.pkl"), "rb") as f:
+        sku_list = pickle.load(f)
+    code_to_row = {str(item["sku_code"]): row for row, item in enumerate(sku_list)}
+
+    texts, target_rows = mine_queries(args.data_file, code_to_row)
+    print(f"Mined {len(texts)} held-out queries from {args.data_file}")
+    model = SentenceTransformer(EMBED_MODEL_NAME)
+    query_vecs = normalize(model.encode(texts, convert_to_numpy=True), norm="l2").astype("float32")
+
+    exact = build_index(vectors, "flat")
+    _, exact_ids = exact.search(query_vecs, args.k)
+
+    results = []
+    for index_type in args.types:
+        print(f"Building {index_type}...")
+        index = build_index(vectors, index_type)
+        size_mib = index_size_bytes(index) / 2**20
+        if index_type.startswith("hnsw"):
+            settings = [{"ef_search": ef} for ef in EF_SEARCH_VALUES]
+        elif index_type == "ivf_pq":
+            settings = [{"nprobe": n} for n in NPROBE_VALUES]
+        else:
+            settings = [{}]
+
+        for setting in settings:
+            configure_search(index, **setting)
+            stats = measure(index, query_vecs, exact_ids, target_rows, args.k)
+            row = {"index_type": index_type, "size_mib": round(size_mib, 2), **setting, **stats}
+            results.append(row)
+            param = ", ".join(f"{k}={v}" for k, v in setting.items()) or "-"
+            print(f"  {index_type:<10} {param:<14} size={size_mib:7.1f}MiB recall@{args.k}={stats['recall_at_k']:.4f} "
+                  f"sku_hit@{args.k}={stats['sku_hit_at_k']:.4f} p50={stats['p50_ms']:.3f}ms p95={stats['p95_ms']:.3f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Saved sweep results to", args.output)
@@ -0,0 +1,217 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+import functools
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+# === Logger ===
+logger = logging.getLogger("rxsage.trace")
+
+# === Config ===
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0"))
+TRACE_HEADER = "X-Trace"
+PROFILE_SLOW_REQUESTS = os.environ.get("PROFILE_SLOW_REQUESTS", "0").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "5000"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+MAX_SPANS = 200
+
+_current_trace = contextvars.ContextVar("rxsage_trace", default=None)
+
+# === Spans ===
+class Trace:
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []
+        self._depth = 0
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "name": self.name, "spans": self.spans}
+
+    def server_timing(self):
+        parts = [
+            f'{span["name"]};dur={span["duration_ms"]:.1f}'
+            for span in self.spans
+            if span["depth"] == 0
+        ]
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+@contextmanager
+def span(name, **attrs):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    record = {
+        "name": name,
+        "start_ms": round(trace.elapsed_ms(), 3),
+        "depth": trace._depth,
+    }
+    if attrs:
+        record["attrs"] = attrs
+    trace._depth = record["depth"] + 1
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        trace._depth = record["depth"]
+        record["duration_ms"] = round(trace.elapsed_ms() - record["start_ms"], 3)
+        if error:
+            record["error"] = error
+        if len(trace.spans) < MAX_SPANS:
+            trace.spans.append(record)
+
+def current_trace():
+    return _current_trace.get()
+
+# === Sampling Profiler ===
+# One background thread samples the stacks of every thread that is serving a profiled
+# request and aggregates them in collapsed-stack format (flamegraph.pl / speedscope).
+class StackSampler:
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, thread_id):
+        samples = Counter()
+        with self._lock:
+            self._active[thread_id] = samples
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rxsage-sampler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._active.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                targets = list(self._active.items())
+            frames = sys._current_frames()
+            for thread_id, samples in targets:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_collapse(frame)] += 1
+            time.sleep(self.interval)
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+sampler = StackSampler(PROFILE_INTERVAL_MS)
+
+def write_profile(trace, samples):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{trace.trace_id}.folded")
+    with open(path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+# === Request Lifecycle ===
+def trace_requested(headers):
+    """Return (emit, start): emit when asked for or sampled; start also covers slow-request profiling."""
+    requested = headers.get(TRACE_HEADER, "").lower() in ("1", "true", "yes")
+    sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    emit = requested or sampled
+    return emit, emit or PROFILE_SLOW_REQUESTS
+
+def finish_trace(trace, status, emit, samples=None):
+    """Log the finished trace and return the response headers to add (empty when not emitted)."""
+    duration_ms = trace.elapsed_ms()
+    record = trace.to_dict()
+    record.update({"status": status, "duration_ms": round(duration_ms, 3)})
+
+    if samples and duration_ms >= SLOW_REQUEST_MS:
+        try:
+            record["profile"] = write_profile(trace, samples)
+        except OSError as e:
+            logger.warning(f"[Profiler] Could not write profile: {e}")
+
+    if not (emit or "profile" in record):
+        return {}
+    logger.info(json.dumps(record))
+    return {"X-Trace-Id": trace.trace_id, "Server-Timing": trace.server_timing()}
+
+# === Flask Integration ===
+def init_tracing(app):
+    from flask import request, g
+
+    @app.before_request
+    def _start_trace():
+        emit, start = trace_requested(request.headers)
+        if not start:
+            return
+        trace = Trace(f"{request.method} {request.path}")
+        g.trace = trace
+        g.trace_emit = emit
+        g.trace_token = _current_trace.set(trace)
+        if PROFILE_SLOW_REQUESTS:
+            g.trace_thread = threading.get_ident()
+            sampler.start(g.trace_thread)
+
+    @app.after_request
+    def _finish_trace(response):
+        trace = g.pop("trace", None)
+        if trace is None:
+            return response
+
+        samples = sampler.stop(g.trace_thread) if "trace_thread" in g else None
+        response.headers.update(finish_trace(trace, response.status_code, g.pop("trace_emit", False), samples))
+        return response
+
+    @app.teardown_request
+    def _cleanup_trace(exc):
+        if "trace_thread" in g:
+            sampler.stop(g.pop("trace_thread"))
+        token = g.pop("trace_token", None)
+        if token is not None:
+            _current_trace.reset(token)
+
+# === ASGI Integration ===
+# Async endpoints share the event-loop thread, so the stack sampler is not attached; traces
+# and Server-Timing work as in Flask.
+def trace_endpoint(handler):
+    @functools.wraps(handler)
+    async def wrapper(request):
+        emit, _ = trace_requested(request.headers)
+        if not emit:
+            return await handler(request)
+
+        trace = Trace(f"{request.method} {request.url.path}")
+        token = _current_trace.set(trace)
+        try:
+            response = await handler(request)
+        finally:
+            _current_trace.reset(token)
+        response.headers.update(finish_trace(trace, response.status_code, emit))
+        return response
+    return wrapper
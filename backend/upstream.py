@@ -0,0 +1,337 @@
+import os
+import time
+import asyncio
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+import groq
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from metrics import Counter, track_upstream
+from dotenv import load_dotenv
+load_dotenv()
+
+# === Logger ===
+logger = logging.getLogger(__name__)
+
+# === Config ===
+GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+GROQ_BASE_URL = os.environ.get("GROQ_BASE_URL") or None
+HF_INFERENCE_URL = os.environ.get("HF_INFERENCE_URL", "https://router.huggingface.co/hf-inference").rstrip("/")
+HF_TOKEN = os.environ.get("HF_TOKEN")
+
+POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", "20"))
+ASYNC_POOL_SIZE = int(os.environ.get("UPSTREAM_ASYNC_POOL_SIZE", "200"))
+TIMEOUTS = {
+    "groq": float(os.environ.get("GROQ_TIMEOUT_SECONDS", "30")),
+    "hf": float(os.environ.get("HF_TIMEOUT_SECONDS", "10")),
+}
+MAX_ATTEMPTS = int(os.environ.get("UPSTREAM_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE = float(os.environ.get("UPSTREAM_BACKOFF_SECONDS", "0.25"))
+BACKOFF_MAX = float(os.environ.get("UPSTREAM_BACKOFF_MAX_SECONDS", "4"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+REQUEST_DEADLINE_SECONDS = float(os.environ.get("REQUEST_DEADLINE_SECONDS", "60"))
+MIN_ATTEMPT_SECONDS = 0.05
+
+# === Metrics ===
+UPSTREAM_RETRIES = Counter(
+    "rxsage_upstream_retries_total", "Retried upstream attempts", ("service", "operation")
+)
+UPSTREAM_SHORT_CIRCUITS = Counter(
+    "rxsage_upstream_short_circuits_total", "Calls rejected by an open circuit breaker", ("service",)
+)
+UPSTREAM_DEADLINE_EXCEEDED = Counter(
+    "rxsage_upstream_deadline_exceeded_total", "Calls abandoned because the request deadline ran out", ("service",)
+)
+BREAKER_TRANSITIONS = Counter(
+    "rxsage_circuit_breaker_transitions_total", "Circuit breaker state changes", ("service", "state")
+)
+
+# === Errors ===
+class UpstreamError(Exception):
+    pass
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+class DeadlineExceeded(UpstreamError):
+    pass
+
+def status_code_of(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+def is_retryable(exc):
+    status = status_code_of(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(exc, (
+        groq.APIConnectionError,
+        requests.ConnectionError,
+        requests.Timeout,
+        httpx.TransportError,
+    ))
+
+def retry_after_seconds(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after", ""))
+    except (TypeError, ValueError):
+        return None
+
+# === Circuit Breaker ===
+class CircuitBreaker:
+    def __init__(self, service, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.service = service
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._transition("half_open")
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != "closed":
+                self._transition("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self.state != "open":
+                    self._transition("open")
+
+    def release_probe(self):
+        # An admitted call that ended without an outcome (cancelled) frees the probe slot.
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _transition(self, state):
+        logger.warning(f"[Upstream] {self.service} circuit {self.state} → {state}")
+        self.state = state
+        BREAKER_TRANSITIONS.inc(service=self.service, state=state)
+
+breakers = {service: CircuitBreaker(service) for service in TIMEOUTS}
+
+# === Request Deadlines ===
+_deadline = contextvars.ContextVar("rxsage_deadline", default=None)
+
+@contextmanager
+def request_deadline(seconds):
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining_seconds():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def deadline_budget(headers, seconds=REQUEST_DEADLINE_SECONDS):
+    header = headers.get("X-Request-Timeout-Ms")
+    if header:
+        try:
+            return min(seconds, float(header) / 1000)
+        except ValueError:
+            pass
+    return seconds
+
+def init_deadlines(app, seconds=REQUEST_DEADLINE_SECONDS):
+    from flask import request, g
+
+    @app.before_request
+    def _start_deadline():
+        g.deadline_token = _deadline.set(time.monotonic() + deadline_budget(request.headers, seconds))
+
+    @app.teardown_request
+    def _clear_deadline(exc):
+        token = g.pop("deadline_token", None)
+        if token is not None:
+            _deadline.reset(token)
+
+# === Retry Loop ===
+# The sync and async loops share the admission and backoff decisions below.
+def _attempt_timeout(service, operation, breaker):
+    # The deadline is checked first: allow() may hand out the half-open probe slot, which
+    # only an attempt's outcome releases.
+    timeout = TIMEOUTS[service]
+    remaining = remaining_seconds()
+    if remaining is not None:
+        if remaining < MIN_ATTEMPT_SECONDS:
+            UPSTREAM_DEADLINE_EXCEEDED.inc(service=service)
+            raise DeadlineExceeded(f"{service}.{operation}: request deadline exhausted")
+        timeout = min(timeout, remaining)
+
+    if not breaker.allow():
+        UPSTREAM_SHORT_CIRCUITS.inc(service=service)
+        raise CircuitOpenError(f"{service} circuit open")
+    return timeout
+
+def _retry_delay(service, operation, breaker, attempt, max_attempts, e):
+    """Record the failed attempt; return the backoff before the next one, or None to give up."""
+    retryable = is_retryable(e)
+    if retryable:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    if not retryable or attempt >= max_attempts:
+        return None
+
+    delay = retry_after_seconds(e)
+    if delay is None:
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+    remaining = remaining_seconds()
+    if remaining is not None and delay >= remaining - MIN_ATTEMPT_SECONDS:
+        return None
+    UPSTREAM_RETRIES.inc(service=service, operation=operation)
+    logger.info(f"[Upstream] {service}.{operation} attempt {attempt} failed ({e}); retrying in {delay:.2f}s")
+    return delay
+
+def call_with_retries(service, operation, fn, max_attempts=MAX_ATTEMPTS):
+    breaker = breakers[service]
+    attempt = 0
+    while True:
+        attempt += 1
+        timeout = _attempt_timeout(service, operation, breaker)
+        try:
+            with track_upstream(service, operation):
+                result = fn(timeout)
+            breaker.record_success()
+            return result
+        except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            delay = _retry_delay(service, operation, breaker, attempt, max_attempts, e)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+async def call_with_retries_async(service, operation, fn, max_attempts=MAX_ATTEMPTS):
+    breaker = breakers[service]
+    attempt = 0
+    while True:
+        attempt += 1
+        timeout = _attempt_timeout(service, operation, breaker)
+        try:
+            with track_upstream(service, operation):
+                result = await fn(timeout)
+            breaker.record_success()
+            return result
+        except (KeyboardInterrupt, SystemExit, asyncio.CancelledError):
+            breaker.release_probe()
+            raise
+        except Exception as e:
+            delay = _retry_delay(service, operation, breaker, attempt, max_attempts, e)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+# === Groq ===
+groq_client = None
+_groq_lock = threading.Lock()
+
+def get_groq_client():
+    global groq_client
+    if groq_client is None:
+        with _groq_lock:
+            if groq_client is None:
+                if not GROQ_API_KEY:
+                    raise ValueError("Missing GROQ_API_KEY")
+                http_client = httpx.Client(
+                    limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+                    timeout=TIMEOUTS["groq"]
+                )
+                groq_client = groq.Groq(
+                    api_key=GROQ_API_KEY,
+                    base_url=GROQ_BASE_URL,
+                    max_retries=0,
+                    http_client=http_client
+                )
+    return groq_client
+
+def groq_chat(operation, **kwargs):
+    client = get_groq_client()
+    return call_with_retries(
+        "groq", operation,
+        lambda timeout: client.chat.completions.create(timeout=timeout, **kwargs)
+    )
+
+# The async client is bound to the event loop that first uses it (one per ASGI worker).
+async_groq_client = None
+
+def get_async_groq_client():
+    global async_groq_client
+    if async_groq_client is None:
+        if not GROQ_API_KEY:
+            raise ValueError("Missing GROQ_API_KEY")
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+            timeout=TIMEOUTS["groq"]
+        )
+        async_groq_client = groq.AsyncGroq(
+            api_key=GROQ_API_KEY,
+            base_url=GROQ_BASE_URL,
+            max_retries=0,
+            http_client=http_client
+        )
+    return async_groq_client
+
+async def groq_chat_async(operation, **kwargs):
+    client = get_async_groq_client()
+    return await call_with_retries_async(
+        "groq", operation,
+        lambda timeout: client.chat.completions.create(timeout=timeout, **kwargs)
+    )
+
+# === Hugging Face ===
+class HFInferenceClient:
+    def __init__(self, base_url=HF_INFERENCE_URL, token=HF_TOKEN, pool_size=POOL_SIZE):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def feature_extraction(self, text, model, timeout=None):
+        response = self.session.post(
+            f"{self.base_url}/models/{model}/pipeline/feature-extraction",
+            json={"inputs": text},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+hf_client = HFInferenceClient()
+
+def hf_feature_extraction(text, model):
+    return call_with_retries(
+        "hf", "feature_extraction",
+        lambda timeout: hf_client.feature_extraction(text, model=model, timeout=timeout)
+    )
@@ -0,0 +1,85 @@
+import os
+import json
+import faiss
+import numpy as np
+
+# === Supported Index Types ===
+# All types index L2-normalized vectors, so L2 distance ranks like cosine similarity.
+#   flat       exact search, float32 (reference for recall)
+#   hnsw_flat  HNSW graph over float32 vectors (original layout)
+#   hnsw_fp16  HNSW graph over float16 vectors (~2x smaller)
+#   hnsw_sq8   HNSW graph over 8-bit scalar-quantized vectors (~4x smaller)
+#   ivf_pq     inverted lists + product quantization (~30-60x smaller)
+INDEX_TYPES = ("flat", "hnsw_flat", "hnsw_fp16", "hnsw_sq8", "ivf_pq")
+META_FILE = "index_meta.json"
+
+def index_filename(index_type):
+    return "hnsw_index.faiss" if index_type == "hnsw_flat" else f"{index_type}_index.faiss"
+
+def default_nlist(count):
+    return int(max(16, min(4096, 4 * np.sqrt(count))))
+
+def build_index(vectors, index_type="hnsw_flat", hnsw_m=32, ef_construction=200, nlist=None, pq_m=48, pq_bits=8):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    d = vectors.shape[1]
+
+    factory = {
+        "flat": "Flat",
+        "hnsw_flat": f"HNSW{hnsw_m}",
+        "hnsw_fp16": f"HNSW{hnsw_m},SQfp16",
+        "hnsw_sq8": f"HNSW{hnsw_m},SQ8",
+        "ivf_pq": f"IVF{nlist or default_nlist(len(vectors))},PQ{pq_m}x{pq_bits}",
+    }.get(index_type)
+    if factory is None:
+        raise ValueError(f"Unknown index type: {index_type}")
+    index = faiss.index_factory(d, factory)
+
+    if hasattr(index, "hnsw"):
+        index.hnsw.efConstruction = ef_construction
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+def configure_search(index, ef_search=None, nprobe=None):
+    if ef_search:
+        try:
+            faiss.downcast_index(index).hnsw.efSearch = int(ef_search)
+        except AttributeError:
+            pass
+    if nprobe:
+        try:
+            faiss.extract_index_ivf(index).nprobe = int(nprobe)
+        except RuntimeError:
+            pass
+    return index
+
+def index_size_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
+
+# === Persisted Metadata ===
+def write_meta(cache_dir, index_file, index_type, count, dim, params):
+    meta = {
+        "index_file": index_file,
+        "index_type": index_type,
+        "count": int(count),
+        "dim": int(dim),
+        "params": params,
+    }
+    with open(os.path.join(cache_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+def read_meta(cache_dir):
+    path = os.path.join(cache_dir, META_FILE)
+    if not os.path.isfile(path):
+        return {"index_file": "hnsw_index.faiss", "index_type": "hnsw_flat", "params": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def load_index(cache_dir, index_type=None, ef_search=None, nprobe=None):
+    meta = read_meta(cache_dir)
+    if index_type and index_type != meta.get("index_type"):
+        meta = {"index_file": index_filename(index_type), "index_type": index_type, "params": {}}
+    index = faiss.read_index(os.path.join(cache_dir, meta["index_file"]))
+    return configure_search(index, ef_search, nprobe), meta
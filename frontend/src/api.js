@@ -7,3 +7,38 @@ export const getSuggestions = (q) =>
 
 export const extractPrescription = (text) =>
   axios.post(`${BASE_URL}/extract`, { prescription: text });
+
+// === Line-Level Saves ===
+// Ops that turn the last saved prescription into the edited one, for
+// PATCH /prescription/<id>. Lines are compared by position, and each changed line is sent
+// whole with its sku_code, so the server stores it exactly as edited (no re-matching).
+const SECTIONS = ['medicines', 'labtests', 'radiology', 'procedures'];
+
+export const lineEditOps = (saved, edited) => {
+  const ops = [];
+  for (const section of SECTIONS) {
+    const before = saved?.[section] || [];
+    const after = edited?.[section] || [];
+    after.forEach((line, index) => {
+      const item = { sku_code: '', ...line };
+      if (index >= before.length) {
+        ops.push({ op: 'add', section, index, item });
+      } else if (JSON.stringify(line) !== JSON.stringify(before[index])) {
+        ops.push({ op: 'replace', section, index, item });
+      }
+    });
+    for (let index = before.length - 1; index >= after.length; index--) {
+      ops.push({ op: 'remove', section, index });
+    }
+  }
+  return ops;
+};
+
+// Sends only the changed lines; a save that changes no line falls back to the full save.
+export const savePrescription = (appointmentId, saved, edited, rawText) => {
+  const ops = lineEditOps(saved, edited);
+  if (!ops.length) {
+    return axios.post(`${BASE_URL}/update-prescription/${appointmentId}`, { extracted: edited, raw_text: rawText });
+  }
+  return axios.patch(`${BASE_URL}/prescription/${appointmentId}`, { ops, raw_text: rawText });
+};
@@ -1,46 +1,122 @@
 import React, { useState, useEffect, useRef } from 'react';
 import Fuse from 'fuse.js';
 
+// Catalog files are generated by backend/build_frontend_catalog.py. Only the manifest is
+// fetched on mount; other files are fetched once, on first use, and cached immutably by the
+// browser. Medicines are found through a trigram index (queryGrams and gramBucket must match
+// grams() and gram_bucket() in the builder), so a word from the middle of a description or
+// with a typo still matches; only the labels of the best-scoring candidates are fetched.
+const CATALOG_BASE = '/catalog';
+const MAX_CANDIDATES = 200;
+const FUSE_OPTIONS = {
+  keys: ['label'],
+  threshold: 0.3,
+  ignoreLocation: true,
+  includeScore: true,
+};
+
+const queryGrams = (query, size) => {
+  const grams = new Set();
+  for (const token of query.toLowerCase().replace(/[^a-z0-9]+/g, ' ').trim().split(' ')) {
+    for (let start = 0; start + size <= token.length; start++) {
+      grams.add(token.slice(start, start + size));
+    }
+  }
+  return [...grams];
+};
+
+// 32-bit FNV-1a over the (ASCII) gram.
+const gramBucket = (gram, buckets) => {
+  let h = 2166136261;
+  for (let i = 0; i < gram.length; i++) {
+    h = Math.imul(h ^ gram.charCodeAt(i), 16777619) >>> 0;
+  }
+  return h % buckets;
+};
+
 export default function PrescriptionEditor({ text, setText, height = 'h-52', dismissOnBlur = false }) {
   const [suggestions, setSuggestions] = useState([]);
-  const [skuList, setSkuList] = useState([]);
-  const [fuse, setFuse] = useState(null);
   const [highlightedIndex, setHighlightedIndex] = useState(-1);
   const [hasNavigated, setHasNavigated] = useState(false);
   const textareaRef = useRef(null);
   const containerRef = useRef(null);
   const suggestionRefs = useRef([]);
+  const manifestRef = useRef(null);
+  const filesRef = useRef(new Map());
+  const latestQueryRef = useRef('');
 
   useEffect(() => {
-    Promise.all([
-      fetch('/medicine_sku_js.json').then(res => res.json()),
-      fetch('/lab_jsn.json').then(res => res.json())
-    ]).then(([medicinesRaw, proceduresRaw]) => {
-      const medicines = medicinesRaw.map(m => ({
-        ...m,
-        type: 'medicine',
-        label: m.medicine_desc
-      }));
-
-      const procedures = proceduresRaw
-        .map(p => {
-          const name = p.medicine_desc || '';
-          return name.trim() ? { ...p, type: 'procedure', label: name } : null;
-        })
-        .filter(Boolean);
+    fetch(`${CATALOG_BASE}/manifest.json`, { cache: 'no-cache' })
+      .then(res => res.json())
+      .then(manifest => { manifestRef.current = manifest; })
+      .catch(err => console.error('Failed to load catalog manifest:', err));
+  }, []);
 
-      const combined = [...medicines, ...procedures];
+  const loadFile = (stem, hash, parse = data => data) => {
+    if (!filesRef.current.has(stem)) {
+      const file = fetch(`${CATALOG_BASE}/${stem}.${hash}.json`)
+        .then(res => res.json())
+        .then(parse)
+        .catch(err => {
+          filesRef.current.delete(stem);
+          throw err;
+        });
+      filesRef.current.set(stem, file);
+    }
+    return filesRef.current.get(stem);
+  };
 
-      setSkuList(combined);
-      setFuse(new Fuse(combined, {
-        keys: ['label'],
-        threshold: 0.3,
-        ignoreLocation: true,
-      }));
+  const searchMedicines = async (manifest, query) => {
+    const { grams: gramFiles, labels: labelFiles } = manifest.medicine;
+    const grams = queryGrams(query, manifest.gram_size);
+    const buckets = await Promise.all(grams.map(gram => {
+      const bucket = gramBucket(gram, manifest.gram_buckets);
+      return loadFile(`medicine-grams-${bucket}`, gramFiles[bucket]);
+    }));
 
-      console.log('Loaded SKU list:', combined.map(e => e.label));
+    // Score each label id by the number of query trigrams it contains (ids are delta-encoded).
+    const hits = new Map();
+    grams.forEach((gram, i) => {
+      let id = 0;
+      for (const gap of buckets[i][gram] || []) {
+        id += gap;
+        hits.set(id, (hits.get(id) || 0) + 1);
+      }
     });
-  }, []);
+    const candidates = [...hits]
+      .sort((a, b) => b[1] - a[1] || a[0] - b[0])
+      .slice(0, MAX_CANDIDATES)
+      .map(([id]) => id);
+
+    const chunkIds = [...new Set(candidates.map(id => Math.floor(id / manifest.chunk_size)))];
+    const chunks = new Map(await Promise.all(chunkIds.map(async chunk =>
+      [chunk, (await loadFile(`medicine-labels-${chunk}`, labelFiles[chunk])).label]
+    )));
+    const items = candidates.map(id => ({
+      label: chunks.get(Math.floor(id / manifest.chunk_size))[id % manifest.chunk_size],
+      type: 'medicine',
+    }));
+    return new Fuse(items, FUSE_OPTIONS).search(query);
+  };
+
+  const searchCatalog = async (query) => {
+    const manifest = manifestRef.current;
+    if (!manifest) return [];
+
+    const procedures = loadFile('procedure', manifest.procedure,
+      ({ label }) => new Fuse(label.map(l => ({ label: l, type: 'procedure' })), FUSE_OPTIONS));
+
+    // Medicines before procedures on equal scores, as in the old combined list.
+    const results = await Promise.all([
+      searchMedicines(manifest, query),
+      procedures.then(index => index.search(query)),
+    ]);
+    return results
+      .flatMap((matches, rank) => matches.map(r => ({ ...r, rank })))
+      .sort((a, b) => a.score - b.score || a.rank - b.rank || a.refIndex - b.refIndex)
+      .slice(0, 10)
+      .map(r => r.item);
+  };
 
   useEffect(() => {
     const handleClickOutside = (event) => {
@@ -71,12 +147,19 @@ export default function PrescriptionEditor({ text, setText, height = 'h-52', dis
     const words = prefix.trim().split(/\s+/);
     const lastWord = words[words.length - 1];
 
-    if (lastWord.length >= 3 && fuse) {
-      const results = fuse.search(lastWord).slice(0, 10);
-      setSuggestions(results.map(r => r.item));
-      setHighlightedIndex(-1);
-      setHasNavigated(false);
+    if (lastWord.length >= 3) {
+      latestQueryRef.current = lastWord;
+      searchCatalog(lastWord)
+        .then(items => {
+          // Ignore results for a word the user has already typed past.
+          if (latestQueryRef.current !== lastWord) return;
+          setSuggestions(items);
+          setHighlightedIndex(-1);
+          setHasNavigated(false);
+        })
+        .catch(err => console.error('Catalog search failed:', err));
     } else {
+      latestQueryRef.current = '';
       setSuggestions([]);
       setHighlightedIndex(-1);
     }
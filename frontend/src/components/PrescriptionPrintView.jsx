@@ -1,6 +1,7 @@
 import React, { useEffect, useState, useRef } from 'react';
 import { useParams } from 'react-router-dom';
 import Fuse from 'fuse.js';
+import { savePrescription } from '../api';
 
 const PrescriptionPrintView = () => {
   const { appointmentId } = useParams();
@@ -15,6 +16,8 @@ const PrescriptionPrintView = () => {
   const [saveMessage, setSaveMessage] = useState("");
   const [suggestions, setSuggestions] = useState({});
   const inputRefs = useRef({});
+  // Last saved prescription (a copy: edits mutate line objects), to send only changed lines.
+  const savedRef = useRef(null);
   const BASE_URL = import.meta.env.VITE_BACKEND_URL;
 
   useEffect(() => {
@@ -29,6 +32,7 @@ const PrescriptionPrintView = () => {
         } catch (e) {
           console.error("Parsing failed:", e);
         }
+        savedRef.current = JSON.parse(JSON.stringify(extracted));
         setPrescription(extracted);
         setRawText(data.raw_text);
         setLoading(false);
@@ -101,13 +105,9 @@ const PrescriptionPrintView = () => {
   };
 
   const handleSaveChanges = () => {
-    fetch(`${BASE_URL}/update-prescription/${appointmentId}`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ extracted: prescription, raw_text: rawText }),
-    })
-      .then((res) => res.ok ? res.json() : Promise.reject("Save failed"))
+    savePrescription(appointmentId, savedRef.current, prescription, rawText)
       .then(() => {
+        savedRef.current = JSON.parse(JSON.stringify(prescription));
         setSaveMessage("Changes saved successfully.");
         setTimeout(() => setSaveMessage(""), 3000);
       })
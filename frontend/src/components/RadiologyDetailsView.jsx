@@ -1,6 +1,7 @@
 import React, { useEffect, useState, useRef } from "react";
 import { useParams } from "react-router-dom";
 import Fuse from "fuse.js";
+import { savePrescription } from "../api";
 
 export default function RadiologyDetailView() {
   const { appointmentId } = useParams();
@@ -14,6 +15,8 @@ export default function RadiologyDetailView() {
   const [fuse, setFuse] = useState(null);
   const [suggestions, setSuggestions] = useState({});
   const inputRefs = useRef({});
+  // Last saved prescription (a copy: edits mutate line objects), to send only changed lines.
+  const savedRef = useRef(null);
   const [isPrinting, setIsPrinting] = useState(false);
   const BASE_URL = import.meta.env.VITE_BACKEND_URL;
 
@@ -21,6 +24,7 @@ export default function RadiologyDetailView() {
     fetch(`${BASE_URL}/prescription/${appointmentId}`)
       .then((res) => res.json())
       .then((data) => {
+        savedRef.current = JSON.parse(JSON.stringify(data.extracted));
         setPrescription(data.extracted);
         setRawText(data.raw_text);
         setLoading(false);
@@ -171,13 +175,9 @@ export default function RadiologyDetailView() {
   };
 
   const handleSave = () => {
-    fetch(`${BASE_URL}/update-prescription/${appointmentId}`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ extracted: prescription, raw_text: rawText }),
-    })
-      .then((res) => res.ok ? res.json() : Promise.reject("Save failed"))
+    savePrescription(appointmentId, savedRef.current, prescription, rawText)
       .then(() => {
+        savedRef.current = JSON.parse(JSON.stringify(prescription));
         setSaveMessage("Changes saved successfully.");
         setTimeout(() => setSaveMessage(""), 3000);
       })